@@ -0,0 +1 @@
+"""Offline benchmarks for lesson generation."""
@@ -0,0 +1,135 @@
+"""Benchmark of JSON extraction from long model outputs.
+
+Usage:
+    python -m benchmarks.bench_json_extract --sizes 100 300 1000
+"""
+
+import argparse
+import json
+import re
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from lesson_generator.core.base import JSONExtractor
+
+
+def legacy_extract_json(text: str) -> Optional[str]:
+    """正規表現による以前の抽出方法（比較用）"""
+    json_match = re.search(r"```json\s*(.*?)\s*```", text, re.DOTALL)
+    if json_match:
+        return json_match.group(1).strip()
+    braces_match = re.search(r"\{.*\}", text, re.DOTALL)
+    if braces_match:
+        return braces_match.group(0).strip()
+    return None
+
+
+def make_payload(size_kb: int) -> str:
+    """指定サイズ程度のトピック一括抽出のJSON（文字列中に括弧や引用符を含む）"""
+    topic = {
+        "theme": "テーマ",
+        "title": "「{波括弧}」と[角括弧]を含むタイトル",
+        "key_points": ['引用符 \\" とエスケープ \\\\ を含むポイント'] * 5,
+        "learning_objectives": [
+            {
+                "objective": "説明できる",
+                "success_criteria": ["基準}"],
+                "evaluation_method": "口頭",
+            }
+        ],
+        "outline": ["導入", "詳細", "まとめ"],
+        "estimated_time": "15分",
+    }
+    unit = len(json.dumps(topic, ensure_ascii=False).encode("utf-8"))
+    count = max(1, size_kb * 1024 // unit)
+    return json.dumps({"topics": [topic] * count}, ensure_ascii=False, indent=2)
+
+
+def make_outputs(size_kb: int) -> Dict[str, str]:
+    """抽出の難しさが異なる出力のパターン"""
+    payload = make_payload(size_kb)
+    prose = "説明文の途中に {例} や [注] のような括弧が現れる。\n" * 20
+    return {
+        # ```json で囲まれたJSONのみ
+        "fenced": f"```json\n{payload}\n```",
+        # 前後の説明文に対応の取れた括弧がある
+        "stray-braces": f"{prose}{payload}\n補足 {{追記}} を参照。",
+        # 閉じられない括弧が先に現れる
+        "unclosed": f"注記 {{ 閉じ忘れ\n{prose}{payload}",
+    }
+
+
+def measure(
+    extract: Callable[[str], Optional[str]], text: str, repeat: int
+) -> Dict[str, Any]:
+    """抽出とjson.loadsにかかる時間（最小値）と結果の正否"""
+    best = float("inf")
+    ok = False
+    for _ in range(repeat):
+        started = time.perf_counter()
+        extracted = extract(text)
+        try:
+            ok = isinstance(json.loads(extracted), dict) if extracted else False
+        except ValueError:
+            ok = False
+        best = min(best, time.perf_counter() - started)
+    return {"seconds": best, "ok": ok}
+
+
+def run(sizes: List[int], repeat: int) -> List[Dict[str, Any]]:
+    extractors = {
+        "legacy": legacy_extract_json,
+        "scanner": lambda text: JSONExtractor.extract_json(
+            text, lambda data: isinstance(data, dict)
+        ),
+    }
+    print(f"{'size(KB)':>8} {'pattern':<13} {'extractor':<8} {'ms':>9} {'ok':>4}")
+    results = []
+    for size_kb in sizes:
+        for pattern, text in make_outputs(size_kb).items():
+            for name, extract in extractors.items():
+                result = measure(extract, text, repeat)
+                result.update(
+                    size_kb=len(text.encode("utf-8")) // 1024,
+                    pattern=pattern,
+                    extractor=name,
+                )
+                print(
+                    f"{result['size_kb']:>8} {pattern:<13} {name:<8} "
+                    f"{result['seconds'] * 1000:>9.2f} {'yes' if result['ok'] else 'no':>4}"
+                )
+                results.append(result)
+    return results
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="長い出力からのJSON抽出（抽出とパース）の所要時間を計測"
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[100, 300, 1000],
+        help="JSON部分のおおよそのサイズ（KB）",
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="計測の繰り返し回数")
+    parser.add_argument("--output", help="結果を保存するJSONファイル")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    results = run(args.sizes, args.repeat)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(
+                {"config": vars(args), "results": results},
+                f,
+                ensure_ascii=False,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""End-to-end throughput benchmark against the simulated Gemini backend.
+
+Usage:
+    python -m benchmarks.run_benchmarks --concurrency 1 2 4 --sections 4 12
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Any, Dict, List
+
+from lesson_generator import BatchRunner
+from lesson_generator.batch import BatchItem
+
+from .simulated_backend import SimulatedTransport, SimulationConfig
+
+# 模擬バックエンドでは不要な設定を無効化し、ベンチマーク同士が影響し合わないようにする
+BENCHMARK_ENV = {
+    "GEMINI_API_KEY": "simulated",
+    "RESPONSE_CACHE_DIR": "",
+    "CONTEXT_CACHE": "off",
+    "RETRY_BASE_DELAY": "0.05",
+    "RETRY_MAX_DELAY": "1",
+}
+
+PERSONAS = dict(
+    teacher_persona={"name": "先生", "personality": "丁寧に解説する"},
+    student_persona={"name": "生徒", "personality": "素直に質問する"},
+)
+
+
+def write_inputs(directory: str, lessons: int, sections: int) -> List[str]:
+    """見出しごとのセクションを持つ模擬入力ファイルを作成"""
+    paragraph = "この節では歴史的な背景と主要な出来事を順に説明する。" * 8
+    paths = []
+    for lesson in range(1, lessons + 1):
+        body = [f"# 教材{lesson}", "全体の概要。"]
+        for section in range(1, sections + 1):
+            body.append(f"## 第{section}章 テーマ{section}")
+            body.append(paragraph)
+        path = os.path.join(directory, f"lesson{lesson:03d}.md")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n\n".join(body))
+        paths.append(path)
+    return paths
+
+
+def percentile(values: List[float], q: float) -> float:
+    """線形補間によるパーセンタイル"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+async def run_scenario(
+    config: SimulationConfig,
+    concurrency: int,
+    sections: int,
+    lessons: int,
+    theme_concurrency: int,
+    env_file: str,
+) -> Dict[str, Any]:
+    """一つの組み合わせ（同時レッスン数×入力サイズ）を実行して計測"""
+    os.environ["MAX_CONCURRENT_THEMES"] = str(theme_concurrency)
+    transport = SimulatedTransport(config)
+    runner = BatchRunner(
+        dict(PERSONAS, env_file=env_file, transport=transport),
+        max_concurrent_lessons=concurrency,
+    )
+
+    with tempfile.TemporaryDirectory() as workdir:
+        inputs = write_inputs(workdir, lessons, sections)
+        output_root = os.path.join(workdir, "output")
+        items = [
+            BatchItem(path, os.path.join(output_root, os.path.basename(path)[:-3]))
+            for path in inputs
+        ]
+
+        cpu_started = time.process_time()
+        started = time.perf_counter()
+        summary = await runner.run(items, output_root)
+        elapsed = time.perf_counter() - started
+        cpu = time.process_time() - cpu_started
+
+    durations = [lesson["duration"] for lesson in summary["lessons"]]
+    return {
+        "concurrency": concurrency,
+        "sections": sections,
+        "lessons": lessons,
+        "succeeded": summary["succeeded"],
+        "failed": summary["failed"],
+        "elapsed_seconds": elapsed,
+        "lessons_per_hour": summary["lessons_per_hour"],
+        "p50_lesson_seconds": percentile(durations, 0.5),
+        "p95_lesson_seconds": percentile(durations, 0.95),
+        "mean_lesson_seconds": statistics.mean(durations) if durations else 0.0,
+        "cpu_seconds": cpu,
+        "cpu_utilization": cpu / elapsed if elapsed else 0.0,
+        # シナリオごとに別プロセスで実行しているため、そのシナリオの最大RSSになる
+        # ru_maxrssはLinuxではKB、macOSではバイト単位
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        / (1024 * 1024 if sys.platform == "darwin" else 1024),
+        "usage": summary["usage"],
+    }
+
+
+def run_scenario_process(verbose: bool, *args: Any) -> Dict[str, Any]:
+    """子プロセスの中で一つの組み合わせを実行する"""
+    configure_logging(verbose)
+    return asyncio.run(run_scenario(*args))
+
+
+def format_row(result: Dict[str, Any]) -> str:
+    return (
+        f"{result['concurrency']:>4} {result['sections']:>8} "
+        f"{result['succeeded']:>3}/{result['lessons']:<3} "
+        f"{result['lessons_per_hour']:>12.1f} "
+        f"{result['p50_lesson_seconds']:>8.2f} {result['p95_lesson_seconds']:>8.2f} "
+        f"{result['cpu_seconds']:>7.2f} {result['cpu_utilization']:>6.1%} "
+        f"{result['peak_rss_mb']:>8.1f}"
+    )
+
+
+def run_benchmarks(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    config = SimulationConfig(
+        latency_median=args.latency,
+        latency_sigma=args.latency_sigma,
+        tokens_per_second=args.tokens_per_second,
+        failure_rate=args.failure_rate,
+        dialogue_exchanges=args.exchanges,
+        continuation_rate=args.continuation_rate,
+        time_scale=args.time_scale,
+        seed=args.seed,
+    )
+
+    with tempfile.TemporaryDirectory() as envdir:
+        env_file = os.path.join(envdir, ".env")
+        with open(env_file, "w", encoding="utf-8") as f:
+            f.writelines(f"{key}={value}\n" for key, value in BENCHMARK_ENV.items())
+        os.environ.update(BENCHMARK_ENV)
+
+        print(
+            f"{'conc':>4} {'sections':>8} {'ok':>7} {'lessons/hour':>12} "
+            f"{'p50(s)':>8} {'p95(s)':>8} {'cpu(s)':>7} {'cpu%':>6} {'rss(MB)':>8}"
+        )
+        results = []
+        for sections in args.sections:
+            for concurrency in args.concurrency:
+                # 最大RSSやキャッシュ・ロガーなどの状態が前のシナリオから持ち越されないよう、
+                # 組み合わせごとに新しいプロセスで実行する
+                with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as pool:
+                    result = pool.submit(
+                        run_scenario_process,
+                        args.verbose,
+                        config,
+                        concurrency,
+                        sections,
+                        args.lessons,
+                        args.theme_concurrency,
+                        env_file,
+                    ).result()
+                print(format_row(result))
+                results.append(result)
+    return results
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="模擬Geminiバックエンドを使ったレッスン生成のベンチマーク"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, nargs="+", default=[1, 2, 4], help="同時レッスン数"
+    )
+    parser.add_argument(
+        "--sections", type=int, nargs="+", default=[4, 12], help="入力の章の数"
+    )
+    parser.add_argument(
+        "--lessons", type=int, default=8, help="組み合わせごとのレッスン数"
+    )
+    parser.add_argument(
+        "--theme-concurrency", type=int, default=3, help="MAX_CONCURRENT_THEMES"
+    )
+    parser.add_argument(
+        "--latency", type=float, default=2.0, help="最初のトークンまでの秒数の中央値"
+    )
+    parser.add_argument(
+        "--latency-sigma", type=float, default=0.5, help="レイテンシのばらつき"
+    )
+    parser.add_argument(
+        "--tokens-per-second", type=float, default=150.0, help="出力トークンの生成速度"
+    )
+    parser.add_argument(
+        "--failure-rate", type=float, default=0.0, help="一時的なエラーの発生率"
+    )
+    parser.add_argument(
+        "--exchanges", type=int, default=20, help="対話チャンクあたりの往復数"
+    )
+    parser.add_argument(
+        "--continuation-rate", type=float, default=0.0, help="<CONTINUE>で終わる確率"
+    )
+    parser.add_argument(
+        "--time-scale",
+        type=float,
+        default=0.01,
+        help="模擬的な待ち時間に掛ける係数（1で実時間）",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="乱数のシード")
+    parser.add_argument("--output", help="結果を保存するJSONファイル")
+    parser.add_argument(
+        "--verbose", action="store_true", help="ジェネレーターのログを表示"
+    )
+    return parser.parse_args()
+
+
+def configure_logging(verbose: bool) -> None:
+    if not verbose:
+        # ジェネレーターのログ出力（とログファイルの作成）を抑制
+        generator_logger = logging.getLogger("lesson_generator.generator")
+        generator_logger.addHandler(logging.NullHandler())
+        generator_logger.setLevel(logging.WARNING)
+        logging.getLogger("lesson_generator").setLevel(logging.WARNING)
+
+
+def main() -> None:
+    args = parse_args()
+    configure_logging(args.verbose)
+    results = run_benchmarks(args)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(
+                {"config": vars(args), "results": results},
+                f,
+                ensure_ascii=False,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
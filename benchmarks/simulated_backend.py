@@ -0,0 +1,230 @@
+"""Simulated Gemini backend for offline benchmarks."""
+
+import asyncio
+import json
+import random
+import re
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from google.api_core import exceptions as api_exceptions
+
+from lesson_generator.runtime import (
+    STAGE_ANALYSIS,
+    STAGE_TOPIC,
+    STAGE_TOPIC_BATCH,
+    CachedContext,
+    Endpoint,
+    GeminiTransport,
+    GenerationProfile,
+    estimate_tokens,
+)
+
+_HEADING_PATTERN = re.compile(r"^#{2,3}\s+(.+?)\s*$", re.MULTILINE)
+_THEME_PATTERN = re.compile(r"主要テーマ: (.+)")
+_TEACHER_PATTERN = re.compile(r"教師（(.+?)）")
+_STUDENT_PATTERN = re.compile(r"生徒（(.+?)）")
+_BATCH_THEMES_PATTERN = re.compile(r"# 対象のテーマ\n((?:- .+\n?)+)")
+
+
+@dataclass(frozen=True)
+class SimulationConfig:
+    """模擬バックエンドの応答特性"""
+
+    latency_median: float = 2.0  # 最初のトークンまでの秒数（対数正規分布の中央値）
+    latency_sigma: float = 0.5  # 対数正規分布のばらつき
+    tokens_per_second: float = 150.0  # 出力トークンの生成速度
+    failure_rate: float = 0.0  # 呼び出しが一時的なエラーで失敗する確率
+    rate_limit_share: float = 0.5  # 失敗のうち429（ResourceExhausted）の割合
+    max_themes: int = 8  # コンテンツ分析で返すテーマ数の上限
+    dialogue_exchanges: int = 20  # 1チャンクあたりの対話の往復数
+    continuation_rate: float = 0.0  # 対話が<CONTINUE>で終わる確率
+    time_scale: float = 1.0  # 待ち時間に掛ける係数（1未満で実時間より速く進める）
+    seed: Optional[int] = None
+
+
+class _Response:
+    """generate_content_asyncの応答（またはストリーミングの断片）"""
+
+    def __init__(self, text: str, prompt_tokens: int, output_tokens: int):
+        self.text = text
+        self.usage_metadata = _UsageMetadata(prompt_tokens, output_tokens)
+
+
+class _UsageMetadata:
+    def __init__(self, prompt_tokens: int, output_tokens: int):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = output_tokens
+
+
+class _StreamResponse:
+    """断片をトークン生成速度に合わせて返すストリーミング応答"""
+
+    def __init__(self, pieces: List[_Response], delay_per_piece: float):
+        self._pieces = pieces
+        self._delay = delay_per_piece
+
+    async def __aiter__(self) -> AsyncIterator[_Response]:
+        for piece in self._pieces:
+            await asyncio.sleep(self._delay)
+            yield piece
+
+
+class SimulatedModel:
+    """ステージごとのプロンプトの形式に合わせた応答を返す模擬モデル"""
+
+    def __init__(self, stage: str, config: SimulationConfig, rng: random.Random):
+        self.stage = stage
+        self.config = config
+        self.rng = rng
+
+    async def generate_content_async(
+        self,
+        prompt: Any,
+        request_options: Optional[Dict[str, Any]] = None,
+        stream: bool = False,
+        **kwargs: Any,
+    ) -> Any:
+        prompt = prompt if isinstance(prompt, str) else str(prompt)
+        scale = self.config.time_scale
+
+        # 最初のトークンまでの待ち時間
+        latency = self.rng.lognormvariate(0, self.config.latency_sigma)
+        await asyncio.sleep(self.config.latency_median * latency * scale)
+
+        if self.rng.random() < self.config.failure_rate:
+            if self.rng.random() < self.config.rate_limit_share:
+                raise api_exceptions.ResourceExhausted(
+                    "Simulated quota exceeded. Please retry in 1s."
+                )
+            raise api_exceptions.ServiceUnavailable("Simulated backend overloaded")
+
+        text = self.respond(prompt)
+        prompt_tokens = estimate_tokens(prompt)
+        output_tokens = estimate_tokens(text)
+        generation_time = output_tokens / self.config.tokens_per_second * scale
+
+        if not stream:
+            await asyncio.sleep(generation_time)
+            return _Response(text, prompt_tokens, output_tokens)
+
+        # 約20トークンずつの断片に分けて返す（最後の断片に全体の使用量が入る）
+        size = 80 if text.isascii() else 20
+        parts = [text[i : i + size] for i in range(0, len(text), size)] or [""]
+        pieces = [
+            _Response(part, prompt_tokens, output_tokens if i == len(parts) - 1 else 0)
+            for i, part in enumerate(parts)
+        ]
+        return _StreamResponse(pieces, generation_time / len(pieces))
+
+    def respond(self, prompt: str) -> str:
+        """プロンプトの種類に応じた応答テキストを作成"""
+        if self.stage == STAGE_ANALYSIS:
+            return self._analysis(prompt)
+        if self.stage == STAGE_TOPIC:
+            return self._topic(prompt)
+        if self.stage == STAGE_TOPIC_BATCH:
+            return self._topic_batch(prompt)
+        return self._dialogue(prompt)
+
+    def _analysis(self, prompt: str) -> str:
+        headings = _HEADING_PATTERN.findall(prompt) or ["全体の概要"]
+        themes = [
+            {
+                "title": heading,
+                "summary": f"{heading}の要点をまとめたテーマです。",
+                "related_topics": [h for h in headings if h != heading][:2],
+            }
+            for heading in headings[: self.config.max_themes]
+        ]
+        timeline = [{"period": f"第{i}期", "events": ["出来事"]} for i in range(1, 4)]
+        return json.dumps(
+            {"main_themes": themes, "timeline": timeline}, ensure_ascii=False
+        )
+
+    def _topic(self, prompt: str) -> str:
+        match = _THEME_PATTERN.search(prompt)
+        title = match.group(1).strip() if match else "トピック"
+        return json.dumps(self._topic_data(title), ensure_ascii=False)
+
+    def _topic_batch(self, prompt: str) -> str:
+        match = _BATCH_THEMES_PATTERN.search(prompt)
+        titles = (
+            [line[2:].strip() for line in match.group(1).splitlines()] if match else []
+        )
+        topics = [dict(theme=title, **self._topic_data(title)) for title in titles]
+        return json.dumps({"topics": topics}, ensure_ascii=False)
+
+    def _topic_data(self, title: str) -> Dict[str, Any]:
+        return {
+            "title": title,
+            "key_points": [f"{title}のポイント{i}" for i in range(1, 6)],
+            "learning_objectives": [
+                {
+                    "objective": f"{title}を説明できる",
+                    "success_criteria": ["要点を3つ挙げられる", "具体例を示せる"],
+                    "evaluation_method": "口頭での説明",
+                }
+            ],
+            "outline": [f"{title}の導入", f"{title}の詳細", "まとめ"],
+            "estimated_time": "15分",
+        }
+
+    def _dialogue(self, prompt: str) -> str:
+        teacher = _TEACHER_PATTERN.search(prompt)
+        student = _STUDENT_PATTERN.search(prompt)
+        teacher_name = teacher.group(1) if teacher else "先生"
+        student_name = student.group(1) if student else "生徒"
+
+        lines = []
+        for i in range(1, self.config.dialogue_exchanges + 1):
+            lines.append(
+                f"{teacher_name}: {i}つ目の説明です。資料の内容に沿って順を追って解説していきます。"
+            )
+            lines.append(
+                f"{student_name}: なるほど、{i}つ目の点はそういうことなんですね。"
+            )
+
+        ending = (
+            "<CONTINUE>"
+            if self.rng.random() < self.config.continuation_rate
+            else "<END>"
+        )
+        return "\n".join(
+            [
+                "<thinking>",
+                "資料の構成に沿って、基本から応用へと段階的に説明する。",
+                "</thinking>",
+                "<content>",
+                "今回の対話で扱う内容と重要なポイントの整理。",
+                "</content>",
+                "<dialogue>",
+                *lines,
+                "</dialogue>",
+                "<key_points>",
+                "- ポイント1",
+                "- ポイント2",
+                "</key_points>",
+                ending,
+            ]
+        )
+
+
+class SimulatedTransport(GeminiTransport):
+    """APIの代わりにSimulatedModelを呼び出すトランスポート
+
+    レートリミッターや同時リクエスト数の上限などはGeminiTransportと同じように働く。
+    """
+
+    def __init__(self, config: SimulationConfig, **kwargs: Any):
+        super().__init__("simulated-gemini", **kwargs)
+        self.config = config
+        self.rng = random.Random(config.seed)
+
+    def get_model(
+        self,
+        profile: GenerationProfile,
+        context: Optional[CachedContext] = None,
+        endpoint: Optional[Endpoint] = None,
+    ) -> Any:
+        return SimulatedModel(profile.stage, self.config, self.rng)
@@ -1,6 +1,7 @@
 """LLM を使用して対話形式の授業コンテンツを生成するパッケージ"""
 
+from .batch import BatchItem, BatchRunner
 from .generator import LessonGenerator
 
 __version__ = "0.1.0"
-__all__ = ["LessonGenerator"]
+__all__ = ["BatchItem", "BatchRunner", "LessonGenerator"]
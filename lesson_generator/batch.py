@@ -0,0 +1,191 @@
+"""Batch lesson generation for many input files."""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from .generator import LessonGenerator
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BatchItem:
+    """一括生成する入力ファイルと出力先"""
+
+    input_file: str
+    output_dir: str
+
+
+@dataclass
+class BatchResult:
+    """1レッスン分の生成結果"""
+
+    input_file: str
+    output_dir: str
+    success: bool
+    duration: float
+    error: Optional[str] = None
+    usage: Dict[str, int] = field(default_factory=dict)
+
+
+class BatchRunner:
+    """複数の入力ファイルからレッスンを一括生成するランナー
+
+    全レッスンで一つのトランスポート（モデル・レートリミッター・同時リクエスト数の上限）と
+    応答キャッシュを共有し、同時に生成するレッスン数を制限する。
+    """
+
+    SUMMARY_FILENAME = "batch_summary.json"
+
+    def __init__(
+        self,
+        generator_options: Dict[str, Any],
+        max_concurrent_lessons: int = 2,
+    ):
+        self.generator_options = generator_options
+        self.max_concurrent_lessons = max(1, max_concurrent_lessons)
+        self._shared: Optional[LessonGenerator] = None
+
+    @staticmethod
+    def collect_inputs(source: str, output_root: str) -> List[BatchItem]:
+        """
+        入力ディレクトリまたはマニフェストから生成対象を列挙
+
+        ディレクトリの場合は直下の*.mdを、JSONの場合は入力パスの配列か
+        {"input": ..., "output": ...}の配列を、それ以外のファイルは1行1パスとして読む。
+
+        Args:
+            source (str): 入力ディレクトリまたはマニフェストファイルのパス
+            output_root (str): 出力先を指定しない場合のルートディレクトリ
+
+        Returns:
+            List[BatchItem]: 生成対象
+        """
+        path = Path(source)
+        if path.is_dir():
+            entries: List[Any] = [str(p) for p in sorted(path.glob("*.md"))]
+            base = path
+        elif path.suffix == ".json":
+            entries = json.loads(path.read_text(encoding="utf-8"))
+            base = path.parent
+        else:
+            lines = path.read_text(encoding="utf-8").splitlines()
+            entries = [
+                line.strip()
+                for line in lines
+                if line.strip() and not line.startswith("#")
+            ]
+            base = path.parent
+
+        items = []
+        for entry in entries:
+            if isinstance(entry, dict):
+                input_file = entry["input"]
+                output_dir = entry.get("output")
+            else:
+                input_file, output_dir = entry, None
+
+            input_path = Path(input_file)
+            if not input_path.is_absolute() and not input_path.exists():
+                input_path = base / input_path
+            if output_dir is None:
+                output_dir = os.path.join(output_root, input_path.stem)
+            items.append(BatchItem(str(input_path), output_dir))
+        return items
+
+    def _create_generator(self) -> LessonGenerator:
+        """レッスンごとのジェネレーターを生成（API関連のリソースは共有）"""
+        if self._shared is None:
+            self._shared = LessonGenerator(**self.generator_options)
+            return self._shared
+
+        options = dict(
+            self.generator_options,
+            transport=self._shared.transport,
+            response_cache=self._shared.response_cache,
+        )
+        return LessonGenerator(**options)
+
+    async def run(
+        self,
+        items: List[BatchItem],
+        output_root: str,
+        resume: bool = False,
+        incremental: bool = False,
+    ) -> Dict[str, Any]:
+        """全ての入力を処理し、集計結果を返してoutput_rootに保存"""
+        semaphore = asyncio.Semaphore(self.max_concurrent_lessons)
+        started = time.monotonic()
+
+        async def run_one(item: BatchItem) -> BatchResult:
+            async with semaphore:
+                generator: Optional[LessonGenerator] = None
+                item_started = time.monotonic()
+                try:
+                    # 設定の誤りなどによる初期化の失敗も、このレッスンの失敗として記録する
+                    generator = self._create_generator()
+                    await generator.generate_lesson(
+                        item.input_file,
+                        item.output_dir,
+                        resume=resume,
+                        incremental=incremental,
+                    )
+                    error = None
+                except Exception as e:
+                    logger.error(
+                        f"Failed to generate lesson for {item.input_file}: {e}"
+                    )
+                    error = f"{type(e).__name__}: {e}"
+
+                return BatchResult(
+                    input_file=item.input_file,
+                    output_dir=item.output_dir,
+                    success=error is None,
+                    duration=time.monotonic() - item_started,
+                    error=error,
+                    usage=generator.usage.totals() if generator else {},
+                )
+
+        results = await asyncio.gather(*(run_one(item) for item in items))
+        summary = self._summarize(results, time.monotonic() - started)
+
+        os.makedirs(output_root, exist_ok=True)
+        summary_path = os.path.join(output_root, self.SUMMARY_FILENAME)
+        with open(summary_path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+        logger.info(
+            f"Batch completed: {summary['succeeded']}/{summary['total']} lessons "
+            f"in {summary['elapsed_seconds']:.1f}s "
+            f"({summary['lessons_per_hour']:.1f} lessons/hour)"
+        )
+        return summary
+
+    def _summarize(self, results: List[BatchResult], elapsed: float) -> Dict[str, Any]:
+        """スループット・失敗・トークン使用量を集計"""
+        succeeded = [r for r in results if r.success]
+        usage: Dict[str, int] = {}
+        for result in results:
+            for key, value in result.usage.items():
+                usage[key] = usage.get(key, 0) + value
+
+        return {
+            "total": len(results),
+            "succeeded": len(succeeded),
+            "failed": len(results) - len(succeeded),
+            "elapsed_seconds": elapsed,
+            "lessons_per_hour": len(succeeded) / elapsed * 3600 if elapsed else 0.0,
+            "usage": usage,
+            "failures": [
+                {"input_file": r.input_file, "error": r.error}
+                for r in results
+                if not r.success
+            ],
+            "lessons": [asdict(r) for r in results],
+        }
@@ -10,12 +10,25 @@ from .models import (
     Topic,
     ValidationResult,
 )
+from .sections import (
+    Section,
+    SectionIndex,
+    match_sections,
+    split_markdown_sections,
+)
 from .schemas import (
     CONTENT_ANALYSIS_SCHEMA,
     DIALOGUE_SCHEMA,
+    TOPIC_BATCH_SCHEMA,
     TOPIC_SCHEMA,
     VALIDATION_SCHEMA,
 )
+from .tokenizer import (
+    OutputToken,
+    TokenizedOutput,
+    split_list_items,
+    tokenize_output,
+)
 
 __all__ = [
     "PromptParser",
@@ -27,8 +40,17 @@ __all__ = [
     "TimelineEvent",
     "Topic",
     "ValidationResult",
+    "Section",
+    "SectionIndex",
+    "match_sections",
+    "split_markdown_sections",
     "CONTENT_ANALYSIS_SCHEMA",
     "DIALOGUE_SCHEMA",
     "TOPIC_SCHEMA",
+    "TOPIC_BATCH_SCHEMA",
     "VALIDATION_SCHEMA",
+    "OutputToken",
+    "TokenizedOutput",
+    "split_list_items",
+    "tokenize_output",
 ]
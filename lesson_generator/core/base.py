@@ -1,10 +1,11 @@
 """Base classes and utilities for the lesson generator."""
 
+import json
 import logging
 import re
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
 from google.ai.generativelanguage_v1beta.types import content
 from pydantic import BaseModel, ValidationError
@@ -12,22 +13,108 @@ from pydantic import BaseModel, ValidationError
 logger = logging.getLogger(__name__)
 
 
+# JSONの走査で意味を持つ文字（それ以外の文字は読み飛ばす）
+_JSON_SCAN_PATTERN = re.compile(r'["{}\[\]]')
+# 引用符から文字列の終わりまで（JSONの文字列は改行を含まないため、改行でも終える）
+_JSON_STRING_PATTERN = re.compile(r'"(?:[^"\\\n]|\\.)*["\n]?')
+_MATCHING_CLOSER = {"{": "}", "[": "]"}
+# ```jsonで囲まれた部分（よくある出力の形なので、走査する前にそのままパースを試みる）
+_JSON_FENCE_PATTERN = re.compile(r"```json\s*(.*?)\s*```", re.DOTALL)
+
+
 class JSONExtractor:
     """JSON抽出のためのユーティリティクラス"""
 
     @staticmethod
-    def extract_json(text: str) -> Optional[str]:
-        """テキストからJSON部分を抽出"""
-        # バックティックで囲まれたJSONを探す
-        json_match = re.search(r"```json\s*(.*?)\s*```", text, re.DOTALL)
-        if json_match:
-            return json_match.group(1).strip()
-
-        # 単純な波括弧で囲まれた部分を探す
-        braces_match = re.search(r"\{.*\}", text, re.DOTALL)
-        if braces_match:
-            return braces_match.group(0).strip()
-
+    def find_json_spans(text: str) -> List[Tuple[int, int]]:
+        """
+        テキスト中の括弧の対応が取れた最上位のJSONオブジェクト/配列の範囲を探す
+
+        文字列中の括弧とエスケープを考慮して一度だけ走査する（JSONの外側の引用符は無視）。
+        改行を含む文字列は対応の無い引用符とみなして、改行の位置で文字列を終える。
+        対応しない閉じ括弧は無視し、閉じられなかった括弧の内側で閉じた部分は候補に含める。
+
+        Args:
+            text (str): 走査するテキスト
+
+        Returns:
+            List[Tuple[int, int]]: 出現順の(開始位置, 終了位置)のリスト
+        """
+        spans: List[Tuple[int, int]] = []
+        stack: List[Tuple[str, int]] = []
+        position = 0
+        while True:
+            match = _JSON_SCAN_PATTERN.search(text, position)
+            if match is None:
+                break
+            i = match.start()
+            char = text[i]
+            position = i + 1
+            if char in _MATCHING_CLOSER:
+                stack.append((char, i))
+            elif char == '"':
+                if stack:
+                    # 文字列の中身は正規表現でまとめて読み飛ばす
+                    position = _JSON_STRING_PATTERN.match(text, i).end()
+            elif stack and _MATCHING_CLOSER[stack[-1][0]] == char:
+                spans.append((stack.pop()[1], i + 1))
+
+        # 入れ子の範囲を除き、最も外側のものだけを残す
+        outermost: List[Tuple[int, int]] = []
+        for start, end in sorted(spans):
+            if not outermost or start >= outermost[-1][1]:
+                outermost.append((start, end))
+        return outermost
+
+    @classmethod
+    def extract_all_json(cls, text: str) -> List[str]:
+        """テキスト中のJSONの候補を出現順にすべて抽出"""
+        return [text[start:end] for start, end in cls.find_json_spans(text)]
+
+    @classmethod
+    def extract_json(
+        cls,
+        text: str,
+        validate: Optional[Callable[[Any], bool]] = None,
+        fallback: bool = True,
+    ) -> Optional[str]:
+        """
+        テキストからJSON部分を抽出
+
+        候補のうち、JSONとしてパースでき（validateを指定した場合はその条件も満たす）最初のものを返す。
+        ```jsonで囲まれた部分がその条件を満たす場合は、テキスト全体を走査せずにそれを返す。
+
+        Args:
+            text (str): 抽出対象のテキスト
+            validate (Optional[Callable[[Any], bool]]): パース結果を受け入れるかの判定
+            fallback (bool): 条件を満たす候補が無い場合に最初の候補を返すか
+                （呼び出し側でクリーニングしてパースし直す場合に使う）
+
+        Returns:
+            Optional[str]: 抽出したJSONテキスト（候補が無い場合はNone）
+        """
+        fenced = _JSON_FENCE_PATTERN.search(text)
+        if fenced:
+            candidate = fenced.group(1)
+            try:
+                data = json.loads(candidate)
+            except ValueError:
+                pass
+            else:
+                if validate is None or validate(data):
+                    return candidate
+
+        candidates = cls.extract_all_json(text)
+        for candidate in candidates:
+            try:
+                data = json.loads(candidate)
+            except ValueError:
+                continue
+            if validate is None or validate(data):
+                return candidate
+
+        if fallback and candidates:
+            return candidates[0]
         return None
 
     @staticmethod
@@ -165,9 +252,14 @@ class PromptParser(ABC):
         """出力をパースして構造化されたデータに変換"""
         pass
 
-    def _extract_json(self, text: str) -> Optional[str]:
+    def _extract_json(
+        self,
+        text: str,
+        validate: Optional[Callable[[Any], bool]] = None,
+        fallback: bool = True,
+    ) -> Optional[str]:
         """テキストからJSON部分を抽出"""
-        return self.json_extractor.extract_json(text)
+        return self.json_extractor.extract_json(text, validate, fallback)
 
     def _clean_json_string(self, json_str: str) -> str:
         """JSONテキストのクリーニング"""
@@ -65,6 +65,27 @@ TOPIC_SCHEMA = content.Schema(
         ),
         "estimated_time": content.Schema(type=content.Type.STRING),
     },
+    required=["title", "key_points", "learning_objectives", "estimated_time"],
+)
+
+# 複数テーマのトピック一括抽出スキーマ（TOPIC_SCHEMAに対応するテーマ名を加えたもの）
+TOPIC_BATCH_SCHEMA = content.Schema(
+    type=content.Type.OBJECT,
+    properties={
+        "topics": content.Schema(
+            type=content.Type.ARRAY,
+            items=content.Schema(
+                type=content.Type.OBJECT,
+                properties={
+                    "theme": content.Schema(type=content.Type.STRING),
+                    **TOPIC_SCHEMA.properties,
+                },
+                # 欠けた項目はテーマごとの抽出し直しになるため、TOPIC_SCHEMAと同じく必須にする
+                required=["theme", *TOPIC_SCHEMA.required],
+            ),
+        ),
+    },
+    required=["topics"],
 )
 
 # 対話生成スキーマ
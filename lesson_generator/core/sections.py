@@ -0,0 +1,221 @@
+"""Markdown section splitting for source documents."""
+
+import hashlib
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import Callable, List, Set
+
+_HEADING_PATTERN = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+_FENCE_PATTERN = re.compile(r"^\s*(```|~~~)")
+
+
+@dataclass(frozen=True)
+class Section:
+    """見出し単位で分割した文書のセクション"""
+
+    heading: str  # 「親見出し > 子見出し」形式の見出しパス（見出し前の部分は空文字）
+    text: str
+
+    @property
+    def hash(self) -> str:
+        return hashlib.sha256(self.text.encode("utf-8")).hexdigest()
+
+
+def split_markdown_sections(text: str) -> List[Section]:
+    """
+    Markdown文書を見出しごとのセクションに分割
+
+    コードブロック内の「#」は見出しとして扱わない。同じ見出しパスが複数ある場合は
+    「 (2)」のように連番を付けて区別する。
+
+    Args:
+        text (str): Markdown文書
+
+    Returns:
+        List[Section]: 出現順のセクション（空のセクションは除く）
+    """
+    sections: List[Section] = []
+    seen: Set[str] = set()
+    stack: List[str] = []
+    heading = ""
+    lines: List[str] = []
+    in_fence = False
+
+    def flush() -> None:
+        body = "\n".join(lines).strip()
+        if not body:
+            return
+        name = heading
+        count = 2
+        while name in seen:
+            name = f"{heading} ({count})"
+            count += 1
+        seen.add(name)
+        sections.append(Section(heading=name, text=body))
+
+    for line in text.split("\n"):
+        if _FENCE_PATTERN.match(line):
+            in_fence = not in_fence
+
+        match = None if in_fence else _HEADING_PATTERN.match(line)
+        if match:
+            flush()
+            level = len(match.group(1))
+            stack = stack[: level - 1] + [""] * max(0, level - 1 - len(stack))
+            stack.append(match.group(2))
+            heading = " > ".join(part for part in stack if part)
+            lines = [line]
+        else:
+            lines.append(line)
+
+    flush()
+    return sections
+
+
+def _char_ngram_counts(text: str, n: int = 2) -> Counter:
+    compact = re.sub(r"\s+", "", text.lower())
+    if len(compact) < n:
+        return Counter([compact] if compact else [])
+    return Counter(compact[i : i + n] for i in range(len(compact) - n + 1))
+
+
+class SectionIndex:
+    """
+    セクションを文書単位とした文字バイグラムのBM25索引
+
+    形態素解析なしで日本語を扱えるよう、空白を除いた文字バイグラムを語として数える。
+    """
+
+    def __init__(
+        self,
+        sections: List[Section],
+        count_tokens: Callable[[str], int] = len,
+        k1: float = 1.2,
+        b: float = 0.75,
+    ):
+        """
+        Args:
+            sections (List[Section]): 索引対象のセクション
+            count_tokens (Callable[[str], int]): 予算計算に使うトークン数の見積もり関数
+            k1 (float): 語頻度の飽和パラメータ
+            b (float): 文書長の正規化パラメータ
+        """
+        self.sections = list(sections)
+        self.count_tokens = count_tokens
+        self.k1 = k1
+        self.b = b
+
+        self._counts = [_char_ngram_counts(section.text) for section in self.sections]
+        self._lengths = [sum(counts.values()) for counts in self._counts]
+        self._avg_length = (
+            sum(self._lengths) / len(self._lengths) if self._lengths else 0.0
+        )
+
+        document_frequency: Counter = Counter()
+        for counts in self._counts:
+            document_frequency.update(counts.keys())
+        total = len(self.sections)
+        self._idf = {
+            term: math.log(1 + (total - df + 0.5) / (df + 0.5))
+            for term, df in document_frequency.items()
+        }
+
+    def score(self, query: str) -> List[float]:
+        """クエリに対する各セクションのBM25スコア"""
+        terms = _char_ngram_counts(query)
+        scores = []
+        for counts, length in zip(self._counts, self._lengths):
+            norm = self.k1 * (1 - self.b + self.b * length / (self._avg_length or 1))
+            score = 0.0
+            for term, query_count in terms.items():
+                tf = counts.get(term, 0)
+                if tf:
+                    score += (
+                        self._idf[term] * tf * (self.k1 + 1) / (tf + norm) * query_count
+                    )
+            scores.append(score)
+        return scores
+
+    def search(self, query: str, max_tokens: int) -> List[Section]:
+        """
+        スコアの高い順にトークン予算に収まるだけセクションを選ぶ
+
+        最もスコアの高いセクションは予算を超えていても必ず含める。
+        一つもスコアが付かない場合は全セクションを返す。
+
+        Args:
+            query (str): テーマのタイトルや関連トピックなど
+            max_tokens (int): 選ぶセクションの合計トークン数の上限
+
+        Returns:
+            List[Section]: 選ばれたセクション（出現順）
+        """
+        scores = self.score(query)
+        ranked = sorted(
+            (i for i, score in enumerate(scores) if score > 0),
+            key=lambda i: scores[i],
+            reverse=True,
+        )
+        if not ranked:
+            return list(self.sections)
+
+        selected = [ranked[0]]
+        used = self.count_tokens(self.sections[ranked[0]].text)
+        for i in ranked[1:]:
+            tokens = self.count_tokens(self.sections[i].text)
+            if used + tokens <= max_tokens:
+                selected.append(i)
+                used += tokens
+
+        return [self.sections[i] for i in sorted(selected)]
+
+    def match(
+        self, query: str, max_sections: int = 3, ratio: float = 0.6
+    ) -> List[Section]:
+        """
+        クエリとの関連が特に高いセクションだけを選ぶ
+
+        最高スコアに対してratio以上のセクションを、スコアの高い順に最大max_sections件選ぶ。
+        一つもスコアが付かない場合は全セクションを返す。
+
+        Args:
+            query (str): テーマのタイトルや関連トピックなど
+            max_sections (int): 選ぶセクションの最大数
+            ratio (float): 最大スコアに対する採用しきい値
+
+        Returns:
+            List[Section]: 選ばれたセクション（出現順）
+        """
+        scores = self.score(query)
+        best = max(scores, default=0.0)
+        if best <= 0:
+            return list(self.sections)
+
+        ranked = sorted(
+            (i for i, score in enumerate(scores) if score >= best * ratio),
+            key=lambda i: scores[i],
+            reverse=True,
+        )
+        return [self.sections[i] for i in sorted(ranked[:max_sections])]
+
+
+def match_sections(
+    sections: List[Section], query: str, max_sections: int = 3, ratio: float = 0.6
+) -> List[Section]:
+    """
+    クエリとBM25スコアの高いセクションを選ぶ
+
+    同じセクションに何度も照合する場合は、SectionIndexを一度作ってmatchを使う。
+
+    Args:
+        sections (List[Section]): 対象セクション
+        query (str): テーマのタイトルや関連トピックなど
+        max_sections (int): 選ぶセクションの最大数
+        ratio (float): 最大スコアに対する採用しきい値
+
+    Returns:
+        List[Section]: 関連するセクション（出現順）
+    """
+    return SectionIndex(sections).match(query, max_sections, ratio)
@@ -0,0 +1,173 @@
+"""Single-pass tokenizer for tagged or markdown model outputs."""
+
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+TOKEN_HEADING = "heading"
+TOKEN_ITEM = "item"
+TOKEN_TEXT = "text"
+TOKEN_TAG = "tag"
+TOKEN_MARKER = "marker"
+
+_LIST_MARKERS = ("-", "*", "•", "·")
+_MARKERS = {"CONTINUE", "END"}
+
+# 行頭の見出し・リスト記号と、行中の<tag>/</tag>（<CONTINUE>/<END>のマーカーを含む）
+# 行頭は「^」（MULTILINE）ではなく改行文字で表す（全ての位置で行頭の判定をせずに済む）
+_TOKEN_PATTERN = re.compile(
+    r"\n[^\S\n]*(?:(?P<heading>#)|(?P<item>[-*•·]))" r"|<(?P<closing>/?)(?P<tag>\w+)>"
+)
+# 見出しでもリスト項目でもない空でない行（幅0のため行頭のタグも続けて検出される）
+_TOKEN_PATTERN_WITH_TEXT = re.compile(
+    r"\n(?:[^\S\n]*(?:(?P<heading>#)|(?P<item>[-*•·]))"
+    r"|(?P<text>(?=[^\S\n]*[^\s#*•·-])))"
+    r"|<(?P<closing>/?)(?P<tag>\w+)>"
+)
+
+
+class OutputToken(NamedTuple):
+    """モデル出力を一度走査して得られるトークン"""
+
+    kind: str  # TOKEN_HEADING / TOKEN_ITEM / TOKEN_TEXT / TOKEN_TAG / TOKEN_MARKER
+    value: str  # 見出し名（小文字）、リスト項目、行、タグの内容、マーカー名（大文字）
+    start: int  # 行単位のトークンは行頭、タグは内容の先頭の位置
+    end: int  # 行単位のトークンは行末、タグは内容の末尾の位置
+    name: Optional[str] = None  # タグ名
+
+
+def split_list_items(text: str, include_text: bool = False) -> List[str]:
+    """
+    テキストからリスト項目（「-」「*」「•」「·」で始まる行）を抽出
+
+    Args:
+        text (str): 対象のテキスト
+        include_text (bool): リスト記号の無い行（見出しを除く）も項目に含めるか
+
+    Returns:
+        List[str]: 記号を除いた項目
+    """
+    items = []
+    for line in text.split("\n"):
+        line = line.strip()
+        if line.startswith(_LIST_MARKERS):
+            item = line[1:].strip()
+            if item:
+                items.append(item)
+        elif include_text and line and not line.startswith("#"):
+            items.append(line)
+    return items
+
+
+def tokenize_output(text: str, include_text: bool = False) -> Iterator[OutputToken]:
+    """
+    モデルの出力を先頭から一度だけ走査してトークンを返す
+
+    見出し・リスト項目の行と、閉じた時点のタグの内容（複数行にまたがってもよい）、
+    マーカーを出現順に返す。同じ名前のタグは、最初に開いた位置から最初の閉じタグまでを
+    内容とする。その他の行は正規表現の中で読み飛ばし、include_textを指定した場合のみ返す。
+
+    Args:
+        text (str): モデルの出力
+        include_text (bool): 見出しでもリスト項目でもない空でない行も返すか
+
+    Yields:
+        OutputToken: 出現順のトークン
+    """
+    pattern = _TOKEN_PATTERN_WITH_TEXT if include_text else _TOKEN_PATTERN
+    # 先頭の行も改行の直後として扱えるよう改行を補う（位置は元のテキストに合わせて1引く）
+    scanned = "\n" + text
+    open_tags: Dict[str, int] = {}
+    for match in pattern.finditer(scanned):
+        kind = match.lastgroup
+        if kind == "tag":
+            name = match.group("tag")
+            if match.group("closing"):
+                if name in open_tags:
+                    start = open_tags.pop(name)
+                    end = match.start() - 1
+                    yield OutputToken(TOKEN_TAG, text[start:end], start, end, name)
+                continue
+            if name.upper() in _MARKERS:
+                yield OutputToken(
+                    TOKEN_MARKER, name.upper(), match.start() - 1, match.end() - 1
+                )
+            open_tags.setdefault(name, match.end() - 1)
+            continue
+
+        start = match.start()
+        end = text.find("\n", start)
+        if end < 0:
+            end = len(text)
+        line = text[start:end]
+        if kind == "heading":
+            yield OutputToken(
+                TOKEN_HEADING, line.lstrip("#").strip().lower(), start, end
+            )
+        elif kind == "item":
+            yield OutputToken(TOKEN_ITEM, line.strip()[1:].strip(), start, end)
+        else:
+            yield OutputToken(TOKEN_TEXT, line.strip(), start, end)
+
+
+@dataclass
+class TokenizedOutput:
+    """トークン列から組み立てた、タグ・セクション・マーカーの一覧"""
+
+    tags: Dict[str, List[str]] = field(default_factory=dict)
+    sections: Dict[str, str] = field(default_factory=dict)
+    section_items: Dict[str, List[str]] = field(default_factory=dict)
+    lines: List[str] = field(default_factory=list)
+    markers: List[str] = field(default_factory=list)
+
+    @classmethod
+    def from_text(cls, text: str, include_text: bool = False) -> "TokenizedOutput":
+        """
+        出力を一度走査して組み立てる
+
+        sectionsは見出しの次の行から次の見出しの前までのテキストで、同じ見出しが複数ある
+        場合は後のもので上書きする。section_itemsはセクション内の空でないリスト項目
+        （include_textを指定した場合はその他の行も含む）。linesは見出しを除く空でない行
+        （前後の空白を除く）で、include_textを指定した場合のみ集める。
+        """
+        result = cls()
+        section: Optional[str] = None
+        body_start = 0
+
+        def close_section(end: int) -> None:
+            if section:
+                result.sections[section] = text[body_start:end].strip()
+
+        for token in tokenize_output(text, include_text):
+            kind = token.kind
+            if kind == TOKEN_TAG:
+                result.tags.setdefault(token.name, []).append(token.value)
+            elif kind == TOKEN_MARKER:
+                result.markers.append(token.value)
+            elif kind == TOKEN_HEADING:
+                close_section(token.start)
+                # 見出しの名前が空の場合は、次の見出しまでどのセクションにも含めない
+                section = token.value or None
+                body_start = token.end + 1
+                if section:
+                    result.section_items[section] = []
+            elif token.value:
+                if include_text:
+                    result.lines.append(text[token.start : token.end].strip())
+                if section:
+                    result.section_items[section].append(token.value)
+        close_section(len(text))
+        return result
+
+    def tag(self, name: str) -> str:
+        """最初に現れたタグの内容（前後の空白を除く）、無ければ空文字"""
+        contents = self.tags.get(name)
+        return contents[0].strip() if contents else ""
+
+    def continuation(self, default: bool = True) -> bool:
+        """<CONTINUE>があれば継続、<END>のみなら終了"""
+        if "CONTINUE" in self.markers:
+            return True
+        if "END" in self.markers:
+            return False
+        return default
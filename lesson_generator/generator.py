@@ -1,29 +1,83 @@
 """Lesson content generator using Gemini API."""
 
+import asyncio
+import json
 import logging
 import os
+import time
+from contextlib import asynccontextmanager
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, Optional, Tuple
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
 
 import google.generativeai as genai
 from dotenv import load_dotenv
 
-from .core.models import Topic
-from .processors.content import ContentAnalysisProcessor
+from .core.models import ContentStructure, DialogueChunk, Theme, Topic
+from .core.sections import Section, SectionIndex, split_markdown_sections
+from .processors.content import ContentAnalysisProcessor, ThemeStreamParser
 from .processors.dialogue import DialogueProcessor
 from .processors.validation import ValidationProcessor
+from .runtime.accounting import (
+    BUDGET_ABORT,
+    BUDGET_DOWNGRADE,
+    BudgetExceededError,
+    CallRecord,
+    TokenUsage,
+    UsageTracker,
+)
+from .runtime.context_cache import (
+    CachedContext,
+    GeminiContextCache,
+    LocalContextCache,
+)
+from .runtime.endpoints import Endpoint, EndpointPool, key_fingerprint
+from .runtime.hedging import HedgingPolicy
+from .runtime.journal import RunJournal, hash_text, journal_key
+from .runtime.manifest import LessonManifest
+from .runtime.profiles import (
+    STAGE_ANALYSIS,
+    STAGE_DIALOGUE,
+    STAGE_TOPIC,
+    STAGE_TOPIC_BATCH,
+    GenerationProfile,
+    build_generation_profiles,
+)
+from .runtime.rate_limit import get_rate_limiter
+from .runtime.replay import REPLAY_FAST, RecordingTransport, ReplayTransport
+from .runtime.response_cache import ResponseCache
+from .runtime.retry import RetryBudget, RetryPolicy, is_retryable
+from .runtime.scheduler import StageConfig, StageScheduler
+from .runtime.tokens import estimate_tokens
+from .runtime.tracing import Tracer, traced
+from .runtime.transport import GeminiTransport
 from .templates.prompts import (
+    CACHED_CONTENT_REFERENCE,
+    CACHED_STRUCTURE_REFERENCE,
     CONTENT_ANALYSIS_PROMPT,
+    DIALOGUE_CONTINUATION_PROMPT,
     DIALOGUE_GENERATION_PROMPT,
+    SOURCE_CONTEXT_PROMPT,
+    TOPIC_BATCH_EXTRACTION_PROMPT,
     TOPIC_EXTRACTION_PROMPT,
 )
 
+# プロセス内で読み込み済みの環境ファイルと、genaiに設定済みのAPIキー
+_loaded_env_files = set()
+_configured_api_key: Optional[str] = None
+
+
+def _split_env_list(value: Optional[str]) -> List[str]:
+    """カンマ区切りの環境変数をリストに変換（空の要素は除く）"""
+    return [item.strip() for item in (value or "").split(",") if item.strip()]
+
 
 class LessonGenerator:
     """対話形式の授業コンテンツを生成するジェネレーター"""
 
     DEFAULT_MODEL = "gemini-exp-1206"
+    RUN_REPORT_FILENAME = "run_report.json"
+    TRACE_FILENAME = "trace.json"
 
     def __init__(
         self,
@@ -34,14 +88,27 @@ class LessonGenerator:
         max_tokens_per_chunk: int = 8192,
         output_format: str = "both",  # "structured", "raw", or "both"
         env_file: str = ".env",
+        stream_dialogue: bool = False,
+        max_dialogue_chunks: int = 3,
+        transport: Optional[GeminiTransport] = None,
+        response_cache: Optional[ResponseCache] = None,
     ):
         self._setup_logging()
         self._load_environment(env_file)
-        self._initialize_api()
+        self._initialize_api(transport, response_cache)
         self._setup_personas(teacher_persona, student_persona, dialogue_style)
         self._setup_generation_params(min_exchanges_per_chunk, max_tokens_per_chunk)
         self.output_format = output_format
+        self.stream_dialogue = stream_dialogue
+        self.max_dialogue_chunks = max(1, max_dialogue_chunks)
         self.topic_counter = 1
+        self.journal: Optional[RunJournal] = None
+        # テーマごとの先行抽出（分析中の抽出、または一括抽出のグループ）のタスク
+        # （キーはジャーナルのキー）
+        self._early_topics: Dict[str, asyncio.Task] = {}
+        self.usage = self._create_usage_tracker()
+        self.tracer = Tracer(self.trace_enabled)
+        self.scheduler = self._create_scheduler()
 
         # プロセッサーの初期化
         self.content_processor = ContentAnalysisProcessor()
@@ -75,20 +142,128 @@ class LessonGenerator:
         if not os.path.exists(env_file):
             raise FileNotFoundError(f"Environment file not found: {env_file}")
 
-        load_dotenv(env_file)
-        self.api_key = os.getenv("GEMINI_API_KEY")
+        # 同じ環境ファイルはプロセス内で一度だけ読み込む
+        env_path = os.path.abspath(env_file)
+        if env_path not in _loaded_env_files:
+            load_dotenv(env_file)
+            _loaded_env_files.add(env_path)
+        # 複数のAPIキー（カンマ区切り）を指定するとプールとして振り分ける
+        self.api_keys = _split_env_list(os.getenv("GEMINI_API_KEYS"))
+        self.api_key = os.getenv("GEMINI_API_KEY") or next(iter(self.api_keys), None)
         if not self.api_key:
             raise ValueError("GEMINI_API_KEY is not set in environment file")
+        if not self.api_keys:
+            self.api_keys = [self.api_key]
 
         # オプション設定の読み込み
         self.output_dir = os.getenv("OUTPUT_DIR", "output")
         self.max_topics = int(os.getenv("MAX_TOPICS_PER_LESSON", "3"))
         self.model_name = os.getenv("GEMINI_MODEL", self.DEFAULT_MODEL)
+        self.model_names = _split_env_list(os.getenv("GEMINI_MODELS")) or [
+            self.model_name
+        ]
+
+        # ステージごとのモデル（未指定の場合はGEMINI_MODEL）
+        self.stage_models = {
+            STAGE_ANALYSIS: os.getenv("ANALYSIS_MODEL") or None,
+            STAGE_TOPIC: os.getenv("TOPIC_MODEL") or None,
+            STAGE_DIALOGUE: os.getenv("DIALOGUE_MODEL") or None,
+        }
+        # 構造化出力のパース・検証に失敗した場合にGEMINI_MODELでやり直すか
+        self.model_escalation = os.getenv("MODEL_ESCALATION", "on").lower() != "off"
+        self.request_timeout = float(os.getenv("REQUEST_TIMEOUT", "600"))
+        self.max_concurrent_themes = max(
+            1, int(os.getenv("MAX_CONCURRENT_THEMES", "3"))
+        )
+
+        # ステージごとの同時実行数（未指定の場合はMAX_CONCURRENT_THEMES）と待ち行列の上限
+        self.topic_concurrency = int(
+            os.getenv("TOPIC_CONCURRENCY", str(self.max_concurrent_themes))
+        )
+        self.dialogue_concurrency = int(
+            os.getenv("DIALOGUE_CONCURRENCY", str(self.max_concurrent_themes))
+        )
+        self.dialogue_queue_depth = int(os.getenv("DIALOGUE_QUEUE_DEPTH", "0"))
+        self.pipeline_max_active = int(os.getenv("PIPELINE_MAX_ACTIVE", "0"))
+
+        # 再試行の設定
+        self.retry_policy = RetryPolicy(
+            max_attempts=max(1, int(os.getenv("MAX_RETRIES", "3"))),
+            base_delay=float(os.getenv("RETRY_BASE_DELAY", "1.0")),
+            max_delay=float(os.getenv("RETRY_MAX_DELAY", "60")),
+        )
+        retry_budget = float(os.getenv("RETRY_BUDGET_SECONDS", "300"))
+        self.retry_budget_seconds = retry_budget if retry_budget > 0 else None
+        self.retry_budget = RetryBudget(self.retry_budget_seconds)
+
+        # ソース文書のコンテキストキャッシュ（"gemini", "local", "off"）
+        self.context_cache_mode = os.getenv("CONTEXT_CACHE", "off").lower()
+        self.context_cache_ttl = int(os.getenv("CONTEXT_CACHE_TTL", "3600"))
+
+        # 応答キャッシュ（ディレクトリ未指定の場合は無効）
+        self.response_cache_dir = os.getenv("RESPONSE_CACHE_DIR") or None
+        self.response_cache_max_mb = float(os.getenv("RESPONSE_CACHE_MAX_MB", "500"))
+        self.response_cache_max_age_days = float(
+            os.getenv("RESPONSE_CACHE_MAX_AGE_DAYS", "30")
+        )
+
+        # コンテンツ分析を受信しながら、閉じたテーマからトピック抽出を始めるか
+        self.stream_analysis = os.getenv("STREAM_ANALYSIS", "off").lower() == "on"
+
+        # 複数テーマのトピックを一度に抽出する件数（0の場合はテーマごとに抽出）
+        self.topic_batch_size = max(0, int(os.getenv("TOPIC_BATCH_SIZE", "0")))
 
-    def _initialize_api(self):
-        """API初期化"""
+        # テーマごとの関連セクション検索（0の場合は文書全体を渡す）
+        self.retrieval_max_tokens = int(os.getenv("RETRIEVAL_MAX_TOKENS", "0"))
+
+        # 重複リクエスト（0の場合は無効）
+        self.hedge_percentile = float(os.getenv("HEDGE_PERCENTILE", "0"))
+        self.hedge_max_rate = float(os.getenv("HEDGE_MAX_RATE", "0.1"))
+        self.hedge_min_samples = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+
+        # APIキー・モデルのプールで失敗が続いたエンドポイントを切り離す設定
+        self.endpoint_eject_seconds = float(os.getenv("ENDPOINT_EJECT_SECONDS", "30"))
+        self.endpoint_error_threshold = float(
+            os.getenv("ENDPOINT_ERROR_THRESHOLD", "0.5")
+        )
+
+        # API呼び出しの記録と再生（REPLAY_LOGを指定した場合はAPIを呼ばない）
+        self.record_log = os.getenv("RECORD_LOG") or None
+        self.replay_log = os.getenv("REPLAY_LOG") or None
+        self.replay_timing = os.getenv("REPLAY_TIMING", REPLAY_FAST).lower()
+        self.replay_speed = float(os.getenv("REPLAY_SPEED", "1.0"))
+
+        # 処理時間のトレース（出力ディレクトリにtrace.jsonを書き出す）
+        self.trace_enabled = os.getenv("TRACE", "on").lower() != "off"
+
+        # レッスンあたりのトークン予算（0の場合は無制限）
+        self.max_tokens_per_lesson = int(os.getenv("MAX_TOKENS_PER_LESSON", "0"))
+        self.token_budget_action = os.getenv(
+            "TOKEN_BUDGET_ACTION", BUDGET_ABORT
+        ).lower()
+        if self.token_budget_action not in (BUDGET_ABORT, BUDGET_DOWNGRADE):
+            self.token_budget_action = BUDGET_ABORT
+
+        # レート制限（未設定の場合は無効）
+        self.rate_limit_rpm = float(os.getenv("RATE_LIMIT_RPM", "0"))
+        self.rate_limit_tpm = float(os.getenv("RATE_LIMIT_TPM", "0"))
+        self.rate_limit_lock_file = os.getenv("RATE_LIMIT_LOCK_FILE") or None
+        self.max_concurrent_requests = int(os.getenv("MAX_CONCURRENT_REQUESTS", "0"))
+
+    def _initialize_api(
+        self,
+        transport: Optional[GeminiTransport] = None,
+        response_cache: Optional[ResponseCache] = None,
+    ):
+        """API初期化
+
+        transportやresponse_cacheを渡すと、他のジェネレーターと共有して使う。
+        """
+        global _configured_api_key
         try:
-            genai.configure(api_key=self.api_key)
+            if _configured_api_key != self.api_key:
+                genai.configure(api_key=self.api_key)
+                _configured_api_key = self.api_key
 
             # 生成設定
             self.base_config = {
@@ -98,8 +273,49 @@ class LessonGenerator:
                 "max_output_tokens": int(os.getenv("MAX_OUTPUT_TOKENS", "8192")),
             }
 
-            # モデルの初期化
-            self.model = genai.GenerativeModel(self.model_name)
+            # ステージごとの生成プロファイル（不変・呼び出し間で共有）
+            self.profiles = build_generation_profiles(
+                self.base_config, self.stage_models
+            )
+
+            # プロセス全体で共有するレートリミッター
+            self.rate_limiter = get_rate_limiter(
+                self.rate_limit_rpm, self.rate_limit_tpm, self.rate_limit_lock_file
+            )
+
+            # 複数のAPIキー・モデルへの振り分け（トランスポートと共に共有される）
+            self.endpoints = self._create_endpoint_pool()
+
+            # 遅い呼び出しへの重複リクエスト（トランスポートと共に共有される）
+            self.hedging = None
+            if self.hedge_percentile > 0:
+                self.hedging = HedgingPolicy(
+                    percentile=self.hedge_percentile,
+                    max_rate=self.hedge_max_rate,
+                    min_samples=self.hedge_min_samples,
+                )
+
+            # トランスポートの初期化
+            self.transport = transport or self._create_transport()
+
+            # 応答キャッシュの初期化
+            self.response_cache = response_cache
+            if self.response_cache is None and self.response_cache_dir:
+                self.response_cache = ResponseCache(
+                    self.response_cache_dir,
+                    max_bytes=int(self.response_cache_max_mb * 1024 * 1024),
+                    max_age_seconds=self.response_cache_max_age_days * 86400,
+                )
+
+            # コンテキストキャッシュの初期化
+            if self.context_cache_mode == "gemini":
+                self.context_cache = GeminiContextCache(
+                    self.model_name, ttl_seconds=self.context_cache_ttl
+                )
+            elif self.context_cache_mode == "local":
+                self.context_cache = LocalContextCache()
+            else:
+                self.context_cache = None
             self.logger.info(
                 f"Successfully initialized Gemini API with model: {self.model_name}"
             )
@@ -108,6 +324,57 @@ class LessonGenerator:
             self.logger.error(f"Failed to initialize Gemini API: {e}")
             raise
 
+    def _create_endpoint_pool(self) -> Optional[EndpointPool]:
+        """APIキーとモデルの組み合わせが複数ある場合にエンドポイントのプールを作成"""
+        if len(self.api_keys) * len(self.model_names) <= 1:
+            return None
+
+        endpoints = []
+        for api_key in self.api_keys:
+            # クォータはAPIキーごとに別なので、レートリミッターもキーごとに分ける
+            rate_limiter = get_rate_limiter(
+                self.rate_limit_rpm,
+                self.rate_limit_tpm,
+                self.rate_limit_lock_file,
+                scope=key_fingerprint(api_key),
+            )
+            for model_name in self.model_names:
+                endpoints.append(Endpoint(api_key, model_name, rate_limiter))
+        # キーごとのクライアントはライブラリの非公開属性に依存するため、最初の
+        # リクエストではなく起動時に差し替えられることを確認する
+        Endpoint.check_client_override(genai.GenerativeModel(self.model_names[0]))
+        self.logger.info(
+            "Routing requests across endpoints: "
+            + ", ".join(endpoint.name for endpoint in endpoints)
+        )
+        return EndpointPool(
+            endpoints,
+            eject_seconds=self.endpoint_eject_seconds,
+            error_threshold=self.endpoint_error_threshold,
+        )
+
+    def _create_transport(self) -> GeminiTransport:
+        """設定に応じたトランスポート（通常・記録・再生）を作成"""
+        options = dict(
+            request_timeout=self.request_timeout,
+            rate_limiter=self.rate_limiter,
+            max_concurrent_requests=self.max_concurrent_requests,
+            hedging=self.hedging,
+            endpoints=self.endpoints,
+        )
+        if self.replay_log:
+            self.logger.info(f"Replaying API calls from {self.replay_log}")
+            return ReplayTransport(
+                self.replay_log,
+                timing=self.replay_timing,
+                speed=self.replay_speed,
+                **options,
+            )
+        if self.record_log:
+            self.logger.info(f"Recording API calls to {self.record_log}")
+            return RecordingTransport(self.model_name, self.record_log, **options)
+        return GeminiTransport(self.model_name, **options)
+
     def _setup_personas(
         self,
         teacher_persona: Dict[str, str],
@@ -125,73 +392,362 @@ class LessonGenerator:
         self.max_tokens_per_chunk = max_tokens
 
     async def _generate_with_retry(
-        self, prompt: str, schema: Optional[Any] = None, max_retries: int = 3
-    ) -> str:
-        """リトライ機能付きでプロンプトを生成"""
-        for attempt in range(max_retries):
-            try:
-                self.logger.info(f"Generation attempt {attempt + 1}/{max_retries}")
+        self,
+        prompt: str,
+        stage: str = STAGE_DIALOGUE,
+        max_retries: Optional[int] = None,
+        stream_to: Optional[str] = None,
+        context: Optional[CachedContext] = None,
+        stream_append: bool = False,
+        theme: Optional[str] = None,
+        escalate: bool = False,
+        on_progress: Optional[Callable[[str], None]] = None,
+        parse: Optional[Callable[[str], Any]] = None,
+    ) -> Any:
+        """リトライ機能付きでプロンプトを生成
+
+        stream_toを指定すると、レスポンスを受信しながらそのファイルへ逐次書き込む。
+        stream_append=Trueの場合は既存の内容の後ろに追記する。
+        on_progressを指定するとストリーミングで受信し、断片が届くたびにその試行で
+        受信済みのテキスト全体を渡す。
+        escalate=Trueの場合はステージのモデル指定に関わらずGEMINI_MODELを使う。
+        トークン数・レイテンシ・試行回数はstageとthemeごとにself.usageへ記録する。
+        parseを指定すると、応答の代わりにそのパース結果を返す。パースに失敗した（例外を送出
+        するかNoneを返した）応答は応答キャッシュに保存せず、キャッシュにあった応答のパースに
+        失敗した場合はそのエントリを削除してAPIを呼び出す。
+        """
+        profile = self.profiles[stage]
+        if escalate:
+            profile = profile.with_model(self.model_name)
+        # 送信先のエンドポイントがモデルを指定している場合はその候補すべて
+        model_names = self.transport.model_names(profile, context)
+        max_attempts = max_retries or self.retry_policy.max_attempts
+
+        # 再試行時はこの位置まで巻き戻してから書き直す
+        stream_offset = 0
+        if stream_to and stream_append and os.path.exists(stream_to):
+            stream_offset = os.path.getsize(stream_to)
+
+        # 同一リクエストの応答がキャッシュにあればAPIを呼ばずに返す
+        cache_keys: Dict[str, str] = {}
+        if self.response_cache:
+            cache_keys = {
+                name: ResponseCache.make_key(
+                    name, profile, prompt, context.key if context else None
+                )
+                for name in model_names
+            }
+            cache_key, cached = self.response_cache.lookup(list(cache_keys.values()))
+            result = cached
+            if cached is not None and parse is not None:
+                try:
+                    result = parse(cached)
+                except Exception as e:
+                    self.logger.debug(f"Cached response parse error: {e}")
+                    result = None
+                if result is None:
+                    # 以前のバージョンで保存された不正な応答を使い続けないようにする
+                    self.logger.warning(
+                        f"Discarding cached response that failed to parse ({stage})"
+                    )
+                    self.response_cache.invalidate(cache_key)
+                    cached = None
+            if cached is not None:
+                self.logger.info(f"Response cache hit ({stage})")
+                self.usage.record(
+                    CallRecord(
+                        stage,
+                        theme,
+                        0,
+                        0,
+                        0.0,
+                        0,
+                        estimated=False,
+                        cached=True,
+                        model=next(
+                            name for name, key in cache_keys.items() if key == cache_key
+                        ),
+                    )
+                )
+                if stream_to:
+                    with open(stream_to, "a", encoding="utf-8") as f:
+                        f.truncate(stream_offset)
+                        f.write(cached)
+                if on_progress:
+                    on_progress(cached)
+                return result
+
+        # 失敗した試行のトークン数も予算の判定に含めるよう、試行ごとに同じ記録へ加算する
+        record = CallRecord(
+            stage, theme, 0, 0, 0.0, 0, estimated=False, model=model_names[0]
+        )
 
-                # スキーマが指定されている場合は設定を更新
-                if schema:
-                    config = {**self.base_config, "response_schema": schema}
-                    self.model.generation_config = config
-                else:
-                    self.model.generation_config = self.base_config
+        def account(usage: TokenUsage) -> None:
+            if not record.attempts:
+                self.usage.record(record)
+            record.add_attempt(usage, time.monotonic() - started)
 
-                response = self.model.generate_content(prompt)
+        started = time.monotonic()
+        for attempt in range(max_attempts):
+            # 予算を超えていれば新しい呼び出しを始めない
+            self.usage.check_budget(stage)
+            usage = TokenUsage()
+            try:
+                self.logger.info(
+                    f"Generation attempt {attempt + 1}/{max_attempts} ({stage})"
+                )
+
+                with self.tracer.span(
+                    f"llm.{stage}",
+                    "llm",
+                    theme=theme,
+                    attempt=attempt + 1,
+                    model=", ".join(model_names),
+                ):
+                    if stream_to:
+                        text = await self._stream_to_file(
+                            prompt, profile, stream_to, context, stream_offset, usage
+                        )
+                    elif on_progress:
+                        text = await self._stream_with_progress(
+                            prompt, profile, on_progress, context, usage
+                        )
+                    else:
+                        text = await self.transport.generate(
+                            prompt, profile, context=context, usage=usage
+                        )
                 self.logger.info("Generation completed")
-                self.logger.debug(f"Raw response: {response.text}")
+                self.logger.debug(f"Raw response: {text}")
 
-                return response.text
+                account(usage)
+
+            except asyncio.CancelledError:
+                # 他のテーマの予算超過などで中止された場合も送信済みの分は計上する
+                account(usage)
+                raise
 
             except Exception as e:
                 self.logger.warning(f"Generation attempt {attempt + 1} failed: {e}")
-                if attempt == max_retries - 1:
+                account(usage)
+
+                # 再試行しても無駄なエラーは即座に失敗させる
+                give_up = not is_retryable(e) or attempt == max_attempts - 1
+                if not is_retryable(e):
+                    self.logger.error(f"Non-retryable error ({type(e).__name__})")
+
+                delay = 0.0 if give_up else self.retry_policy.get_delay(attempt, e)
+                if not give_up and not self.retry_budget.allows(delay):
+                    self.logger.error("Retry budget exhausted for this lesson")
+                    give_up = True
+
+                if give_up:
+                    record.error = type(e).__name__
                     raise
 
+                self.logger.info(f"Retrying in {delay:.1f}s")
+                with self.tracer.span("retry.backoff", "llm", delay=delay):
+                    await self.retry_budget.sleep(delay)
+
+            else:
+                # パースの失敗は再試行しない（呼び出し元でエスカレーションなどを判断する）
+                result = parse(text) if parse is not None else text
+                if cache_keys and result is not None:
+                    # 実際に応答したエンドポイントのモデルのキーで保存する
+                    self.response_cache.put(
+                        cache_keys.get(usage.model) or cache_keys[model_names[0]], text
+                    )
+                return result
+
+        raise RuntimeError(f"Generation failed after {max_attempts} attempts")
+
+    def _can_escalate(self, stage: str) -> bool:
+        """ステージが別のモデルを使っていて、GEMINI_MODELでやり直せるか"""
+        stage_model = self.profiles[stage].model_name
+        return self.model_escalation and stage_model not in (None, self.model_name)
+
+    async def _stream_to_file(
+        self,
+        prompt: str,
+        profile: GenerationProfile,
+        path: str,
+        context: Optional[CachedContext] = None,
+        offset: int = 0,
+        usage: Optional[TokenUsage] = None,
+    ) -> str:
+        """ストリーミングで受信したテキストをファイルのoffset以降へ追記しながら生成"""
+        chunks = []
+        lines = 0
+        with open(path, "a", encoding="utf-8") as f:
+            f.truncate(offset)
+            async for text in self.transport.stream(
+                prompt, profile, context=context, usage=usage
+            ):
+                chunks.append(text)
+                f.write(text)
+                f.flush()
+
+                # 行数が一定数を超えるたびに進捗を出力
+                previous = lines
+                lines += text.count("\n")
+                if lines // 20 > previous // 20:
+                    self.logger.info(
+                        f"Streaming {os.path.basename(path)}: {lines} lines received"
+                    )
+
+        return "".join(chunks)
+
+    async def _stream_with_progress(
+        self,
+        prompt: str,
+        profile: GenerationProfile,
+        on_progress: Callable[[str], None],
+        context: Optional[CachedContext] = None,
+        usage: Optional[TokenUsage] = None,
+    ) -> str:
+        """ストリーミングで受信し、断片が届くたびに受信済みのテキストを渡す"""
+        text = ""
+        async for chunk in self.transport.stream(
+            prompt, profile, context=context, usage=usage
+        ):
+            text += chunk
+            on_progress(text)
+        return text
+
     async def generate_lesson(
-        self, input_file: str = "input.md", output_dir: str = "output"
+        self,
+        input_file: str = "input.md",
+        output_dir: str = "output",
+        resume: bool = False,
+        incremental: bool = False,
     ) -> None:
-        """レッスンの生成"""
+        """レッスンの生成
+
+        resume=Trueの場合、出力ディレクトリのジャーナルから完了済みのステージを復元し、
+        未完了の部分だけを生成する。
+        incremental=Trueの場合、前回の実行から元のセクションもテーマも変わっていない
+        テーマのトピック/対話ファイルをそのまま再利用する。
+        """
         self.logger.info(f"Starting lesson generation from {input_file}")
+        self.retry_budget = RetryBudget(self.retry_budget_seconds)
+        self.usage = self._create_usage_tracker()
+        self.tracer = Tracer(self.trace_enabled)
+        self.scheduler = self._create_scheduler()
+        self._early_topics = {}
+        lesson_span = self.tracer.begin("lesson", input_file=input_file)
+        source_context = None
+        error: Optional[BaseException] = None
 
         try:
             # 入力ファイルの読み込み
             content = self._read_input_file(input_file)
 
-            # コンテンツ分析
-            self.logger.info("Analyzing content structure")
-            analysis_prompt = CONTENT_ANALYSIS_PROMPT.format(content=content)
-            analysis_response = await self._generate_with_retry(
-                analysis_prompt, CONTENT_ANALYSIS_PROMPT.response_schema
-            )
+            # 途中経過のジャーナル
+            os.makedirs(output_dir, exist_ok=True)
+            self.journal = RunJournal(output_dir)
+            if resume:
+                self.journal.resume(hash_text(content))
+            else:
+                self.journal.start(hash_text(content))
 
-            # 構造の解析
-            content_structure = self.content_processor.parse(analysis_response)
-            self.logger.info(
-                f"Successfully parsed content structure with {len(content_structure.main_themes)} main themes"
-            )
+            # 前回の実行でのセクションとテーマの対応
+            sections = split_markdown_sections(content)
+            manifest = LessonManifest.load(output_dir)
+
+            # コンテンツ分析
+            content_structure = self.journal.get_structure()
+            if content_structure is not None:
+                self.logger.info("Restored content structure from journal")
+            elif incremental and manifest.get_structure(sections) is not None:
+                # 見出し構成が変わっていなければテーマ構成も前回のものを使う
+                content_structure = manifest.get_structure(sections)
+                self.logger.info("Reusing content structure from previous run")
+                self.journal.record_structure(content_structure)
+            else:
+                # 分析の応答を受信しながら、閉じたテーマからトピック抽出を始める
+                on_theme = None
+                if self.stream_analysis and self.context_cache is None:
+                    on_theme = self._early_topic_starter(content, sections)
+                async with self._stage_slot(STAGE_ANALYSIS):
+                    content_structure = await self._analyze_content(content, on_theme)
+                self.journal.record_structure(content_structure)
+                self._discard_early_topics(content_structure)
 
             # 構造情報の出力
             structure_content = self._format_structure_content(content_structure)
             structure_path = os.path.join(output_dir, "00_content_structure.md")
             self._write_output(structure_path, structure_content)
 
+            # テーマ間で共有する入力文書と構造情報を一度だけキャッシュ
+            source_context = await self._create_source_context(
+                content, content_structure
+            )
+
+            # テーマごとに関連するセクションだけをプロンプトに渡す
+            section_index = self._build_section_index(content, sections, source_context)
+
             # トピックごとの処理
-            os.makedirs(output_dir, exist_ok=True)
             combined_content = []
             dialogue_outputs = []
             raw_dialogues = []  # 生の対話テキストを保持するリスト
 
             self.topic_counter = 1  # カウンターをリセット
 
-            for theme in content_structure.main_themes:
-                self.logger.info(f"Processing theme: {theme.title}")
+            # トピック抽出と対話生成（同時実行数を制限して並列処理）
+            themes = content_structure.main_themes
+            stream_paths: List[Optional[str]] = [None] * len(themes)
+            if self.stream_dialogue:
+                stream_paths = [
+                    self._stream_path(output_dir, i, theme)
+                    for i, theme in enumerate(themes, 1)
+                ]
 
-                # トピック抽出と対話生成
-                result = await self._process_theme(theme, content, content_structure)
+            # 完了済みのテーマはジャーナルから復元し、変更の無いテーマは前回の出力を再利用する
+            keys = [journal_key(i, theme) for i, theme in enumerate(themes)]
+            results = [self.journal.get_output(key) for key in keys]
+            if incremental:
+                for i, theme in enumerate(themes):
+                    if results[i] is None:
+                        results[i] = manifest.read_outputs(theme, sections)
+                        if results[i] is not None:
+                            self.journal.record_output(keys[i], *results[i])
+                self.logger.info(
+                    f"Reusing {sum(r is not None for r in results)}/{len(themes)} themes from previous run"
+                )
+            pending = [i for i, result in enumerate(results) if result is None]
+
+            # トピックをまとめて抽出し始め、失敗したテーマだけを個別に抽出する
+            self._prefetch_topics(
+                [themes[i] for i in pending],
+                pending,
+                content,
+                sections,
+                section_index,
+                content_structure,
+                source_context,
+            )
+
+            themes_span = self.tracer.begin("themes", count=len(pending))
+            generated = await self._process_themes_concurrently(
+                [themes[i] for i in pending],
+                pending,
+                [
+                    self._theme_content(themes[i], content, sections, section_index)
+                    for i in pending
+                ],
+                content_structure,
+                [stream_paths[i] for i in pending],
+                source_context,
+            )
+            self.tracer.end(themes_span)
+            for i, result in zip(pending, generated):
+                results[i] = result
+                if result is not None:
+                    self.journal.record_output(keys[i], *result)
+
+            manifest.reset(sections, content_structure)
 
+            # 番号付けと書き込みはテーマ順に行い、完了順に依存しないようにする
+            for theme, result, stream_path in zip(themes, results, stream_paths):
                 if result:
                     topic_content, dialogue_content = result
                     # 個別ファイルの出力（番号付き）
@@ -203,6 +759,14 @@ class LessonGenerator:
 
                     self._write_output(output_path, topic_content)
                     self._write_output(dialogue_path, dialogue_content)
+                    self._discard_stream_file(stream_path, keep=dialogue_path)
+                    manifest.record_theme(
+                        theme,
+                        self._theme_sections(theme, sections, section_index),
+                        topic_filename,
+                        dialogue_filename,
+                        whole_document=section_index is None,
+                    )
 
                     combined_content.append(topic_content)
                     dialogue_outputs.append(dialogue_content)
@@ -213,6 +777,8 @@ class LessonGenerator:
                         raw_dialogues.append(dialogue_text)
 
                     self.topic_counter += 1
+                else:
+                    self._discard_stream_file(stream_path)
 
             # 全体ファイルの出力
             if combined_content:
@@ -227,12 +793,333 @@ class LessonGenerator:
                 dialogue_output_path = os.path.join(output_dir, "combined_dialogues.md")
                 self._write_output(dialogue_output_path, combined_dialogue)
 
+            for filename in manifest.remove_stale_outputs():
+                self.logger.info(f"Removed stale output {filename}")
+            manifest.save()
+
+            if self.response_cache:
+                self.logger.info(f"Response cache stats: {self.response_cache.stats}")
+            if self.transport.hedging:
+                self.logger.info(f"Hedging stats: {self.transport.hedging.stats}")
             self.logger.info("Lesson generation completed successfully")
 
         except Exception as e:
             self.logger.error(f"Error during lesson generation: {e}")
+            error = e
             raise
 
+        finally:
+            self._discard_early_topics()
+            if source_context is not None:
+                await self.context_cache.release(source_context)
+                self.transport.discard_context(source_context)
+            self.tracer.end(lesson_span, error)
+            self._write_run_report(output_dir)
+            self._write_trace(output_dir)
+
+    def _create_scheduler(self) -> StageScheduler:
+        """パイプラインのステージ（分析→トピック→対話）のスケジューラー
+
+        下流のステージほど優先度を高くし、開始済みのテーマを先に完了させる。
+        ステージの実行順は_process_themeが決め、depends_onは対話生成の待ちによる背圧にのみ使う。
+        """
+        return StageScheduler(
+            [
+                StageConfig(STAGE_ANALYSIS, concurrency=1, priority=2),
+                StageConfig(
+                    STAGE_TOPIC,
+                    concurrency=self.topic_concurrency,
+                    priority=1,
+                    depends_on=(STAGE_ANALYSIS,),
+                ),
+                StageConfig(
+                    STAGE_DIALOGUE,
+                    concurrency=self.dialogue_concurrency,
+                    queue_depth=self.dialogue_queue_depth,
+                    priority=0,
+                    depends_on=(STAGE_TOPIC,),
+                ),
+            ],
+            max_active=self.pipeline_max_active,
+        )
+
+    @asynccontextmanager
+    async def _stage_slot(
+        self, stage: str, key: int = 0, theme: Optional[str] = None
+    ) -> AsyncIterator[None]:
+        """ステージの実行枠を確保（枠が割り当てられるまでの待ち時間はトレースに記録する）"""
+        queued = self.tracer.begin(f"{stage}.queued", theme=theme)
+        async with self.scheduler.slot(stage, key):
+            self.tracer.end(queued)
+            yield
+
+    def _create_usage_tracker(self) -> UsageTracker:
+        """レッスン単位のAPI使用量の集計"""
+        return UsageTracker(self.max_tokens_per_lesson, self.token_budget_action)
+
+    def _write_run_report(self, output_dir: str) -> None:
+        """ステージ別・テーマ別の使用量を出力ディレクトリに保存"""
+        if not os.path.isdir(output_dir):
+            return
+        report = self.usage.report()
+        total = report["total"]
+        self.logger.info(
+            f"Usage: {total['attempts']} requests, "
+            f"{total['prompt_tokens']} prompt / {total['output_tokens']} output tokens"
+        )
+        path = os.path.join(output_dir, self.RUN_REPORT_FILENAME)
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+        except OSError as e:
+            self.logger.warning(f"Failed to write run report: {e}")
+
+    def _write_trace(self, output_dir: str) -> None:
+        """処理時間のトレースを出力ディレクトリに保存"""
+        if not os.path.isdir(output_dir):
+            return
+        try:
+            self.tracer.save(os.path.join(output_dir, self.TRACE_FILENAME))
+        except OSError as e:
+            self.logger.warning(f"Failed to write trace: {e}")
+
+    def _theme_sections(
+        self,
+        theme: Any,
+        sections: List[Section],
+        index: Optional[SectionIndex] = None,
+    ) -> List[Section]:
+        """テーマのプロンプトに渡すセクション
+
+        索引があればその検索結果、無ければ文書全体を渡すため全セクション。
+        """
+        if index is None:
+            return list(sections)
+        query = " ".join([theme.title, theme.summary, *(theme.related_topics or [])])
+        return index.search(query, self.retrieval_max_tokens)
+
+    def _build_section_index(
+        self,
+        content: str,
+        sections: List[Section],
+        context: Optional[CachedContext] = None,
+    ) -> Optional[SectionIndex]:
+        """関連セクション検索用の索引を作成
+
+        検索が無効な場合、文書全体がキャッシュ済みの場合、文書が予算内に収まる場合はNone。
+        """
+        if self.retrieval_max_tokens <= 0 or context is not None:
+            return None
+        if estimate_tokens(content) <= self.retrieval_max_tokens:
+            return None
+        return SectionIndex(sections, count_tokens=estimate_tokens)
+
+    def _theme_content(
+        self,
+        theme: Any,
+        content: str,
+        sections: List[Section],
+        index: Optional[SectionIndex] = None,
+    ) -> str:
+        """テーマのプロンプトに渡す元の文書内容"""
+        if index is None:
+            return content
+        selected = self._theme_sections(theme, sections, index)
+        text = "\n\n".join(section.text for section in selected)
+        self.logger.info(
+            f"Selected {len(selected)}/{len(sections)} sections for {theme.title} "
+            f"(~{estimate_tokens(text)} tokens)"
+        )
+        return text
+
+    def _group_content(
+        self,
+        themes: List[Any],
+        content: str,
+        sections: List[Section],
+        index: Optional[SectionIndex] = None,
+    ) -> str:
+        """複数テーマのプロンプトに渡す元の文書内容（各テーマの関連セクションを文書順に結合）"""
+        if index is None:
+            return content
+        headings = {
+            section.heading
+            for theme in themes
+            for section in self._theme_sections(theme, sections, index)
+        }
+        return "\n\n".join(
+            section.text for section in sections if section.heading in headings
+        )
+
+    @traced("analysis")
+    async def _analyze_content(
+        self, content: str, on_theme: Optional[Callable[[Theme], None]] = None
+    ) -> ContentStructure:
+        """コンテンツ分析
+
+        on_themeを指定すると、応答を受信しながら閉じたテーマを順に渡す。
+        """
+        self.logger.info("Analyzing content structure")
+        analysis_prompt = CONTENT_ANALYSIS_PROMPT.format(content=content)
+        on_progress = None
+        if on_theme is not None:
+            parser = ThemeStreamParser()
+
+            def on_progress(text: str) -> None:
+                for theme in parser.update(text):
+                    on_theme(theme)
+
+        def parse(response: str, escalated: bool = False) -> ContentStructure:
+            with self.tracer.span("parse.analysis", "parse", escalated=escalated):
+                return self.content_processor.parse(response)
+
+        # 構造の解析（失敗した場合はGEMINI_MODELで生成し直す）
+        try:
+            content_structure = await self._generate_with_retry(
+                analysis_prompt, STAGE_ANALYSIS, on_progress=on_progress, parse=parse
+            )
+        except ValueError:
+            if not self._can_escalate(STAGE_ANALYSIS):
+                raise
+            self.logger.warning(
+                f"Escalating content analysis to {self.model_name} after parse failure"
+            )
+            content_structure = await self._generate_with_retry(
+                analysis_prompt,
+                STAGE_ANALYSIS,
+                escalate=True,
+                parse=lambda response: parse(response, escalated=True),
+            )
+        self.logger.info(
+            f"Successfully parsed content structure with {len(content_structure.main_themes)} main themes"
+        )
+        return content_structure
+
+    def _early_topic_starter(
+        self, content: str, sections: List[Section]
+    ) -> Callable[[Theme], None]:
+        """
+        分析の途中で閉じたテーマのトピック抽出を開始する関数を作成
+
+        この時点では文書構造が揃っていないため、プロンプトにはそれまでに受信したテーマだけを
+        構造として渡す。抽出したトピックはジャーナルに記録し、_process_themeで使う。
+        """
+        index = self._build_section_index(content, sections)
+        received: List[Theme] = []
+
+        def start(theme: Theme) -> None:
+            # テーマは構造情報の中の順に届くため、受信順がそのままテーマの位置になる
+            key = journal_key(len(received), theme)
+            received.append(theme)
+            if key in self._early_topics or self.journal.get_topic(key):
+                return
+            structure = ContentStructure(main_themes=list(received), timeline=[])
+            self.logger.info(f"Starting topic extraction early for {theme.title}")
+            self._early_topics[key] = asyncio.ensure_future(
+                self._extract_early_topic(
+                    theme,
+                    self._theme_content(theme, content, sections, index),
+                    structure.model_dump_json(),
+                    len(received) - 1,
+                )
+            )
+
+        return start
+
+    async def _extract_early_topic(
+        self, theme: Theme, content_text: str, structure_text: str, key: int
+    ) -> None:
+        """分析の完了を待たずにトピックを抽出し、ジャーナルに記録"""
+        with self.tracer.track(theme.title):
+            try:
+                async with self._stage_slot(STAGE_TOPIC, key, theme.title):
+                    topic = await self._extract_topic(
+                        theme, content_text, structure_text
+                    )
+            except BudgetExceededError:
+                raise
+            except Exception as e:
+                # テーマの処理時に改めて抽出する
+                self.logger.warning(f"Early topic extraction failed: {e}")
+                return
+        if topic is not None:
+            self.journal.record_topic(journal_key(key, theme), topic)
+
+    def _discard_early_topics(
+        self, structure: Optional[ContentStructure] = None
+    ) -> None:
+        """確定した構造に無いテーマ（structureがNoneの場合は全て）の先行抽出を中止"""
+        keys = (
+            {journal_key(i, theme) for i, theme in enumerate(structure.main_themes)}
+            if structure
+            else set()
+        )
+        for key in list(self._early_topics):
+            if key not in keys:
+                self._early_topics.pop(key).cancel()
+
+    @traced("context_cache")
+    async def _create_source_context(
+        self, content: str, structure: Any
+    ) -> Optional[CachedContext]:
+        """入力文書と構造情報をキャッシュ済みコンテキストとして登録"""
+        if self.context_cache is None:
+            return None
+
+        context_text = SOURCE_CONTEXT_PROMPT.format(
+            content=content, structure=structure.model_dump_json()
+        )
+        return await self.context_cache.get_or_create(context_text)
+
+    async def _process_themes_concurrently(
+        self,
+        themes: List[Any],
+        indices: List[int],
+        contents: List[str],
+        structure: Any,
+        stream_paths: List[Optional[str]],
+        context: Optional[CachedContext] = None,
+    ) -> List[Optional[Tuple[str, str]]]:
+        """テーマを並列処理し、テーマ順に結果を返す
+
+        同時実行数はステージごとにスケジューラーで制限されるため、前のテーマの対話生成中に
+        後のテーマのトピック抽出が進む。indicesは構造情報の中での各テーマの位置、
+        contentsはテーマごとにプロンプトへ渡す元の文書内容。
+        """
+
+        async def run(index: int, theme: Any, content: str, stream_path: Optional[str]):
+            # 並列に処理されるテーマはトレース上で別のトラックに記録する
+            with self.tracer.track(theme.title):
+                with self.tracer.span("theme", theme=theme.title):
+                    return await self._process_theme(
+                        theme, content, structure, stream_path, context, index
+                    )
+
+        tasks = [
+            asyncio.ensure_future(run(index, theme, content, path))
+            for theme, index, content, path in zip(
+                themes, indices, contents, stream_paths
+            )
+        ]
+        try:
+            return await asyncio.gather(*tasks)
+        except BaseException:
+            # 予算超過でレッスンを中止する場合、他のテーマの課金される呼び出しも止める
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    def _stream_path(self, output_dir: str, index: int, theme: Any) -> str:
+        """ストリーミング中の対話を書き込むパス（失敗テーマが無ければ最終ファイル名と一致）"""
+        filename = f"dialogue{index:02d}_{self._sanitize_filename(theme.title)}.md"
+        return os.path.join(output_dir, filename)
+
+    def _discard_stream_file(self, path: Optional[str], keep: str = "") -> None:
+        """最終出力と異なるストリーミング途中のファイルを削除"""
+        if path and path != keep and os.path.exists(path):
+            os.remove(path)
+
     def _extract_dialogue_text(self, dialogue_content: str) -> str:
         """対話テキスト部分のみを抽出"""
         import re
@@ -274,61 +1161,54 @@ class LessonGenerator:
         return filename.lower()
 
     async def _process_theme(
-        self, theme: Any, content: str, structure: Any
+        self,
+        theme: Any,
+        content: str,
+        structure: Any,
+        stream_path: Optional[str] = None,
+        context: Optional[CachedContext] = None,
+        index: int = 0,
     ) -> Optional[Tuple[str, str]]:
-        """テーマの処理"""
-        self.logger.info(f"Processing theme: {theme.title}")
-
-        try:
-            # トピック抽出
-            topic_prompt = TOPIC_EXTRACTION_PROMPT.format(
-                content=content,
-                main_theme=theme.title,
-                structure=structure.model_dump_json(),
-            )
-
-            self.logger.debug(f"Generated topic prompt for theme: {theme.title}")
-
-            topic_response = await self._generate_with_retry(
-                topic_prompt, TOPIC_EXTRACTION_PROMPT.response_schema
-            )
-
-            self.logger.debug(
-                f"Raw topic response: {topic_response[:200]}..."
-            )  # 最初の200文字のみログ出力
+        """テーマの処理
 
-            # ContentAnalysisProcessorを使ってトピックとして解析
-            try:
-                topic = self.content_processor.parse(topic_response)
-                if not isinstance(topic, Topic):
-                    self.logger.error(f"Invalid topic data type: {type(topic)}")
-                    return None
+        indexは構造情報の中でのテーマの位置で、小さいテーマほど各ステージで優先される。
+        """
+        self.logger.info(f"Processing theme: {theme.title}")
+        key = journal_key(index, theme)
 
-                # トピックの基本検証
-                if not hasattr(topic, "title") or not topic.title:
-                    self.logger.error("Invalid topic: missing title")
-                    return None
+        # コンテキストがキャッシュ済みの場合、プロンプトには参照だけを埋め込む
+        if context is not None:
+            content_text = CACHED_CONTENT_REFERENCE
+            structure_text = CACHED_STRUCTURE_REFERENCE
+        else:
+            content_text = content
+            structure_text = structure.model_dump_json()
 
-                if (
-                    not hasattr(topic, "learning_objectives")
-                    or not topic.learning_objectives
-                ):
-                    self.logger.error("Invalid topic: missing learning objectives")
+        try:
+            # トピック抽出（ジャーナルに記録済みならそれを使う）
+            # 分析中の先行抽出や一括抽出が始まっていれば、その完了だけを待つ
+            early_topic = self._early_topics.pop(key, None)
+            if early_topic is not None:
+                await early_topic
+            topic = self.journal.get_topic(key) if self.journal else None
+            if topic is not None:
+                self.logger.info(f"Restored topic from journal: {topic.title}")
+            else:
+                async with self._stage_slot(STAGE_TOPIC, index, theme.title):
+                    topic = await self._extract_topic(
+                        theme, content_text, structure_text, context
+                    )
+                if topic is None:
                     return None
-
-                self.logger.info(f"Successfully parsed topic: {topic.title}")
-
-            except Exception as e:
-                self.logger.error(f"Error parsing topic data: {str(e)}")
-                self.logger.debug(f"Parse error details: {type(e).__name__}: {str(e)}")
-                return None
+                if self.journal:
+                    self.journal.record_topic(key, topic)
 
             # 対話生成
             try:
                 dialogue_prompt = DIALOGUE_GENERATION_PROMPT.format(
-                    original_content=content,  # 元の文書内容を追加
+                    original_content=content_text,  # 元の文書内容を追加
                     topic_info=topic.model_dump_json(),
-                    content_structure=structure.model_dump_json(),  # 構造情報を追加
+                    content_structure=structure_text,  # 構造情報を追加
                     current_theme=theme.model_dump_json(),  # 現在のテーマ情報を追加
                     teacher_name=self.teacher["name"],
                     teacher_personality=self.teacher["personality"],
@@ -340,10 +1220,17 @@ class LessonGenerator:
 
                 self.logger.debug("Generated dialogue prompt with full context")
 
-                dialogue_response = await self._generate_with_retry(
-                    dialogue_prompt,
-                    None,  # スキーマは不要
-                )
+                async with self._stage_slot(STAGE_DIALOGUE, index, theme.title):
+                    responses, chunks = await self._generate_dialogue(
+                        theme,
+                        key,
+                        topic,
+                        dialogue_prompt,
+                        content_text,
+                        stream_path,
+                        context,
+                    )
+                dialogue_response = "\n\n".join(responses)
 
                 self.logger.debug(
                     f"Raw dialogue response length: {len(dialogue_response)}"
@@ -351,7 +1238,7 @@ class LessonGenerator:
 
                 # 出力フォーマットに応じた処理
                 if self.output_format == "structured":
-                    dialogue_data = self.dialogue_processor.parse(dialogue_response)
+                    dialogue_data = self._merge_dialogue_chunks(chunks)
                     return self._format_topic_content(
                         topic
                     ), self._format_structured_dialogue(dialogue_data)
@@ -361,7 +1248,7 @@ class LessonGenerator:
 
                 else:  # "both"
                     try:
-                        dialogue_data = self.dialogue_processor.parse(dialogue_response)
+                        dialogue_data = self._merge_dialogue_chunks(chunks)
                         formatted_dialogue = self._format_structured_dialogue(
                             dialogue_data
                         )
@@ -376,15 +1263,348 @@ class LessonGenerator:
                         self.logger.info("Falling back to raw dialogue output")
                         return self._format_topic_content(topic), dialogue_response
 
+            except BudgetExceededError:
+                raise
             except Exception as e:
                 self.logger.error(f"Error generating dialogue: {str(e)}")
                 return None
 
+        except BudgetExceededError:
+            # 予算超過はテーマ単位の失敗ではなくレッスン全体を中止する
+            raise
         except Exception as e:
             self.logger.error(f"Error processing theme {theme.title}: {str(e)}")
             self.logger.debug(f"Processing error details: {type(e).__name__}: {str(e)}")
             return None
 
+    async def _generate_dialogue(
+        self,
+        theme: Any,
+        key: str,
+        topic: Topic,
+        first_prompt: str,
+        content_text: str,
+        stream_path: Optional[str] = None,
+        context: Optional[CachedContext] = None,
+    ) -> Tuple[List[str], List[Optional[DialogueChunk]]]:
+        """<END>が出るかチャンク数の上限に達するまで対話を続けて生成
+
+        続きのプロンプトには全履歴ではなく、カバー済みのポイント・直前のやり取り・
+        未カバーのポイントだけを渡し、プロンプトの長さを一定に保つ。
+        keyはテーマのジャーナルのキー。
+
+        Returns:
+            Tuple[List[str], List[Optional[DialogueChunk]]]: 各チャンクの生の応答と
+            パース結果（パースに失敗したチャンクはNone）
+        """
+        responses: List[str] = []
+        chunks: List[Optional[DialogueChunk]] = []
+        covered: List[str] = []
+        prompt = first_prompt
+
+        for index in range(self.max_dialogue_chunks):
+            # 最初のチャンクはテーマのキー、以降は「キー#番号」でジャーナルに記録
+            chunk_key = key if index == 0 else f"{key}#{index + 1}"
+            response = self.journal.get_dialogue(chunk_key) if self.journal else None
+            if response is not None:
+                self.logger.info(
+                    f"Restored dialogue from journal: {theme.title} ({index + 1})"
+                )
+            else:
+                response = await self._generate_with_retry(
+                    prompt,
+                    STAGE_DIALOGUE,
+                    stream_to=stream_path,
+                    context=context,
+                    stream_append=index > 0,
+                    theme=theme.title,
+                )
+                if self.journal:
+                    self.journal.record_dialogue(chunk_key, response)
+            responses.append(response)
+
+            try:
+                with self.tracer.span("parse.dialogue", "parse", chunk=index + 1):
+                    chunk = self.dialogue_processor.parse(response)
+            except ValueError as e:
+                self.logger.warning(f"Stopping dialogue continuation: {e}")
+                chunks.append(None)
+                break
+            chunks.append(chunk)
+
+            if not chunk.requires_continuation:
+                break
+            if index + 1 >= self.max_dialogue_chunks:
+                self.logger.info(f"Dialogue chunk budget reached for {theme.title}")
+                break
+            if self.usage.downgraded:
+                self.logger.warning(
+                    f"Token budget exceeded, skipping continuation for {theme.title}"
+                )
+                break
+
+            covered.extend(chunk.key_points_covered)
+            remaining = self._remaining_key_points(topic.key_points, covered)
+            recent = [line for line in chunk.dialogue.split("\n") if line.strip()]
+            prompt = DIALOGUE_CONTINUATION_PROMPT.format(
+                chunk_number=index + 2,
+                original_content=content_text,
+                topic_info=topic.model_dump_json(),
+                current_theme=theme.model_dump_json(),
+                teacher_name=self.teacher["name"],
+                teacher_personality=self.teacher["personality"],
+                student_name=self.student["name"],
+                student_personality=self.student["personality"],
+                dialogue_style=self.dialogue_style,
+                covered_points="\n".join(f"- {point}" for point in covered),
+                recent_dialogue="\n".join(recent[-8:]),
+                remaining_points="\n".join(f"- {point}" for point in remaining)
+                or "（残りのポイントはありません。まとめに入ってください）",
+                min_exchanges=self.min_exchanges_per_chunk,
+            )
+            self.logger.info(
+                f"Continuing dialogue for {theme.title} "
+                f"(chunk {index + 2}, {len(remaining)} points remaining)"
+            )
+
+        return responses, chunks
+
+    def _remaining_key_points(
+        self, key_points: List[str], covered: List[str]
+    ) -> List[str]:
+        """トピックの重要ポイントのうち、まだカバーされていないもの"""
+        covered_texts = [c.rstrip(".").strip() for c in covered]
+        return [
+            point
+            for point in key_points
+            if not any(point in c or (c and c in point) for c in covered_texts)
+        ]
+
+    def _merge_dialogue_chunks(
+        self, chunks: List[Optional[DialogueChunk]]
+    ) -> DialogueChunk:
+        """複数チャンクの対話を一つにまとめる"""
+        if not chunks or any(chunk is None for chunk in chunks):
+            raise ValueError("Dialogue contains chunks that could not be parsed")
+        if len(chunks) == 1:
+            return chunks[0]
+
+        key_points: List[str] = []
+        for chunk in chunks:
+            key_points.extend(
+                point for point in chunk.key_points_covered if point not in key_points
+            )
+        return DialogueChunk(
+            thinking=chunks[0].thinking,
+            content="\n\n".join(chunk.content for chunk in chunks),
+            dialogue="\n".join(chunk.dialogue for chunk in chunks),
+            requires_continuation=chunks[-1].requires_continuation,
+            key_points_covered=key_points,
+        )
+
+    @traced("format.dialogue", "format")
+    def _format_structured_dialogue(self, dialogue: DialogueChunk) -> str:
+        """対話チャンクをMarkdown形式に整形"""
+        lines = [
+            "# 対話",
+            "## 考察",
+            dialogue.thinking,
+            "## 内容",
+            dialogue.content,
+            "## 対話内容",
+            dialogue.dialogue,
+            "## カバーされたポイント",
+            "\n".join(f"- {point}" for point in dialogue.key_points_covered),
+        ]
+        return "\n\n".join(lines)
+
+    async def _extract_topic(
+        self,
+        theme: Any,
+        content_text: str,
+        structure_text: str,
+        context: Optional[CachedContext] = None,
+    ) -> Optional[Topic]:
+        """テーマからトピックを抽出"""
+        topic_prompt = TOPIC_EXTRACTION_PROMPT.format(
+            content=content_text,
+            main_theme=theme.title,
+            structure=structure_text,
+        )
+
+        self.logger.debug(f"Generated topic prompt for theme: {theme.title}")
+
+        def parse(response: str) -> Optional[Topic]:
+            return self._parse_topic(response, theme.title)
+
+        topic = await self._generate_with_retry(
+            topic_prompt, STAGE_TOPIC, context=context, theme=theme.title, parse=parse
+        )
+
+        # パース・検証に失敗した場合はGEMINI_MODELで生成し直す
+        if topic is None and self._can_escalate(STAGE_TOPIC):
+            self.logger.warning(
+                f"Escalating topic extraction for {theme.title} to {self.model_name}"
+            )
+            topic = await self._generate_with_retry(
+                topic_prompt,
+                STAGE_TOPIC,
+                context=context,
+                theme=theme.title,
+                escalate=True,
+                parse=parse,
+            )
+        return topic
+
+    def _prefetch_topics(
+        self,
+        themes: List[Any],
+        indices: List[int],
+        content: str,
+        sections: List[Section],
+        index: Optional[SectionIndex],
+        structure: Any,
+        context: Optional[CachedContext] = None,
+    ) -> None:
+        """
+        TOPIC_BATCH_SIZE件ずつのテーマのトピックを一度の呼び出しで抽出し始める
+
+        グループごとのタスクを各テーマの先行抽出として登録するため、_process_themeは
+        自分のグループの完了だけを待ち、他のグループの抽出中に対話生成を始められる。
+        検証を通ったトピックだけをジャーナルに記録するため、残りのテーマは_process_themeで
+        個別に抽出される。indicesは構造情報の中での各テーマの位置。
+        """
+        if self.topic_batch_size <= 0 or self.journal is None:
+            return
+        targets = [
+            (journal_key(index, theme), theme) for theme, index in zip(themes, indices)
+        ]
+        targets = [
+            (key, theme)
+            for key, theme in targets
+            if key not in self._early_topics and self.journal.get_topic(key) is None
+        ]
+        if len(targets) <= 1:
+            return
+
+        groups = [
+            targets[i : i + self.topic_batch_size]
+            for i in range(0, len(targets), self.topic_batch_size)
+        ]
+        for priority, group in enumerate(groups):
+            keys = [key for key, _ in group]
+            group_themes = [theme for _, theme in group]
+            if context is not None:
+                content_text = CACHED_CONTENT_REFERENCE
+                structure_text = CACHED_STRUCTURE_REFERENCE
+            else:
+                content_text = self._group_content(
+                    group_themes, content, sections, index
+                )
+                structure_text = structure.model_dump_json()
+            task = asyncio.ensure_future(
+                self._extract_topic_group(
+                    priority, group_themes, keys, content_text, structure_text, context
+                )
+            )
+            for key in keys:
+                self._early_topics[key] = task
+
+    async def _extract_topic_group(
+        self,
+        priority: int,
+        themes: List[Any],
+        keys: List[str],
+        content_text: str,
+        structure_text: str,
+        context: Optional[CachedContext] = None,
+    ) -> None:
+        """グループのトピック抽出をトピック抽出の実行枠で実行"""
+        with self.tracer.track(f"topic.batch {priority + 1}"):
+            with self.tracer.span("topic.batch", count=len(themes)):
+                async with self._stage_slot(STAGE_TOPIC, priority):
+                    await self._extract_topic_batch(
+                        themes, keys, content_text, structure_text, context
+                    )
+
+    async def _extract_topic_batch(
+        self,
+        themes: List[Any],
+        keys: List[str],
+        content_text: str,
+        structure_text: str,
+        context: Optional[CachedContext] = None,
+    ) -> None:
+        """複数テーマのトピックを抽出し、検証を通ったものをジャーナルのkeysに記録"""
+        topic_prompt = TOPIC_BATCH_EXTRACTION_PROMPT.format(
+            content=content_text,
+            structure=structure_text,
+            main_themes="\n".join(f"- {theme.title}" for theme in themes),
+        )
+
+        def parse(response: str) -> Dict[str, Topic]:
+            with self.tracer.span("parse.topic_batch", "parse", count=len(themes)):
+                return self.content_processor.parse_topic_batch(response)
+
+        try:
+            topics = await self._generate_with_retry(
+                topic_prompt, STAGE_TOPIC_BATCH, context=context, parse=parse
+            )
+        except BudgetExceededError:
+            raise
+        except Exception as e:
+            # テーマごとの抽出にそのまま任せる
+            self.logger.warning(f"Batched topic extraction failed: {e}")
+            return
+
+        extracted = 0
+        for theme, key in zip(themes, keys):
+            topic = topics.get(theme.title)
+            if topic is not None and self._validate_topic(topic):
+                self.journal.record_topic(key, topic)
+                extracted += 1
+        self.logger.info(
+            f"Extracted {extracted}/{len(themes)} topics in one call"
+            + (", extracting the rest per theme" if extracted < len(themes) else "")
+        )
+
+    def _parse_topic(self, topic_response: str, theme_title: str) -> Optional[Topic]:
+        """トピック抽出の応答を解析・検証（失敗した場合はNone）"""
+        self.logger.debug(
+            f"Raw topic response: {topic_response[:200]}..."
+        )  # 最初の200文字のみログ出力
+
+        # ContentAnalysisProcessorを使ってトピックとして解析
+        try:
+            with self.tracer.span("parse.topic", "parse", theme=theme_title):
+                topic = self.content_processor.parse(topic_response)
+            if not isinstance(topic, Topic):
+                self.logger.error(f"Invalid topic data type: {type(topic)}")
+                return None
+            if not self._validate_topic(topic):
+                return None
+
+            self.logger.info(f"Successfully parsed topic: {topic.title}")
+            return topic
+
+        except Exception as e:
+            self.logger.error(f"Error parsing topic data: {str(e)}")
+            self.logger.debug(f"Parse error details: {type(e).__name__}: {str(e)}")
+            return None
+
+    def _validate_topic(self, topic: Topic) -> bool:
+        """トピックの基本検証"""
+        if not hasattr(topic, "title") or not topic.title:
+            self.logger.error("Invalid topic: missing title")
+            return False
+
+        if not hasattr(topic, "learning_objectives") or not topic.learning_objectives:
+            self.logger.error("Invalid topic: missing learning objectives")
+            return False
+
+        return True
+
+    @traced("format.topic", "format")
     def _format_topic_content(self, topic: Topic) -> str:
         """トピックの内容をMarkdown形式に整形"""
         try:
@@ -478,6 +1698,7 @@ class LessonGenerator:
 
         return "\n".join(lines)
 
+    @traced("read", "io")
     def _read_input_file(self, file_path: str) -> str:
         """入力ファイルの読み込み"""
         try:
@@ -491,6 +1712,7 @@ class LessonGenerator:
             self.logger.error(f"Failed to read input file: {e}")
             raise
 
+    @traced("write", "io")
     def _write_output(self, path: str, content: str) -> None:
         """出力ファイルの書き込み"""
         try:
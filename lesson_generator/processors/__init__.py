@@ -1,11 +1,12 @@
 """Content processors for lesson generation."""
 
-from .content import ContentAnalysisProcessor
+from .content import ContentAnalysisProcessor, ThemeStreamParser
 from .dialogue import DialogueProcessor
 from .validation import ValidationProcessor
 
 __all__ = [
     "ContentAnalysisProcessor",
+    "ThemeStreamParser",
     "DialogueProcessor",
     "ValidationProcessor",
 ]
@@ -2,10 +2,10 @@
 
 import json
 import logging
-from typing import Any, Dict, Union
+from typing import Any, Dict, List, Optional, Union
 
 from ..core.base import PromptParser
-from ..core.models import ContentStructure, Topic
+from ..core.models import ContentStructure, Theme, Topic
 
 logger = logging.getLogger(__name__)
 
@@ -27,8 +27,10 @@ class ContentAnalysisProcessor(PromptParser):
             ValueError: パースに失敗した場合
         """
         try:
-            # JSONの抽出
-            json_content = self._extract_json(output)
+            # JSONの抽出（オブジェクトを優先し、無ければクリーニングして読み直す）
+            json_content = self._extract_json(
+                output, lambda data: isinstance(data, dict)
+            )
             if not json_content:
                 raise ValueError("No JSON content found in output")
 
@@ -45,6 +47,46 @@ class ContentAnalysisProcessor(PromptParser):
             logger.error(f"Error in content analysis: {str(e)}")
             raise ValueError(f"Content analysis failed: {str(e)}")
 
+    def parse_topic_batch(self, output: str) -> Dict[str, Topic]:
+        """
+        トピック一括抽出の出力をパースし、テーマ名ごとのTopicモデルに変換
+
+        変換できなかった項目は含めない（呼び出し側でテーマごとに抽出し直す）。
+
+        Args:
+            output (str): パース対象の出力テキスト
+
+        Returns:
+            Dict[str, Topic]: テーマ名とトピックの対応
+
+        Raises:
+            ValueError: 出力全体のパースに失敗した場合
+        """
+        try:
+            json_content = self._extract_json(
+                output, lambda data: isinstance(data, (dict, list))
+            )
+            if not json_content:
+                raise ValueError("No JSON content found in output")
+            data = self._parse_json_safely(json_content)
+            items = data.get("topics") if isinstance(data, dict) else data
+            if not isinstance(items, list):
+                raise ValueError("Topic batch does not contain a list of topics")
+        except Exception as e:
+            logger.error(f"Error in topic batch: {str(e)}")
+            raise ValueError(f"Topic batch parsing failed: {str(e)}")
+
+        topics: Dict[str, Topic] = {}
+        for item in items:
+            if not isinstance(item, dict) or not item.get("theme"):
+                continue
+            theme = item.pop("theme")
+            try:
+                topics[theme] = self._convert_to_topic(item)
+            except Exception as e:
+                logger.warning(f"Skipping invalid topic for {theme}: {str(e)}")
+        return topics
+
     def _parse_json_safely(self, json_str: str) -> Dict[str, Any]:
         """JSONを安全にパースする"""
         try:
@@ -97,3 +139,93 @@ class ContentAnalysisProcessor(PromptParser):
         )
 
         return cleaned
+
+
+class ThemeStreamParser:
+    """
+    ストリーミング中のコンテンツ分析の出力から、閉じたmain_themesの要素を順に取り出すパーサー
+
+    受信済みのテキストを渡すたびに前回の続きから走査し、新たに閉じたテーマだけを返す。
+    文字列中の括弧やエスケープは無視する。
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        self._text = ""
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_key: Optional[str] = None
+        self._themes_depth: Optional[int] = None  # main_themes配列の深さ
+        self._item_start: Optional[int] = None
+
+    def update(self, text: str) -> List[Theme]:
+        """
+        受信済みのテキスト全体を渡し、新たに閉じたテーマを返す
+
+        前回のテキストの続きでない場合（再試行など）は最初から走査し直す。
+
+        Args:
+            text (str): これまでに受信したテキスト
+
+        Returns:
+            List[Theme]: 今回新たに取り出せたテーマ
+        """
+        if not text.startswith(self._text):
+            self.reset()
+        start = len(self._text)
+        self._text = text
+
+        themes = []
+        for i in range(start, len(text)):
+            char = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if len(self._stack) == 1:
+                        # 最上位のオブジェクトのキー（または値）
+                        self._last_key = text[self._string_start : i]
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = i + 1
+            elif char in "{[":
+                if (
+                    char == "["
+                    and len(self._stack) == 1
+                    and self._last_key == "main_themes"
+                ):
+                    self._themes_depth = 2
+                self._stack.append(char)
+                if char == "{" and self._themes_depth == len(self._stack) - 1:
+                    self._item_start = i
+            elif char in "}]":
+                if self._stack:
+                    self._stack.pop()
+                if self._themes_depth is None:
+                    continue
+                if char == "}" and self._item_start is not None:
+                    if len(self._stack) == self._themes_depth:
+                        theme = self._parse_theme(text[self._item_start : i + 1])
+                        if theme is not None:
+                            themes.append(theme)
+                        self._item_start = None
+                elif char == "]" and len(self._stack) < self._themes_depth:
+                    self._themes_depth = None
+        return themes
+
+    @staticmethod
+    def _parse_theme(text: str) -> Optional[Theme]:
+        try:
+            return Theme.parse_obj(json.loads(text))
+        except Exception as e:
+            logger.debug(f"Skipping incomplete streamed theme: {str(e)}")
+            return None
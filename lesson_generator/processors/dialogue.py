@@ -2,11 +2,11 @@
 
 import json
 import logging
-import re
-from typing import Dict, List
+from typing import List
 
 from ..core.base import PromptParser
 from ..core.models import DialogueChunk, DialogueMessage
+from ..core.tokenizer import TokenizedOutput, split_list_items
 
 logger = logging.getLogger(__name__)
 
@@ -33,7 +33,10 @@ class DialogueProcessor(PromptParser):
         """
         try:
             # まずJSONとしてのパースを試みる
-            json_content = self._extract_json(output)
+            # 対話中の括弧を誤って拾わないよう、JSONとしてパースできる部分だけを使う
+            json_content = self._extract_json(
+                output, lambda data: isinstance(data, dict), fallback=False
+            )
             if json_content:
                 return self._parse_json_data(json_content)
 
@@ -125,17 +128,19 @@ class DialogueProcessor(PromptParser):
 
     def _parse_text_output(self, text: str) -> DialogueChunk:
         """テキスト形式の出力をパース"""
+        # タグ・見出し・マーカーを一度の走査でまとめて抽出
+        tokens = TokenizedOutput.from_text(text)
+
         # タグベースのセクション抽出
-        thinking = self._extract_tag_content(text, "thinking")
-        content = self._extract_tag_content(text, "content")
-        dialogue = self._extract_tag_content(text, "dialogue")
+        thinking = tokens.tag("thinking")
+        content = tokens.tag("content")
+        dialogue = tokens.tag("dialogue")
 
         if not all([thinking, content, dialogue]):
             # タグが見つからない場合はセクションベースで抽出
-            sections = self._split_into_sections(text)
-            thinking = thinking or sections.get("thinking", "")
-            content = content or sections.get("content", "")
-            dialogue = dialogue or sections.get("dialogue", "")
+            thinking = thinking or tokens.sections.get("thinking", "")
+            content = content or tokens.sections.get("content", "")
+            dialogue = dialogue or tokens.sections.get("dialogue", "")
 
         # 必須フィールドの検証
         if not all([thinking, content, dialogue]):
@@ -153,10 +158,10 @@ class DialogueProcessor(PromptParser):
             raise ValueError("Invalid dialogue format")
 
         # 継続フラグの判定
-        requires_continuation = self._determine_continuation_status(text)
+        requires_continuation = tokens.continuation()
 
         # カバーされたポイントの抽出
-        key_points = self._extract_key_points(text)
+        key_points = self._extract_key_points(tokens)
 
         return DialogueChunk(
             thinking=thinking,
@@ -166,32 +171,6 @@ class DialogueProcessor(PromptParser):
             key_points_covered=key_points,
         )
 
-    def _extract_tag_content(self, text: str, tag: str) -> str:
-        """指定されたタグの内容を抽出"""
-        pattern = f"<{tag}>(.*?)</{tag}>"
-        matches = re.findall(pattern, text, re.DOTALL)
-        return matches[0].strip() if matches else ""
-
-    def _split_into_sections(self, text: str) -> Dict[str, str]:
-        """テキストをセクションに分割"""
-        sections = {}
-        current_section = None
-        current_content = []
-
-        for line in text.split("\n"):
-            if line.strip().startswith("#"):
-                if current_section:
-                    sections[current_section] = "\n".join(current_content).strip()
-                current_section = line.lstrip("#").strip().lower()
-                current_content = []
-            elif current_section:
-                current_content.append(line)
-
-        if current_section:
-            sections[current_section] = "\n".join(current_content).strip()
-
-        return sections
-
     def _is_valid_dialogue_format(self, text: str) -> bool:
         """対話形式の妥当性チェック"""
         # 最低2回以上の対話があることを確認
@@ -215,41 +194,20 @@ class DialogueProcessor(PromptParser):
         speaker, content = parts
         return bool(speaker.strip() and content.strip())
 
-    def _determine_continuation_status(self, text: str) -> bool:
-        """継続フラグの判定"""
-        if re.search(r"<CONTINUE>", text, re.IGNORECASE):
-            return True
-        if re.search(r"<END>", text, re.IGNORECASE):
-            return False
-        return True
-
-    def _extract_key_points(self, text: str) -> List[str]:
+    def _extract_key_points(self, tokens: TokenizedOutput) -> List[str]:
         """カバーされたポイントの抽出"""
         points = []
 
         # タグベースの抽出
-        tag_content = self._extract_tag_content(text, "key_points")
+        tag_content = tokens.tag("key_points")
         if tag_content:
-            points.extend(self._parse_list_items(tag_content))
+            points.extend(split_list_items(tag_content))
 
         # セクションベースの抽出
-        sections = self._split_into_sections(text)
-        if "key_points" in sections:
-            points.extend(self._parse_list_items(sections["key_points"]))
+        points.extend(tokens.section_items.get("key_points", []))
 
         return self._normalize_key_points(points)
 
-    def _parse_list_items(self, text: str) -> List[str]:
-        """リストアイテムの抽出"""
-        items = []
-        for line in text.split("\n"):
-            line = line.strip()
-            if line.startswith(("-", "*", "•", "·")):
-                item = line[1:].strip()
-                if item:
-                    items.append(item)
-        return items
-
     def _normalize_key_points(self, points: List[str]) -> List[str]:
         """キーポイントの正規化"""
         normalized = list(set(point.strip() for point in points if point.strip()))
@@ -3,13 +3,29 @@
 import json
 import logging
 import re
-from typing import Dict, List, Tuple
+from typing import List, Tuple
 
 from ..core.base import PromptParser
 from ..core.models import ValidationResult
+from ..core.tokenizer import TokenizedOutput, split_list_items
 
 logger = logging.getLogger(__name__)
 
+# 明示的な結果表明（最後のグループが結果）
+_RESULT_PATTERNS = [
+    re.compile(
+        r"(検証結果|validation\s+result)[:：]\s*(成功|失敗|passed|failed)",
+        re.IGNORECASE | re.MULTILINE,
+    ),
+    re.compile(
+        r"(is_valid|valid|結果)[:：]?\s*(true|false|yes|no|はい|いいえ)",
+        re.IGNORECASE | re.MULTILINE,
+    ),
+    re.compile(r"^(成功|失敗|passed|failed)$", re.IGNORECASE | re.MULTILINE),
+]
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+_LIST_MARKER_PATTERN = re.compile(r"^[-*•·]\s*")
+
 
 class ValidationProcessor(PromptParser):
     """検証結果の出力をパースしてPydanticモデルに変換するプロセッサ"""
@@ -56,7 +72,9 @@ class ValidationProcessor(PromptParser):
         """
         try:
             # まずJSONとしてのパースを試みる
-            json_content = self._extract_json(output)
+            json_content = self._extract_json(
+                output, lambda data: isinstance(data, dict), fallback=False
+            )
             if json_content:
                 return self._parse_json_data(json_content)
 
@@ -88,29 +106,29 @@ class ValidationProcessor(PromptParser):
 
     def _parse_text_output(self, text: str) -> ValidationResult:
         """テキスト形式の出力をパース"""
-        # セクション分割
-        sections = self._split_into_sections(text)
+        # タグ・見出し・リスト項目を一度の走査でまとめて抽出
+        tokens = TokenizedOutput.from_text(text, include_text=True)
 
         # 結果の判定
-        is_valid = self._determine_validation_result(text, sections)
+        is_valid = self._determine_validation_result(text)
 
         # エラーと警告の抽出
         errors = []
         warnings = []
 
         # タグベースの抽出
-        errors.extend(self._extract_tagged_messages(text, "errors"))
-        warnings.extend(self._extract_tagged_messages(text, "warnings"))
+        errors.extend(self._extract_tagged_messages(tokens, "errors"))
+        warnings.extend(self._extract_tagged_messages(tokens, "warnings"))
 
         # セクションベースの抽出
-        if not errors and "errors" in sections:
-            errors.extend(self._extract_list_items(sections["errors"]))
-        if not warnings and "warnings" in sections:
-            warnings.extend(self._extract_list_items(sections["warnings"]))
+        if not errors:
+            errors.extend(tokens.section_items.get("errors", []))
+        if not warnings:
+            warnings.extend(tokens.section_items.get("warnings", []))
 
         # キーワードベースの分類
         if not errors and not warnings:
-            errors, warnings = self._classify_messages(text)
+            errors, warnings = self._classify_messages(tokens.lines)
 
         return ValidationResult(
             is_valid=is_valid,
@@ -118,49 +136,35 @@ class ValidationProcessor(PromptParser):
             warnings=self._normalize_messages(warnings),
         )
 
-    def _determine_validation_result(self, text: str, sections: Dict[str, str]) -> bool:
+    def _determine_validation_result(self, text: str) -> bool:
         """検証結果の判定"""
         # 明示的な結果表明を探す
-        result_patterns = [
-            r"(検証結果|validation\s+result)[:：]\s*(成功|失敗|passed|failed)",
-            r"(is_valid|valid|結果)[:：]?\s*(true|false|yes|no|はい|いいえ)",
-            r"^(成功|失敗|passed|failed)$",
-        ]
-
-        text_lower = text.lower()
-        for pattern in result_patterns:
-            match = re.search(pattern, text, re.IGNORECASE | re.MULTILINE)
+        for pattern in _RESULT_PATTERNS:
+            match = pattern.search(text)
             if match:
-                result = match.group(2).lower()
+                result = match.group(match.lastindex).lower()
                 return result in {"成功", "passed", "true", "yes", "はい"}
 
         # エラーメッセージの有無で判定
+        text_lower = text.lower()
         has_errors = any(keyword in text_lower for keyword in self.error_keywords)
 
         return not has_errors
 
-    def _extract_tagged_messages(self, text: str, tag: str) -> List[str]:
+    def _extract_tagged_messages(self, tokens: TokenizedOutput, tag: str) -> List[str]:
         """タグ付きメッセージの抽出"""
-        pattern = f"<{tag}>(.*?)</{tag}>"
-        matches = re.findall(pattern, text, re.DOTALL)
-
         messages = []
-        for match in matches:
-            messages.extend(self._extract_list_items(match))
+        for content in tokens.tags.get(tag, []):
+            messages.extend(split_list_items(content, include_text=True))
 
         return messages
 
-    def _classify_messages(self, text: str) -> Tuple[List[str], List[str]]:
-        """メッセージの分類"""
-        lines = text.split("\n")
+    def _classify_messages(self, lines: List[str]) -> Tuple[List[str], List[str]]:
+        """メッセージの分類（見出しと空行を除いた行が対象）"""
         errors = []
         warnings = []
 
         for line in lines:
-            line = line.strip()
-            if not line or line.startswith("#"):
-                continue
-
             line_lower = line.lower()
             if any(keyword in line_lower for keyword in self.error_keywords):
                 errors.append(line)
@@ -176,45 +180,12 @@ class ValidationProcessor(PromptParser):
 
         for msg in messages:
             # 基本的なクリーニング
-            cleaned = re.sub(r"\s+", " ", msg).strip()
+            cleaned = _WHITESPACE_PATTERN.sub(" ", msg).strip()
             # 先頭の記号を削除
-            cleaned = re.sub(r"^[-*•·]\s*", "", cleaned)
+            cleaned = _LIST_MARKER_PATTERN.sub("", cleaned)
 
             if cleaned and cleaned not in seen:
                 seen.add(cleaned)
                 normalized.append(cleaned)
 
         return normalized
-
-    def _split_into_sections(self, text: str) -> Dict[str, str]:
-        """テキストをセクションに分割"""
-        sections = {}
-        current_section = None
-        current_content = []
-
-        for line in text.split("\n"):
-            if line.strip().startswith("#"):
-                if current_section:
-                    sections[current_section] = "\n".join(current_content).strip()
-                current_section = line.lstrip("#").strip().lower()
-                current_content = []
-            elif current_section:
-                current_content.append(line)
-
-        if current_section:
-            sections[current_section] = "\n".join(current_content).strip()
-
-        return sections
-
-    def _extract_list_items(self, text: str) -> List[str]:
-        """リストアイテムの抽出"""
-        items = []
-        for line in text.split("\n"):
-            line = line.strip()
-            if line.startswith(("-", "*", "•", "·")):
-                item = re.sub(r"^[-*•·]\s*", "", line)
-                if item:
-                    items.append(item)
-            elif line and not line.startswith("#"):
-                items.append(line)
-        return items
@@ -0,0 +1,61 @@
+"""Runtime components for calling the Gemini API."""
+
+from .accounting import BudgetExceededError, CallRecord, TokenUsage, UsageTracker
+from .context_cache import CachedContext, GeminiContextCache, LocalContextCache
+from .endpoints import Endpoint, EndpointPool, key_fingerprint
+from .hedging import HedgingPolicy
+from .profiles import (
+    STAGE_ANALYSIS,
+    STAGE_DIALOGUE,
+    STAGE_TOPIC,
+    STAGE_TOPIC_BATCH,
+    STAGE_VALIDATION,
+    GenerationProfile,
+    build_generation_profiles,
+)
+from .rate_limit import RateLimiter, TokenBucket, get_rate_limiter
+from .replay import RecordingTransport, ReplayMissError, ReplayTransport
+from .response_cache import ResponseCache
+from .retry import RetryBudget, RetryPolicy, get_retry_after, is_retryable
+from .scheduler import StageConfig, StageScheduler
+from .tokens import estimate_tokens
+from .tracing import Tracer, traced
+from .transport import GeminiTransport
+
+__all__ = [
+    "BudgetExceededError",
+    "CallRecord",
+    "TokenUsage",
+    "UsageTracker",
+    "CachedContext",
+    "GeminiContextCache",
+    "LocalContextCache",
+    "Endpoint",
+    "EndpointPool",
+    "key_fingerprint",
+    "HedgingPolicy",
+    "GenerationProfile",
+    "build_generation_profiles",
+    "STAGE_ANALYSIS",
+    "STAGE_DIALOGUE",
+    "STAGE_TOPIC",
+    "STAGE_TOPIC_BATCH",
+    "STAGE_VALIDATION",
+    "RateLimiter",
+    "TokenBucket",
+    "get_rate_limiter",
+    "RecordingTransport",
+    "ReplayMissError",
+    "ReplayTransport",
+    "ResponseCache",
+    "RetryBudget",
+    "RetryPolicy",
+    "get_retry_after",
+    "is_retryable",
+    "StageConfig",
+    "StageScheduler",
+    "estimate_tokens",
+    "Tracer",
+    "traced",
+    "GeminiTransport",
+]
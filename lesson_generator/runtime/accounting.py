@@ -0,0 +1,174 @@
+"""Token and latency accounting for generation calls."""
+
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional
+
+BUDGET_ABORT = "abort"
+BUDGET_DOWNGRADE = "downgrade"
+
+
+class BudgetExceededError(RuntimeError):
+    """レッスンのトークン予算を超えた場合のエラー"""
+
+
+@dataclass
+class TokenUsage:
+    """1回のAPI呼び出しのトークン数（usage_metadataが無い場合は推定値）と使われたモデル"""
+
+    prompt_tokens: int = 0
+    output_tokens: int = 0
+    estimated: bool = True
+    # エンドポイントの指定を反映した、実際に呼び出したモデル
+    model: Optional[str] = None
+    # 送信したリクエスト数（重複リクエストや別のエンドポイントへのやり直しを含む）
+    requests: int = 1
+
+    def update_from_response(self, response: Any) -> None:
+        """レスポンスのusage_metadataがあれば実測値で上書き"""
+        metadata = getattr(response, "usage_metadata", None)
+        prompt_tokens = getattr(metadata, "prompt_token_count", None)
+        output_tokens = getattr(metadata, "candidates_token_count", None)
+        if isinstance(prompt_tokens, int) and isinstance(output_tokens, int):
+            self.prompt_tokens = prompt_tokens
+            self.output_tokens = output_tokens
+            self.estimated = False
+
+    def merge(
+        self, requests: List["TokenUsage"], winner: Optional["TokenUsage"] = None
+    ) -> None:
+        """
+        重複リクエストなどを含め、1回の呼び出しで送ったリクエストのトークン数を合算
+
+        負けた方や失敗した方のリクエストも課金されうるため、送信済みのものはすべて含める。
+        モデルは採用したリクエスト（無ければ最後に送ったもの）のものにする。
+        """
+        sent = [request for request in requests if request.prompt_tokens]
+        self.prompt_tokens = sum(request.prompt_tokens for request in sent)
+        self.output_tokens = sum(request.output_tokens for request in sent)
+        self.estimated = any(request.estimated for request in sent)
+        self.requests = max(1, len(sent))
+        chosen = winner or (sent[-1] if sent else None)
+        if chosen is not None and chosen.model:
+            self.model = chosen.model
+
+
+@dataclass
+class CallRecord:
+    """_generate_with_retryの呼び出し1回分の記録"""
+
+    stage: str
+    theme: Optional[str]
+    prompt_tokens: int
+    output_tokens: int
+    latency: float
+    attempts: int
+    estimated: bool = True
+    cached: bool = False
+    error: Optional[str] = None
+    model: Optional[str] = None
+    # 重複リクエストや別のエンドポイントへのやり直しで、試行とは別に送ったリクエスト数
+    extra_requests: int = 0
+
+    def add_attempt(self, usage: TokenUsage, latency: float) -> None:
+        """試行1回分のトークン数を加算（失敗・中断した試行の分も含める）"""
+        self.prompt_tokens += usage.prompt_tokens
+        self.output_tokens += usage.output_tokens
+        self.estimated = self.estimated or usage.estimated
+        self.latency = latency
+        self.attempts += 1
+        self.extra_requests += usage.requests - 1
+        if usage.model:
+            self.model = usage.model
+
+
+class UsageTracker:
+    """
+    レッスン単位でAPI使用量を集計し、予算を管理する
+
+    max_tokensが0の場合は予算を設けない。予算を超えた後の動作はbudget_actionで決まり、
+    abortの場合は以降の呼び出しをBudgetExceededErrorで中止し、
+    downgradeの場合は対話の続きの生成など任意の呼び出しだけを省略する。
+    """
+
+    def __init__(self, max_tokens: int = 0, budget_action: str = BUDGET_ABORT):
+        self.max_tokens = max_tokens
+        self.budget_action = budget_action
+        self.records: List[CallRecord] = []
+        self.started = time.monotonic()
+
+    def record(self, record: CallRecord) -> None:
+        self.records.append(record)
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(r.prompt_tokens + r.output_tokens for r in self.records)
+
+    @property
+    def exceeded(self) -> bool:
+        return self.max_tokens > 0 and self.total_tokens >= self.max_tokens
+
+    @property
+    def downgraded(self) -> bool:
+        """予算超過により任意の呼び出しを省略する状態かどうか"""
+        return self.exceeded and self.budget_action == BUDGET_DOWNGRADE
+
+    def check_budget(self, stage: str) -> None:
+        """
+        新しい呼び出しの前に予算を確認
+
+        Raises:
+            BudgetExceededError: abortモードで予算を超えている場合
+        """
+        if self.exceeded and self.budget_action == BUDGET_ABORT:
+            raise BudgetExceededError(
+                f"Token budget exceeded before {stage} call: "
+                f"{self.total_tokens}/{self.max_tokens} tokens"
+            )
+
+    def totals(self) -> Dict[str, int]:
+        """バッチの集計用の合計値"""
+        return {
+            "requests": sum(r.attempts + r.extra_requests for r in self.records),
+            "prompt_tokens": sum(r.prompt_tokens for r in self.records),
+            "output_tokens": sum(r.output_tokens for r in self.records),
+        }
+
+    @staticmethod
+    def _aggregate(records: List[CallRecord]) -> Dict[str, Any]:
+        return {
+            "calls": len(records),
+            "attempts": sum(r.attempts for r in records),
+            "extra_requests": sum(r.extra_requests for r in records),
+            "cache_hits": sum(r.cached for r in records),
+            "errors": sum(r.error is not None for r in records),
+            "prompt_tokens": sum(r.prompt_tokens for r in records),
+            "output_tokens": sum(r.output_tokens for r in records),
+            "estimated_calls": sum(r.estimated and not r.cached for r in records),
+            "latency_seconds": sum(r.latency for r in records),
+            "max_latency_seconds": max((r.latency for r in records), default=0.0),
+        }
+
+    def _group(self, attribute: str) -> Dict[str, Dict[str, Any]]:
+        groups: Dict[str, List[CallRecord]] = {}
+        for record in self.records:
+            key = getattr(record, attribute)
+            if key is not None:
+                groups.setdefault(key, []).append(record)
+        return {key: self._aggregate(records) for key, records in groups.items()}
+
+    def report(self) -> Dict[str, Any]:
+        """ステージ別・テーマ別・モデル別の集計を含む実行レポート"""
+        return {
+            "elapsed_seconds": time.monotonic() - self.started,
+            "budget": {
+                "max_tokens": self.max_tokens,
+                "action": self.budget_action,
+                "exceeded": self.exceeded,
+            },
+            "total": self._aggregate(self.records),
+            "stages": self._group("stage"),
+            "themes": self._group("theme"),
+            "models": self._group("model"),
+            "calls": [asdict(r) for r in self.records],
+        }
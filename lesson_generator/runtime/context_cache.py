@@ -0,0 +1,93 @@
+"""Caching of the shared source context across per-theme prompts."""
+
+import asyncio
+import hashlib
+import logging
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Any, Dict, Optional
+
+import google.generativeai as genai
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CachedContext:
+    """キャッシュ済みコンテキストへの参照"""
+
+    key: str
+    text: str
+    name: Optional[str] = None  # Gemini側のキャッシュ名（ローカルの場合はNone）
+    handle: Any = field(default=None, compare=False, repr=False)
+
+    @property
+    def is_remote(self) -> bool:
+        return self.name is not None
+
+
+class LocalContextCache:
+    """オフライン用のコンテキストキャッシュ
+
+    コンテキストはプロセス内に保持し、呼び出し時にプロンプトの先頭へ展開する。
+    """
+
+    def __init__(self):
+        self._contexts: Dict[str, CachedContext] = {}
+
+    async def get_or_create(self, text: str) -> Optional[CachedContext]:
+        """テキストに対応するコンテキストを取得（無ければ作成）"""
+        key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        context = self._contexts.get(key)
+        if context is None:
+            context = CachedContext(key=key, text=text)
+            self._contexts[key] = context
+        return context
+
+    async def release(self, context: CachedContext) -> None:
+        """コンテキストを破棄"""
+        self._contexts.pop(context.key, None)
+
+
+class GeminiContextCache(LocalContextCache):
+    """Gemini APIのコンテキストキャッシュ
+
+    作成に失敗した場合（トークン数が最小サイズ未満など）はNoneを返し、
+    呼び出し側は従来通りプロンプトに全文を埋め込む。
+    """
+
+    def __init__(self, model_name: str, ttl_seconds: int = 3600):
+        super().__init__()
+        self.model_name = model_name
+        self.ttl = timedelta(seconds=ttl_seconds)
+
+    async def get_or_create(self, text: str) -> Optional[CachedContext]:
+        key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        context = self._contexts.get(key)
+        if context is not None:
+            return context
+
+        try:
+            cached = await asyncio.to_thread(
+                genai.caching.CachedContent.create,
+                model=self.model_name,
+                display_name=f"lesson-source-{key[:16]}",
+                contents=[text],
+                ttl=self.ttl,
+            )
+        except Exception as e:
+            logger.warning(f"Context caching unavailable, sending inline: {e}")
+            return None
+
+        context = CachedContext(key=key, text=text, name=cached.name, handle=cached)
+        self._contexts[key] = context
+        logger.info(f"Created cached context: {cached.name}")
+        return context
+
+    async def release(self, context: CachedContext) -> None:
+        await super().release(context)
+        if context.handle is not None:
+            try:
+                await asyncio.to_thread(context.handle.delete)
+            except Exception as e:
+                logger.warning(f"Failed to delete cached context {context.name}: {e}")
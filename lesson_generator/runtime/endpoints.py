@@ -0,0 +1,167 @@
+"""Pool of API keys and models with health-based routing."""
+
+import hashlib
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, List, Optional
+
+from google.ai import generativelanguage as glm
+from google.api_core import client_options as client_options_lib
+from google.api_core import exceptions as api_exceptions
+
+from .rate_limit import RateLimiter
+from .retry import get_retry_after
+
+logger = logging.getLogger(__name__)
+
+# キーそのものが無効な場合のエラー（長めに切り離す）
+_CREDENTIAL_ERRORS = (
+    api_exceptions.PermissionDenied,
+    api_exceptions.Unauthenticated,
+    api_exceptions.Forbidden,
+    api_exceptions.Unauthorized,
+)
+_QUOTA_ERRORS = (api_exceptions.ResourceExhausted, api_exceptions.TooManyRequests)
+
+
+def key_fingerprint(api_key: str) -> str:
+    """ログやファイル名に使える、APIキーを特定できない短い識別子"""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:8]
+
+
+class Endpoint:
+    """APIキーとモデルの組み合わせと、その直近の状態"""
+
+    def __init__(
+        self,
+        api_key: str,
+        model_name: str,
+        rate_limiter: Optional[RateLimiter] = None,
+        window: int = 20,
+    ):
+        self.api_key = api_key
+        self.model_name = model_name
+        self.rate_limiter = rate_limiter
+        self.name = f"{key_fingerprint(api_key)}/{model_name}"
+        self.in_flight = 0
+        self.latency: Optional[float] = None  # 成功した呼び出しの所要時間の指数移動平均
+        self.outcomes: Deque[bool] = deque(maxlen=window)
+        self.ejected_until = 0.0
+        self._clients: Optional[tuple] = None
+
+    @property
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def is_healthy(self, now: float) -> bool:
+        return now >= self.ejected_until
+
+    @staticmethod
+    def check_client_override(model: Any) -> None:
+        """モデルのクライアントをエンドポイントごとに差し替えられるかを確認
+
+        google-generativeai 0.8.x時点では、GenerativeModelにキーごとのクライアントを
+        渡す公開APIが無い（genai.configureはプロセス全体の設定）。そのため、モデルが
+        遅延生成する非公開属性_client/_async_clientを差し替えている。ライブラリの
+        更新で属性が無くなった場合に、既定のキーで黙って送信しないよう明示的に失敗させる。
+        """
+        if not (hasattr(model, "_client") and hasattr(model, "_async_client")):
+            raise RuntimeError(
+                f"{type(model).__name__} has no _client/_async_client attributes; "
+                "this google-generativeai version does not support per-key "
+                "endpoints (GEMINI_API_KEYS)"
+            )
+
+    def attach_clients(self, model: Any) -> Any:
+        """モデルがこのエンドポイントのAPIキーで通信するようにクライアントを設定"""
+        self.check_client_override(model)
+        if self._clients is None:
+            options = client_options_lib.ClientOptions(api_key=self.api_key)
+            self._clients = (
+                glm.GenerativeServiceClient(client_options=options),
+                glm.GenerativeServiceAsyncClient(client_options=options),
+            )
+        model._client, model._async_client = self._clients
+        return model
+
+
+class EndpointPool:
+    """
+    複数のAPIキー・モデルにリクエストを振り分けるプール
+
+    残りのクォータ・直近のエラー率・レイテンシ・実行中のリクエスト数からスコアを計算し、
+    最も空いているエンドポイントを選ぶ。失敗が続いたエンドポイントは一定時間切り離す。
+    """
+
+    def __init__(
+        self,
+        endpoints: List[Endpoint],
+        eject_seconds: float = 30.0,
+        error_threshold: float = 0.5,
+        min_requests: int = 5,
+    ):
+        if not endpoints:
+            raise ValueError("EndpointPool requires at least one endpoint")
+        self.endpoints = endpoints
+        self.eject_seconds = eject_seconds
+        self.error_threshold = error_threshold
+        self.min_requests = min_requests
+
+    def _score(self, endpoint: Endpoint) -> float:
+        """小さいほど優先（平均所要時間×混雑度÷残りクォータ×エラー率の補正）"""
+        latency = endpoint.latency if endpoint.latency is not None else 1.0
+        quota = 1.0
+        if endpoint.rate_limiter:
+            quota = max(0.05, endpoint.rate_limiter.remaining_ratio())
+        return (
+            latency * (1 + endpoint.in_flight) * (1 + 4 * endpoint.error_rate) / quota
+        )
+
+    def select(self) -> Endpoint:
+        """次のリクエストを送るエンドポイントを選ぶ"""
+        now = time.monotonic()
+        healthy = [e for e in self.endpoints if e.is_healthy(now)]
+        if not healthy:
+            # 全て切り離されている場合は最も早く復帰するものを使う
+            return min(self.endpoints, key=lambda e: e.ejected_until)
+        return min(healthy, key=self._score)
+
+    @staticmethod
+    def should_failover(error: BaseException) -> bool:
+        """別のエンドポイントに送り直せば成功しうるエラー（キーやクォータの問題）か"""
+        return isinstance(error, _CREDENTIAL_ERRORS + _QUOTA_ERRORS)
+
+    def report_success(self, endpoint: Endpoint, latency: float) -> None:
+        endpoint.outcomes.append(True)
+        if endpoint.latency is None:
+            endpoint.latency = latency
+        else:
+            endpoint.latency = 0.8 * endpoint.latency + 0.2 * latency
+
+    def report_failure(self, endpoint: Endpoint, error: BaseException) -> None:
+        if isinstance(error, (api_exceptions.InvalidArgument, ValueError)):
+            # リクエスト自体の問題はエンドポイントの健全性に含めない
+            return
+        endpoint.outcomes.append(False)
+
+        if isinstance(error, _CREDENTIAL_ERRORS):
+            self._eject(endpoint, self.eject_seconds * 10, error)
+        elif isinstance(error, _QUOTA_ERRORS):
+            self._eject(endpoint, get_retry_after(error) or self.eject_seconds, error)
+        elif (
+            len(endpoint.outcomes) >= self.min_requests
+            and endpoint.error_rate >= self.error_threshold
+        ):
+            self._eject(endpoint, self.eject_seconds, error)
+
+    def _eject(self, endpoint: Endpoint, seconds: float, error: BaseException) -> None:
+        endpoint.ejected_until = time.monotonic() + seconds
+        # 復帰後は新しい記録だけで判定する
+        endpoint.outcomes.clear()
+        logger.warning(
+            f"Ejecting endpoint {endpoint.name} for {seconds:.0f}s "
+            f"({type(error).__name__})"
+        )
@@ -0,0 +1,160 @@
+"""Hedged requests for cutting tail latency."""
+
+import asyncio
+import logging
+import time
+from collections import defaultdict, deque
+from typing import Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class HedgingPolicy:
+    """
+    遅い呼び出しに重複リクエストを送り、先に成功した方を採用するポリシー
+
+    ステージごとに直近の成功した呼び出しの所要時間を記録し、そのpercentile値を過ぎても
+    応答が無い場合に同じリクエストをもう一つ送る。重複リクエストの割合はmax_rate以下に抑える。
+    """
+
+    def __init__(
+        self,
+        percentile: float = 0.95,
+        max_rate: float = 0.1,
+        min_samples: int = 20,
+        window: int = 200,
+    ):
+        """
+        Args:
+            percentile (float): 重複リクエストを送るまでの待ち時間に使う所要時間の分位点
+            max_rate (float): 全呼び出しに対する重複リクエストの割合の上限
+            min_samples (int): 重複リクエストを送り始めるのに必要な記録数
+            window (int): ステージごとに保持する直近の記録数
+        """
+        self.percentile = percentile
+        self.max_rate = max_rate
+        self.min_samples = min_samples
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._samples: Dict[str, Deque[float]] = defaultdict(
+            lambda: deque(maxlen=window)
+        )
+
+    def observe(self, stage: str, seconds: float) -> None:
+        """成功した呼び出しの所要時間を記録"""
+        self._samples[stage].append(seconds)
+
+    def get_delay(self, stage: str) -> Optional[float]:
+        """重複リクエストを送るまでの秒数（記録が足りない場合はNone）"""
+        samples = self._samples[stage]
+        if len(samples) < max(1, self.min_samples):
+            return None
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile))
+        return ordered[index]
+
+    def _allows_hedge(self) -> bool:
+        return self.hedges + 1 <= self.calls * self.max_rate
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {
+            "calls": self.calls,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+        }
+
+    async def run(
+        self,
+        stage: str,
+        send: Callable[[Callable[[], None]], Awaitable[T]],
+        can_hedge: Optional[Callable[[], bool]] = None,
+    ) -> T:
+        """
+        sendを呼び出し、遅い場合は重複して呼び出して先に成功した結果を返す
+
+        sendは実行枠やクォータを確保してAPIを呼び出す直前に、渡された関数を呼ぶ。
+        重複リクエストまでの待ち時間と所要時間の記録はその時点から数えるため、
+        実行枠の待ちで重複リクエストを送ったり、待ち時間で分位点が大きくなったりしない。
+        負けた方のリクエストはキャンセルする。両方失敗した場合は後に失敗した方の例外を送出する。
+
+        Args:
+            stage (str): 所要時間を記録するステージ
+            send (Callable[[Callable[[], None]], Awaitable[T]]): リクエストを一回送る
+                コルーチン関数（引数はAPI呼び出しの開始を知らせる関数）
+            can_hedge (Optional[Callable[[], bool]]): 重複リクエストを今すぐ送れるか
+                （空いている実行枠が無い場合はFalse）
+
+        Returns:
+            T: 先に成功したリクエストの結果
+        """
+        self.calls += 1
+        starts: Dict[asyncio.Future, float] = {}
+        start_events: Dict[asyncio.Future, asyncio.Event] = {}
+
+        def launch() -> asyncio.Future:
+            event = asyncio.Event()
+
+            def mark_started() -> None:
+                starts[task] = time.monotonic()
+                event.set()
+
+            task = asyncio.ensure_future(send(mark_started))
+            start_events[task] = event
+            return task
+
+        primary = launch()
+        pending = {primary}
+
+        try:
+            delay = self.get_delay(stage)
+            if delay is not None:
+                # API呼び出しが始まるまで（実行枠・クォータの待ち）は数えない
+                started = asyncio.ensure_future(start_events[primary].wait())
+                try:
+                    await asyncio.wait(
+                        {primary, started}, return_when=asyncio.FIRST_COMPLETED
+                    )
+                finally:
+                    started.cancel()
+
+                if not primary.done():
+                    remaining = delay - (time.monotonic() - starts[primary])
+                    done, _ = await asyncio.wait(pending, timeout=max(0.0, remaining))
+                    if (
+                        not done
+                        and self._allows_hedge()
+                        and (can_hedge is None or can_hedge())
+                    ):
+                        self.hedges += 1
+                        logger.info(
+                            f"Hedging {stage} request after "
+                            f"{time.monotonic() - starts[primary]:.1f}s"
+                        )
+                        pending.add(launch())
+
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                        continue
+                    if task is not primary:
+                        self.hedge_wins += 1
+                    if task in starts:
+                        self.observe(stage, time.monotonic() - starts[task])
+                    return task.result()
+            assert error is not None
+            raise error
+
+        finally:
+            # 負けた方（または外側でキャンセルされた場合は両方）を止める
+            for task in start_events:
+                if not task.done():
+                    task.cancel()
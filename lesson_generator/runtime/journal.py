@@ -0,0 +1,138 @@
+"""Checkpoint journal for resuming interrupted lesson runs."""
+
+import hashlib
+import json
+import logging
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from ..core.models import ContentStructure, Topic
+
+logger = logging.getLogger(__name__)
+
+
+def hash_text(text: str) -> str:
+    """テキストのハッシュ値"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def journal_key(index: int, theme: Any) -> str:
+    """
+    テーマの記録に使うキー（構造情報の中の位置とタイトルのハッシュ）
+
+    同じタイトルのテーマが複数あっても、互いの記録を上書きしないようにする。
+    """
+    return f"{index:02d}-{hash_text(theme.title)[:16]}"
+
+
+class RunJournal:
+    """レッスン生成の完了済みステージを出力ディレクトリに追記形式で記録するジャーナル
+
+    1行1レコードのJSONLで、途中でプロセスが落ちても完了済みのレコードは失われない。
+    """
+
+    FILENAME = ".lesson_journal.jsonl"
+
+    def __init__(self, output_dir: str):
+        self.path = Path(output_dir) / self.FILENAME
+        self._reset_state()
+
+    def _reset_state(self) -> None:
+        self.input_hash: Optional[str] = None
+        self.structure: Optional[Dict[str, Any]] = None
+        self.topics: Dict[str, Dict[str, Any]] = {}
+        self.dialogues: Dict[str, str] = {}
+        self.outputs: Dict[str, Tuple[str, str]] = {}
+
+    def load(self) -> bool:
+        """既存のジャーナルを読み込む（存在しない場合はFalse）"""
+        self._reset_state()
+        if not self.path.exists():
+            return False
+
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # 書き込み途中で中断された最終行は無視する
+                    logger.warning(f"Skipping incomplete journal record in {self.path}")
+                    continue
+                self._apply(record)
+
+        return self.input_hash is not None
+
+    def start(self, input_hash: str) -> None:
+        """新しい実行としてジャーナルを初期化"""
+        self._reset_state()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text("", encoding="utf-8")
+        self._append({"type": "start", "input_hash": input_hash})
+
+    def resume(self, input_hash: str) -> bool:
+        """同じ入力のジャーナルがあれば再開し、無ければ新規に開始する"""
+        if self.load() and self.input_hash == input_hash:
+            logger.info(
+                f"Resuming from journal: {len(self.topics)} topics, "
+                f"{len(self.dialogues)} dialogues, {len(self.outputs)} themes completed"
+            )
+            return True
+
+        if self.input_hash is not None:
+            logger.warning("Input has changed since the journal was written")
+        self.start(input_hash)
+        return False
+
+    def record_structure(self, structure: ContentStructure) -> None:
+        self._append({"type": "structure", "data": structure.model_dump(mode="json")})
+
+    def record_topic(self, key: str, topic: Topic) -> None:
+        self._append(
+            {"type": "topic", "key": key, "data": topic.model_dump(mode="json")}
+        )
+
+    def record_dialogue(self, key: str, text: str) -> None:
+        self._append({"type": "dialogue", "key": key, "text": text})
+
+    def record_output(self, key: str, topic: str, dialogue: str) -> None:
+        """完了したテーマ（前回の出力を再利用したものを含む）のトピック/対話の出力"""
+        self._append(
+            {"type": "output", "key": key, "topic": topic, "dialogue": dialogue}
+        )
+
+    def get_structure(self) -> Optional[ContentStructure]:
+        if self.structure is None:
+            return None
+        return ContentStructure.parse_obj(self.structure)
+
+    def get_topic(self, key: str) -> Optional[Topic]:
+        data = self.topics.get(key)
+        return Topic.parse_obj(data) if data is not None else None
+
+    def get_dialogue(self, key: str) -> Optional[str]:
+        return self.dialogues.get(key)
+
+    def get_output(self, key: str) -> Optional[Tuple[str, str]]:
+        return self.outputs.get(key)
+
+    def _apply(self, record: Dict[str, Any]) -> None:
+        """レコードをメモリ上の状態に反映"""
+        record_type = record.get("type")
+        if record_type == "start":
+            self._reset_state()
+            self.input_hash = record["input_hash"]
+        elif record_type == "structure":
+            self.structure = record["data"]
+        elif record_type == "topic":
+            self.topics[record["key"]] = record["data"]
+        elif record_type == "dialogue":
+            self.dialogues[record["key"]] = record["text"]
+        elif record_type == "output":
+            self.outputs[record["key"]] = (record["topic"], record["dialogue"])
+
+    def _append(self, record: Dict[str, Any]) -> None:
+        """レコードを1行として追記し、即座にディスクへ反映"""
+        self._apply(record)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
@@ -0,0 +1,154 @@
+"""Source manifest for incremental lesson regeneration."""
+
+import hashlib
+import json
+import logging
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from ..core.models import ContentStructure
+from ..core.sections import Section
+
+logger = logging.getLogger(__name__)
+
+
+def theme_key(theme: Any) -> str:
+    """テーマの内容（タイトル・概要・関連トピック）から求めるキー"""
+    payload = theme.model_dump_json()
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LessonManifest:
+    """前回の実行で各テーマの出力がどのセクションから作られたかを記録するマニフェスト
+
+    次回の実行では、テーマ自体と元になったセクションが変わっていないテーマの
+    トピック/対話ファイルをそのまま再利用する。
+    """
+
+    FILENAME = ".lesson_manifest.json"
+
+    def __init__(self, output_dir: str):
+        self.output_dir = Path(output_dir)
+        self.path = self.output_dir / self.FILENAME
+        self.sections: Dict[str, str] = {}
+        self.structure: Optional[Dict[str, Any]] = None
+        self.themes: Dict[str, Dict[str, Any]] = {}
+        # resetの前に記録されていた出力ファイル（今回参照されなければ削除する）
+        self._previous_outputs: Set[str] = set()
+
+    @classmethod
+    def load(cls, output_dir: str) -> "LessonManifest":
+        """マニフェストを読み込む（存在しない・壊れている場合は空）"""
+        manifest = cls(output_dir)
+        if not manifest.path.exists():
+            return manifest
+
+        try:
+            data = json.loads(manifest.path.read_text(encoding="utf-8"))
+            manifest.sections = data.get("sections", {})
+            manifest.structure = data.get("structure")
+            manifest.themes = data.get("themes", {})
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable manifest {manifest.path}: {e}")
+        return manifest
+
+    def save(self) -> None:
+        data = {
+            "sections": self.sections,
+            "structure": self.structure,
+            "themes": self.themes,
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text(
+            json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8"
+        )
+
+    def get_structure(self, sections: List[Section]) -> Optional[ContentStructure]:
+        """見出し構成が前回と同じであれば前回の構造情報を返す"""
+        if self.structure is None:
+            return None
+        if list(self.sections) != [section.heading for section in sections]:
+            return None
+        return ContentStructure.parse_obj(self.structure)
+
+    def read_outputs(
+        self, theme: Any, sections: List[Section]
+    ) -> Optional[Tuple[str, str]]:
+        """テーマと元のセクションが変わっていなければ前回のトピック/対話を返す"""
+        entry = self.themes.get(theme_key(theme))
+        if entry is None:
+            return None
+
+        # 元になったセクションのいずれかが変更・削除されていれば再生成
+        current = {section.heading: section.hash for section in sections}
+        for heading, section_hash in entry["sections"].items():
+            if current.get(heading) != section_hash:
+                return None
+        # 文書全体から作ったテーマは、セクションが追加された場合も再生成
+        if entry.get("whole_document") and len(current) != len(entry["sections"]):
+            return None
+
+        try:
+            topic = (self.output_dir / entry["topic_file"]).read_text(encoding="utf-8")
+            dialogue = (self.output_dir / entry["dialogue_file"]).read_text(
+                encoding="utf-8"
+            )
+        except OSError:
+            return None
+        return topic, dialogue
+
+    def reset(self, sections: List[Section], structure: ContentStructure) -> None:
+        """今回の実行のセクション構成と構造情報を記録し、テーマの記録をクリア"""
+        self._previous_outputs |= self._output_files()
+        self.sections = {section.heading: section.hash for section in sections}
+        self.structure = structure.model_dump(mode="json")
+        self.themes = {}
+
+    def record_theme(
+        self,
+        theme: Any,
+        sections: List[Section],
+        topic_file: str,
+        dialogue_file: str,
+        whole_document: bool = False,
+    ) -> None:
+        """
+        テーマの出力ファイルと元になったセクションを記録
+
+        whole_documentは、プロンプトに文書全体（sectionsはその全セクション）を渡したか。
+        """
+        self.themes[theme_key(theme)] = {
+            "title": theme.title,
+            "sections": {section.heading: section.hash for section in sections},
+            "whole_document": whole_document,
+            "topic_file": topic_file,
+            "dialogue_file": dialogue_file,
+        }
+
+    def remove_stale_outputs(self) -> List[str]:
+        """
+        前回までに記録され、今回のテーマから参照されないトピック/対話ファイルを削除
+
+        テーマが減った場合や番号がずれた場合に古いファイルが残らないようにする。
+        マニフェストに記録されたファイルだけを対象とする。
+
+        Returns:
+            List[str]: 削除したファイル名
+        """
+        removed = []
+        for filename in sorted(self._previous_outputs - self._output_files()):
+            try:
+                (self.output_dir / filename).unlink()
+                removed.append(filename)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Failed to remove stale output {filename}: {e}")
+        self._previous_outputs = set()
+        return removed
+
+    def _output_files(self) -> Set[str]:
+        files = set()
+        for entry in self.themes.values():
+            files.update((entry["topic_file"], entry["dialogue_file"]))
+        return files
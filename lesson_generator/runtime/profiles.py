@@ -0,0 +1,103 @@
+"""Per-stage generation profiles."""
+
+from dataclasses import dataclass, replace
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional
+
+from google.ai.generativelanguage_v1beta.types import content
+
+from ..templates.prompts import (
+    CONTENT_ANALYSIS_PROMPT,
+    CONTENT_VALIDATION_PROMPT,
+    TOPIC_BATCH_EXTRACTION_PROMPT,
+    TOPIC_EXTRACTION_PROMPT,
+)
+
+# パイプラインのステージ名
+STAGE_ANALYSIS = "analysis"
+STAGE_TOPIC = "topic"
+STAGE_TOPIC_BATCH = "topic_batch"
+STAGE_DIALOGUE = "dialogue"
+STAGE_VALIDATION = "validation"
+
+
+@dataclass(frozen=True)
+class GenerationProfile:
+    """ステージごとの不変な生成設定"""
+
+    stage: str
+    generation_config: Mapping[str, Any]
+    model_name: Optional[str] = None  # Noneの場合はトランスポートの既定のモデル
+
+    @classmethod
+    def create(
+        cls,
+        stage: str,
+        base_config: Dict[str, Any],
+        response_schema: Optional[content.Schema] = None,
+        model_name: Optional[str] = None,
+    ) -> "GenerationProfile":
+        """基本設定とレスポンススキーマからプロファイルを生成"""
+        config = dict(base_config)
+        if response_schema is not None:
+            config.update(
+                {
+                    "response_schema": response_schema,
+                    "response_mime_type": "application/json",
+                }
+            )
+        return cls(
+            stage=stage,
+            generation_config=MappingProxyType(config),
+            model_name=model_name,
+        )
+
+    def with_model(self, model_name: Optional[str]) -> "GenerationProfile":
+        """同じ生成設定で別のモデルを使うプロファイル"""
+        return replace(self, model_name=model_name)
+
+    @property
+    def is_structured(self) -> bool:
+        """JSONスキーマ付きの構造化出力かどうか"""
+        return "response_schema" in self.generation_config
+
+
+def build_generation_profiles(
+    base_config: Dict[str, Any],
+    models: Optional[Mapping[str, Optional[str]]] = None,
+) -> Dict[str, GenerationProfile]:
+    """全ステージのプロファイルを生成
+
+    modelsでステージごとのモデルを指定できる（指定の無いステージは既定のモデル）。
+    トピックの一括抽出はトピック抽出と同じモデルを使う。
+    """
+    models = models or {}
+    return {
+        STAGE_ANALYSIS: GenerationProfile.create(
+            STAGE_ANALYSIS,
+            base_config,
+            CONTENT_ANALYSIS_PROMPT.response_schema,
+            models.get(STAGE_ANALYSIS),
+        ),
+        STAGE_TOPIC: GenerationProfile.create(
+            STAGE_TOPIC,
+            base_config,
+            TOPIC_EXTRACTION_PROMPT.response_schema,
+            models.get(STAGE_TOPIC),
+        ),
+        STAGE_TOPIC_BATCH: GenerationProfile.create(
+            STAGE_TOPIC_BATCH,
+            base_config,
+            TOPIC_BATCH_EXTRACTION_PROMPT.response_schema,
+            models.get(STAGE_TOPIC),
+        ),
+        STAGE_DIALOGUE: GenerationProfile.create(
+            STAGE_DIALOGUE, base_config, model_name=models.get(STAGE_DIALOGUE)
+        ),
+        STAGE_VALIDATION: GenerationProfile.create(
+            STAGE_VALIDATION,
+            base_config,
+            CONTENT_VALIDATION_PROMPT.response_schema,
+            models.get(STAGE_VALIDATION),
+        ),
+    }
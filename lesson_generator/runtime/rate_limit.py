@@ -0,0 +1,194 @@
+"""Token-bucket rate limiting for Gemini API calls."""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """一定速度で補充されるトークンバケット"""
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self.level = self.capacity
+        self.updated = time.time()
+
+    def refill(self, now: float) -> None:
+        """経過時間分のトークンを補充"""
+        elapsed = max(0.0, now - self.updated)
+        self.level = min(self.capacity, self.level + elapsed * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """指定量を消費できるようになるまでの秒数"""
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def consume(self, amount: float) -> None:
+        """トークンを消費（事後精算では負になることもある）"""
+        self.level -= amount
+
+    def get_state(self) -> Tuple[float, float]:
+        return self.level, self.updated
+
+    def set_state(self, state: Tuple[float, float]) -> None:
+        self.level, self.updated = state
+
+
+class RateLimiter:
+    """リクエスト数/分とトークン数/分を同時に制限するレートリミッター
+
+    lock_fileを指定すると、バケットの状態をファイルに保存して
+    同じファイルを使う複数プロセス間でクォータを共有する。
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        lock_file: Optional[str] = None,
+        headroom: float = 0.95,
+    ):
+        self.buckets: Dict[str, TokenBucket] = {}
+        if requests_per_minute:
+            self.buckets["requests"] = TokenBucket(requests_per_minute * headroom)
+        if tokens_per_minute:
+            self.buckets["tokens"] = TokenBucket(tokens_per_minute * headroom)
+
+        if lock_file and fcntl is None:
+            logger.warning("File locking is unavailable, using a process-local limiter")
+            lock_file = None
+        self.lock_file = lock_file
+        self._lock: Optional[asyncio.Lock] = None
+        self._lock_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def acquire(self, tokens: int = 0) -> None:
+        """1リクエスト分と推定トークン分の枠が空くまで待機して確保"""
+        cost = {"requests": 1, "tokens": tokens}
+        async with self._get_lock():
+            while True:
+                wait = await self._update(cost, reserve=True)
+                if wait <= 0:
+                    return
+                logger.debug(f"Rate limit reached, waiting {wait:.2f}s")
+                await asyncio.sleep(wait)
+
+    async def settle(self, tokens: int) -> None:
+        """呼び出し後に判明した追加トークン（出力分など）を計上"""
+        if tokens > 0 and "tokens" in self.buckets:
+            await self._update({"tokens": tokens}, reserve=False)
+
+    def remaining_ratio(self) -> float:
+        """残りのクォータの割合（最も逼迫しているバケットの値）
+
+        ロックファイルは読まないため、共有時は最後に更新した時点の状態からの推定になる。
+        """
+        now = time.time()
+        ratios = []
+        for bucket in self.buckets.values():
+            bucket.refill(now)
+            ratios.append(max(0.0, bucket.level) / bucket.capacity)
+        return min(ratios, default=1.0)
+
+    def _get_lock(self) -> asyncio.Lock:
+        """実行中のイベントループに紐づく待機用ロックを取得"""
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._lock_loop is not loop:
+            self._lock = asyncio.Lock()
+            self._lock_loop = loop
+        return self._lock
+
+    async def _update(self, cost: Dict[str, float], reserve: bool) -> float:
+        """バケットを補充し、確保できれば消費して0を、できなければ待ち秒数を返す"""
+        if self.lock_file:
+            return await asyncio.to_thread(self._update_shared, cost, reserve)
+        return self._apply(cost, reserve)
+
+    def _apply(self, cost: Dict[str, float], reserve: bool) -> float:
+        now = time.time()
+        for bucket in self.buckets.values():
+            bucket.refill(now)
+
+        if reserve:
+            wait = max(
+                (
+                    bucket.wait_time(cost.get(name, 0))
+                    for name, bucket in self.buckets.items()
+                ),
+                default=0.0,
+            )
+            if wait > 0:
+                return wait
+
+        for name, bucket in self.buckets.items():
+            bucket.consume(cost.get(name, 0))
+        return 0.0
+
+    def _update_shared(self, cost: Dict[str, float], reserve: bool) -> float:
+        """ロックファイルを排他ロックしてプロセス間で共有された状態を更新"""
+        with open(self.lock_file, "a+", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                raw = f.read()
+                if raw:
+                    try:
+                        state = json.loads(raw)
+                        for name, bucket in self.buckets.items():
+                            if name in state:
+                                bucket.set_state(tuple(state[name]))
+                    except (ValueError, TypeError):
+                        logger.warning(
+                            f"Ignoring corrupt rate limit state: {self.lock_file}"
+                        )
+
+                wait = self._apply(cost, reserve)
+
+                f.seek(0)
+                f.truncate()
+                json.dump({name: b.get_state() for name, b in self.buckets.items()}, f)
+                f.flush()
+                return wait
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+_shared_limiters: Dict[Tuple, RateLimiter] = {}
+
+
+def get_rate_limiter(
+    requests_per_minute: Optional[float] = None,
+    tokens_per_minute: Optional[float] = None,
+    lock_file: Optional[str] = None,
+    scope: Optional[str] = None,
+) -> Optional[RateLimiter]:
+    """同じ設定に対してプロセス内で共有されるレートリミッターを取得
+
+    scopeを指定すると（APIキーごとなど）別のクォータとして扱い、ロックファイルも分ける。
+    """
+    if not requests_per_minute and not tokens_per_minute:
+        return None
+
+    if lock_file:
+        lock_file = os.path.abspath(lock_file)
+        if scope:
+            lock_file = f"{lock_file}.{scope}"
+    key = (requests_per_minute, tokens_per_minute, lock_file, scope)
+    limiter = _shared_limiters.get(key)
+    if limiter is None:
+        limiter = RateLimiter(requests_per_minute, tokens_per_minute, lock_file)
+        _shared_limiters[key] = limiter
+    return limiter
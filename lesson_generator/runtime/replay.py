@@ -0,0 +1,281 @@
+"""Record and replay of Gemini API sessions."""
+
+import asyncio
+import builtins
+import gzip
+import hashlib
+import json
+import logging
+import time
+from collections import defaultdict, deque
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+
+from google.api_core import exceptions as api_exceptions
+
+from .accounting import TokenUsage
+from .context_cache import CachedContext
+from .profiles import GenerationProfile
+from .transport import GeminiTransport
+
+logger = logging.getLogger(__name__)
+
+REPLAY_RECORDED = "recorded"
+REPLAY_FAST = "fast"
+
+
+class ReplayMissError(ValueError):
+    """記録に無いリクエストが送られた場合のエラー（再試行しても解決しない）"""
+
+
+def request_key(
+    stage: str, prompt: str, context: Optional[CachedContext] = None
+) -> str:
+    """リクエストを照合するためのキー（ステージ・コンテキスト・プロンプトのハッシュ）"""
+    payload = "\0".join([stage, context.key if context else "", prompt])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _error_record(error: BaseException) -> Dict[str, str]:
+    """例外の種類（クラス名とモジュール）とメッセージ"""
+    error_class = type(error)
+    # api_coreの例外はstr()にステータスコードが付くため、元のメッセージを記録する
+    if isinstance(error, api_exceptions.GoogleAPICallError):
+        message = error.message
+    else:
+        message = str(error)
+    return {
+        "type": error_class.__name__,
+        "module": error_class.__module__,
+        "message": message,
+    }
+
+
+def _restore_error(error: Dict[str, str]) -> Exception:
+    """
+    記録された例外を再現する
+
+    google.api_core・組み込み・asyncioの例外は同じクラスで作り直し、再試行の判定などが
+    記録時と同じになるようにする。メッセージだけでは作れないクラスは、作れる最も近い
+    基底クラスにする。それ以外の例外はRuntimeErrorとする。モジュールの無い以前の記録は
+    クラス名だけで探す。
+    """
+    name = error["type"]
+    module = error.get("module")
+    if module is None:
+        candidates = [api_exceptions, builtins, asyncio]
+    elif module.startswith("google.api_core"):
+        candidates = [api_exceptions]
+    elif module == "builtins":
+        candidates = [builtins]
+    elif module.startswith("asyncio"):
+        candidates = [asyncio]
+    else:
+        candidates = []
+
+    for namespace in candidates:
+        error_class = getattr(namespace, name, None)
+        if isinstance(error_class, type) and issubclass(error_class, Exception):
+            for base in error_class.__mro__:
+                try:
+                    return base(error["message"])
+                except TypeError:
+                    continue
+    return RuntimeError(f"{name}: {error['message']}")
+
+
+class RecordingTransport(GeminiTransport):
+    """
+    API呼び出しをそのまま行い、プロンプト・応答・所要時間をgzip圧縮のJSONLに追記する
+
+    エラーになった呼び出しも例外の種類とメッセージを記録し、再生時に同じ例外を発生させる。
+    """
+
+    def __init__(self, model_name: str, log_path: str, **kwargs: Any):
+        super().__init__(model_name, **kwargs)
+        self.log_path = log_path
+
+    def _append(self, record: Dict[str, Any]) -> None:
+        # 追記ごとに独立したgzipメンバーになるため、途中で落ちても記録済みの分は読める
+        with gzip.open(self.log_path, "at", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def _record(
+        self,
+        profile: GenerationProfile,
+        prompt: str,
+        context: Optional[CachedContext],
+        started: float,
+        first_chunk: Optional[float],
+        text: Optional[str],
+        usage: Optional[TokenUsage],
+        error: Optional[BaseException] = None,
+    ) -> None:
+        record: Dict[str, Any] = {
+            "key": request_key(profile.stage, prompt, context),
+            "stage": profile.stage,
+            "model": (
+                usage.model if usage is not None and usage.model else self.model_name
+            ),
+            "prompt": prompt,
+            "latency": time.monotonic() - started,
+            "first_chunk_latency": (
+                first_chunk - started if first_chunk is not None else None
+            ),
+        }
+        if error is not None:
+            record["error"] = _error_record(error)
+        else:
+            record["response"] = text
+        if usage is not None:
+            record["usage"] = {
+                "prompt_tokens": usage.prompt_tokens,
+                "output_tokens": usage.output_tokens,
+                "estimated": usage.estimated,
+            }
+        try:
+            self._append(record)
+        except OSError as e:
+            logger.warning(f"Failed to record API call: {e}")
+
+    async def generate(
+        self,
+        prompt: str,
+        profile: GenerationProfile,
+        timeout: Optional[float] = None,
+        context: Optional[CachedContext] = None,
+        usage: Optional[TokenUsage] = None,
+    ) -> str:
+        started = time.monotonic()
+        try:
+            text = await super().generate(prompt, profile, timeout, context, usage)
+        except Exception as e:
+            self._record(profile, prompt, context, started, None, None, usage, e)
+            raise
+        self._record(profile, prompt, context, started, None, text, usage)
+        return text
+
+    async def stream(
+        self,
+        prompt: str,
+        profile: GenerationProfile,
+        timeout: Optional[float] = None,
+        context: Optional[CachedContext] = None,
+        usage: Optional[TokenUsage] = None,
+    ) -> AsyncIterator[str]:
+        started = time.monotonic()
+        first_chunk = None
+        chunks = []
+        try:
+            async for text in super().stream(prompt, profile, timeout, context, usage):
+                if first_chunk is None:
+                    first_chunk = time.monotonic()
+                chunks.append(text)
+                yield text
+        except Exception as e:
+            self._record(profile, prompt, context, started, first_chunk, None, usage, e)
+            raise
+        self._record(
+            profile, prompt, context, started, first_chunk, "".join(chunks), usage
+        )
+
+
+class ReplayTransport(GeminiTransport):
+    """
+    RecordingTransportの記録から応答を返すトランスポート（ネットワークを使わない）
+
+    同じリクエストが複数回記録されている場合（再試行など）は記録順に返す。
+    timing="recorded"の場合は記録された所要時間だけ待ってから返し、
+    "fast"の場合は待たずに返す。
+    """
+
+    def __init__(
+        self,
+        log_path: str,
+        timing: str = REPLAY_FAST,
+        speed: float = 1.0,
+        **kwargs: Any,
+    ):
+        super().__init__("replay", **kwargs)
+        self.timing = timing
+        self.speed = speed if speed > 0 else 1.0
+        self._records: Dict[str, Deque[Dict[str, Any]]] = defaultdict(deque)
+        self._load(log_path)
+
+    def _load(self, log_path: str) -> None:
+        count = 0
+        with gzip.open(log_path, "rt", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logger.warning(f"Skipping incomplete replay record in {log_path}")
+                    continue
+                self._records[record["key"]].append(record)
+                count += 1
+        logger.info(f"Loaded {count} recorded API calls from {log_path}")
+
+    def _next_record(
+        self, profile: GenerationProfile, prompt: str, context: Optional[CachedContext]
+    ) -> Dict[str, Any]:
+        queue = self._records.get(request_key(profile.stage, prompt, context))
+        if not queue:
+            raise ReplayMissError(
+                f"No recorded response for this {profile.stage} request"
+            )
+        # 最後の記録は残しておき、それ以降の同じリクエストにも同じ応答を返す
+        return queue.popleft() if len(queue) > 1 else queue[0]
+
+    async def _wait(self, seconds: Optional[float]) -> None:
+        if self.timing == REPLAY_RECORDED and seconds:
+            await asyncio.sleep(seconds / self.speed)
+
+    @staticmethod
+    def _apply(record: Dict[str, Any], usage: Optional[TokenUsage]) -> None:
+        """記録された例外を再現し、トークン数を書き込む"""
+        error = record.get("error")
+        if error:
+            raise _restore_error(error)
+
+        recorded_usage = record.get("usage")
+        if usage is not None and recorded_usage:
+            usage.prompt_tokens = recorded_usage["prompt_tokens"]
+            usage.output_tokens = recorded_usage["output_tokens"]
+            usage.estimated = recorded_usage["estimated"]
+
+    async def generate(
+        self,
+        prompt: str,
+        profile: GenerationProfile,
+        timeout: Optional[float] = None,
+        context: Optional[CachedContext] = None,
+        usage: Optional[TokenUsage] = None,
+    ) -> str:
+        record = self._next_record(profile, prompt, context)
+        await self._wait(record.get("latency"))
+        self._apply(record, usage)
+        return record["response"]
+
+    async def stream(
+        self,
+        prompt: str,
+        profile: GenerationProfile,
+        timeout: Optional[float] = None,
+        context: Optional[CachedContext] = None,
+        usage: Optional[TokenUsage] = None,
+    ) -> AsyncIterator[str]:
+        record = self._next_record(profile, prompt, context)
+        latency = record.get("latency") or 0.0
+        first_chunk = record.get("first_chunk_latency")
+        if first_chunk is None:
+            first_chunk = latency
+
+        await self._wait(first_chunk)
+        self._apply(record, usage)
+
+        # 応答を行単位の断片に分け、記録された受信時間に均等に割り振る
+        lines = record["response"].splitlines(keepends=True) or [""]
+        interval = max(0.0, latency - first_chunk) / len(lines)
+        for i, line in enumerate(lines):
+            if i:
+                await self._wait(interval)
+            yield line
@@ -0,0 +1,196 @@
+"""Content-addressed on-disk cache for LLM responses."""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from .profiles import GenerationProfile
+
+logger = logging.getLogger(__name__)
+
+
+def _serialize(value: Any) -> Any:
+    """proto-plusのメッセージ（レスポンススキーマ）などをJSON化可能な形に変換"""
+    to_json = getattr(type(value), "to_json", None)
+    if to_json is not None:
+        return json.loads(to_json(value))
+    return repr(value)
+
+
+class ResponseCache:
+    """モデル名・生成設定・スキーマ・プロンプトのハッシュをキーにした応答キャッシュ
+
+    アクセス時に更新時刻を更新し、容量超過時は最も古くアクセスされたものから削除する。
+    合計サイズは書き込み・削除のたびに差分で更新し、ディレクトリ全体の走査は起動時と
+    一定回数の書き込みごと（他のプロセスによる変更や期限切れの反映）に限る。
+    """
+
+    # 何回の書き込みごとにディレクトリ全体を走査し直すか
+    FULL_SCAN_INTERVAL = 100
+    # 容量超過時は上限のこの割合まで削除し、書き込みのたびに走査し直さないようにする
+    EVICT_TARGET_RATIO = 0.9
+
+    def __init__(
+        self,
+        cache_dir: str,
+        max_bytes: Optional[int] = None,
+        max_age_seconds: Optional[float] = None,
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self._total_bytes = 0
+        self._writes_since_scan = 0
+        self.evict()
+
+    @staticmethod
+    def make_key(
+        model_name: str,
+        profile: GenerationProfile,
+        prompt: str,
+        context_key: Optional[str] = None,
+    ) -> str:
+        """リクエスト内容からキャッシュキーを生成"""
+        payload = json.dumps(
+            {
+                "model": model_name,
+                "config": dict(profile.generation_config),
+                "prompt": prompt,
+                "context": context_key,
+            },
+            sort_keys=True,
+            ensure_ascii=False,
+            default=_serialize,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """キャッシュされた応答を取得（無い・期限切れの場合はNone）"""
+        return self.lookup([key])[1]
+
+    def lookup(self, keys: List[str]) -> Tuple[Optional[str], Optional[str]]:
+        """
+        候補のキーを順に調べ、最初に見つかった応答を取得
+
+        送信先のエンドポイントによってモデルが変わる場合など、同じリクエストに複数の
+        キーがありうる場合に使う。ヒット/ミスはキーの数に関わらず1回として数える。
+
+        Returns:
+            Tuple[Optional[str], Optional[str]]: 見つかったキーと応答（無ければ両方None）
+        """
+        for key in keys:
+            path = self._path(key)
+            try:
+                stat = path.stat()
+                if self._is_expired(stat.st_mtime):
+                    self._remove(path, stat.st_size)
+                    continue
+                with open(path, "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+                os.utime(path)  # LRU用にアクセス時刻を更新
+            except (OSError, ValueError):
+                continue
+            self.hits += 1
+            return key, entry["text"]
+
+        self.misses += 1
+        return None, None
+
+    def put(self, key: str, text: str) -> None:
+        """応答を保存し、必要に応じて古いエントリを削除"""
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        entry = {"text": text, "created": time.time()}
+
+        # 書き込み途中のファイルを読まれないよう一時ファイル経由で置き換える
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            size = self._size(Path(tmp_path))
+            replaced = self._size(path)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to write response cache entry: {e}")
+            Path(tmp_path).unlink(missing_ok=True)
+            return
+
+        self._total_bytes += size - replaced
+        self._writes_since_scan += 1
+        if self._writes_since_scan >= self.FULL_SCAN_INTERVAL or (
+            self.max_bytes is not None and self._total_bytes > self.max_bytes
+        ):
+            self.evict()
+
+    def invalidate(self, key: str) -> None:
+        """使えなかったエントリを削除し、直前の取得をミスとして数え直す"""
+        path = self._path(key)
+        self._remove(path, self._size(path))
+        self.hits -= 1
+        self.misses += 1
+
+    def evict(self) -> None:
+        """ディレクトリ全体を走査し、期限切れのエントリと容量超過分の古いエントリを削除"""
+        self._writes_since_scan = 0
+        if self.max_bytes is None and self.max_age_seconds is None:
+            return
+
+        entries = []
+        total = 0
+        for path in self.cache_dir.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            if self._is_expired(stat.st_mtime):
+                path.unlink(missing_ok=True)
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        if self.max_bytes is not None and total > self.max_bytes:
+            target = self.max_bytes * self.EVICT_TARGET_RATIO
+            for _, size, path in sorted(entries):
+                path.unlink(missing_ok=True)
+                total -= size
+                if total <= target:
+                    break
+        self._total_bytes = total
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """ヒット/ミス数"""
+        return {"hits": self.hits, "misses": self.misses}
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    @staticmethod
+    def _size(path: Path) -> int:
+        """ファイルのサイズ（無ければ0）"""
+        try:
+            return path.stat().st_size
+        except OSError:
+            return 0
+
+    def _remove(self, path: Path, size: int) -> None:
+        """エントリを削除し、合計サイズから差し引く"""
+        try:
+            path.unlink()
+        except OSError:
+            return
+        self._total_bytes -= size
+
+    def _is_expired(self, mtime: float) -> bool:
+        return (
+            self.max_age_seconds is not None
+            and time.time() - mtime > self.max_age_seconds
+        )
@@ -0,0 +1,130 @@
+"""Retry policy with error classification for Gemini API calls."""
+
+import asyncio
+import random
+import re
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from google.api_core import exceptions as api_exceptions
+from google.generativeai.types import generation_types
+
+# 再試行しても結果が変わらないエラー
+FATAL_ERRORS = (
+    api_exceptions.InvalidArgument,
+    api_exceptions.BadRequest,
+    api_exceptions.PermissionDenied,
+    api_exceptions.Forbidden,
+    api_exceptions.Unauthenticated,
+    api_exceptions.Unauthorized,
+    api_exceptions.NotFound,
+    api_exceptions.FailedPrecondition,
+    api_exceptions.MethodNotImplemented,
+    generation_types.BlockedPromptException,
+    generation_types.StopCandidateException,
+    ValueError,  # 安全性フィルタでブロックされた場合のresponse.textなど
+)
+
+# 時間を置けば成功する可能性があるエラー
+RETRYABLE_ERRORS = (
+    api_exceptions.ResourceExhausted,
+    api_exceptions.TooManyRequests,
+    api_exceptions.ServerError,
+    api_exceptions.DeadlineExceeded,
+    api_exceptions.Aborted,
+    asyncio.TimeoutError,
+    ConnectionError,
+)
+
+_RETRY_DELAY_PATTERN = re.compile(
+    r"retry(?:[ _-]?(?:in|after|delay))?\D{0,20}?(\d+(?:\.\d+)?)\s*s", re.IGNORECASE
+)
+
+
+def is_retryable(error: BaseException) -> bool:
+    """エラーが再試行に値するかどうかを判定"""
+    if isinstance(error, FATAL_ERRORS):
+        return False
+    if isinstance(error, RETRYABLE_ERRORS):
+        return True
+    # 未知のエラーは一時的な障害として扱う
+    return True
+
+
+def get_retry_after(error: BaseException) -> Optional[float]:
+    """エラーに含まれる再試行までの待ち時間のヒントを取得"""
+    # gRPCのRetryInfo
+    for detail in getattr(error, "details", None) or ():
+        retry_delay = getattr(detail, "retry_delay", None)
+        if retry_delay is not None:
+            seconds = getattr(retry_delay, "seconds", 0) + (
+                getattr(retry_delay, "nanos", 0) / 1e9
+            )
+            if seconds > 0:
+                return seconds
+
+    # HTTPのRetry-Afterヘッダー
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers:
+        value = headers.get("Retry-After") or headers.get("retry-after")
+        if value:
+            try:
+                return float(value)
+            except ValueError:
+                pass
+
+    # メッセージ中の「retry in 12s」のような表記
+    match = _RETRY_DELAY_PATTERN.search(str(error))
+    if match:
+        return float(match.group(1))
+
+    return None
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """指数バックオフとジッターによる再試行ポリシー"""
+
+    max_attempts: int = 3
+    base_delay: float = 1.0
+    max_delay: float = 60.0
+
+    def get_delay(self, attempt: int, error: Optional[BaseException] = None) -> float:
+        """attempt回目（0始まり）の失敗後に待つ秒数"""
+        hint = get_retry_after(error) if error is not None else None
+        if hint is not None:
+            # サーバーの指示を尊重し、同時に再開しないよう少しだけずらす
+            return min(self.max_delay, hint) + random.uniform(0, self.base_delay)
+
+        # Full Jitter
+        ceiling = min(self.max_delay, self.base_delay * (2**attempt))
+        return random.uniform(0, ceiling)
+
+
+class RetryBudget:
+    """レッスン単位で再試行に使える合計時間"""
+
+    def __init__(self, total_seconds: Optional[float] = None):
+        self.total_seconds = total_seconds
+        self.spent = 0.0
+
+    @property
+    def remaining(self) -> Optional[float]:
+        if self.total_seconds is None:
+            return None
+        return max(0.0, self.total_seconds - self.spent)
+
+    def allows(self, delay: float) -> bool:
+        """指定秒数の待機が予算内に収まるかどうか"""
+        remaining = self.remaining
+        return remaining is None or delay <= remaining
+
+    async def sleep(self, delay: float) -> None:
+        """待機して、実際に経過した時間を予算から差し引く"""
+        started = time.monotonic()
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            self.spent += time.monotonic() - started
@@ -0,0 +1,127 @@
+"""Stage-graph scheduler with per-stage concurrency limits."""
+
+import asyncio
+import heapq
+import itertools
+from collections import Counter
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, Iterable, List, Tuple
+
+
+@dataclass(frozen=True)
+class StageConfig:
+    """パイプラインの1ステージの実行設定"""
+
+    name: str
+    concurrency: int = 1  # 同時に実行できる数（0で無制限）
+    queue_depth: int = 0  # このステージの前で待てる数（0で無制限）
+    priority: int = 0  # 小さいほど先に枠を割り当てる
+    # 上流のステージ（このステージの待ちがqueue_depthに達すると上流の開始を止める）
+    depends_on: Tuple[str, ...] = ()
+
+
+class StageScheduler:
+    """
+    パイプラインのステージごとに仕事へ実行枠を割り当てるスケジューラー
+
+    各ステージは独自の同時実行数を持ち、待っている仕事は(ステージの優先度, キー, 到着順)の
+    順に開始する。下流のステージの待ちがqueue_depthに達している間は、上流のステージで
+    新しい仕事を始めない。max_activeを指定すると全ステージ合計の実行数も制限する。
+    depends_onはこの背圧にのみ使い、仕事ごとの実行順（上流の完了待ち）は呼び出し側が守る。
+    """
+
+    def __init__(self, stages: Iterable[StageConfig], max_active: int = 0):
+        self.stages: Dict[str, StageConfig] = {stage.name: stage for stage in stages}
+        for stage in self.stages.values():
+            for upstream in stage.depends_on:
+                if upstream not in self.stages:
+                    raise ValueError(
+                        f"Stage {stage.name} depends on unknown stage {upstream}"
+                    )
+        self.max_active = max_active
+        self._downstream: Dict[str, List[StageConfig]] = {
+            name: [s for s in self.stages.values() if name in s.depends_on]
+            for name in self.stages
+        }
+        self._active: Counter = Counter()
+        self._waiting: Counter = Counter()
+        self._queue: List[Tuple[int, int, int, str, asyncio.Future]] = []
+        self._order = itertools.count()
+
+    @property
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            name: {"active": self._active[name], "waiting": self._waiting[name]}
+            for name in self.stages
+        }
+
+    async def acquire(self, stage: str, key: int = 0) -> None:
+        """ステージの実行枠が割り当てられるまで待つ（keyが小さい仕事ほど優先）"""
+        config = self.stages[stage]
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(
+            self._queue, (config.priority, key, next(self._order), stage, future)
+        )
+        self._waiting[stage] += 1
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.cancelled():
+                self._waiting[stage] -= 1
+            else:
+                # 枠が割り当てられた直後にキャンセルされた
+                self._active[stage] -= 1
+            self._dispatch()
+            raise
+
+    def release(self, stage: str) -> None:
+        """ステージの実行枠を返す"""
+        self._active[stage] -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, stage: str, key: int = 0) -> AsyncIterator[None]:
+        await self.acquire(stage, key)
+        try:
+            yield
+        finally:
+            self.release(stage)
+
+    def _can_start(self, stage: str) -> bool:
+        config = self.stages[stage]
+        if config.concurrency and self._active[stage] >= config.concurrency:
+            return False
+        if self.max_active and sum(self._active.values()) >= self.max_active:
+            return False
+        # 下流で待っている仕事（と実行中のこのステージの仕事）が溢れないようにする
+        for downstream in self._downstream[stage]:
+            if (
+                downstream.queue_depth
+                and self._waiting[downstream.name] + self._active[stage]
+                >= downstream.queue_depth
+            ):
+                return False
+        return True
+
+    def _dispatch(self) -> None:
+        """優先順に、開始できる仕事へ実行枠を割り当てる"""
+        progressed = True
+        while progressed:
+            progressed = False
+            blocked = []
+            while self._queue:
+                item = heapq.heappop(self._queue)
+                stage, future = item[3], item[4]
+                if future.done():
+                    continue
+                if self._can_start(stage):
+                    self._active[stage] += 1
+                    self._waiting[stage] -= 1
+                    future.set_result(None)
+                    progressed = True
+                else:
+                    blocked.append(item)
+            for item in blocked:
+                heapq.heappush(self._queue, item)
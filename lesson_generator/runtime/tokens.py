@@ -0,0 +1,21 @@
+"""Local token estimation."""
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    テキストのトークン数を概算する
+
+    API呼び出し前の見積もりやオフライン時の集計に使う。
+    ASCII文字は約4文字で1トークン、それ以外（日本語など）は約1文字1トークンとして数える。
+
+    Args:
+        text (str): 対象テキスト
+
+    Returns:
+        int: 推定トークン数
+    """
+    if not text:
+        return 0
+    ascii_chars = sum(1 for c in text if ord(c) < 128)
+    other_chars = len(text) - ascii_chars
+    return max(1, ascii_chars // 4 + other_chars)
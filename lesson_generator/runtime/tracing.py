@@ -0,0 +1,162 @@
+"""Timing spans exported in the Chrome trace event format."""
+
+import contextvars
+import functools
+import inspect
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+# 現在のタスクが書き込むトラック（トレースビューアー上の行）
+_current_track: contextvars.ContextVar[int] = contextvars.ContextVar(
+    "lesson_trace_track", default=0
+)
+
+
+class Tracer:
+    """
+    パイプラインの各処理の所要時間を記録するトレーサー
+
+    Chrome trace event形式（chrome://tracing、Perfetto、speedscopeなどで表示可能）で
+    書き出す。並列に処理されるテーマは別のトラックに記録され、同じトラック内の
+    スパンは時間の包含関係で入れ子として表示される。
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.events: List[Dict[str, Any]] = []
+        self._origin = time.perf_counter()
+        self._track_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._name_track(0, "lesson")
+
+    def _now(self) -> float:
+        """トレース開始からの経過時間（マイクロ秒）"""
+        return (time.perf_counter() - self._origin) * 1e6
+
+    def _name_track(self, track: int, name: str) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self.events.append(
+                {
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": os.getpid(),
+                    "tid": track,
+                    "args": {"name": name},
+                }
+            )
+
+    @contextmanager
+    def track(self, name: str) -> Iterator[None]:
+        """このブロック内のスパンを新しいトラックに記録する（並列処理されるテーマ用）"""
+        if not self.enabled:
+            yield
+            return
+        track = next(self._track_ids)
+        self._name_track(track, name)
+        token = _current_track.set(track)
+        try:
+            yield
+        finally:
+            _current_track.reset(token)
+
+    def begin(
+        self, name: str, category: str = "pipeline", **args: Any
+    ) -> Dict[str, Any]:
+        """
+        スパンを開始し、end()に渡すイベントを返す
+
+        withブロックで囲めない範囲を計測する場合に使う。通常はspan()を使う。
+        """
+        return {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": self._now(),
+            "pid": os.getpid(),
+            "tid": _current_track.get(),
+            "args": args,
+        }
+
+    def end(self, event: Dict[str, Any], error: Optional[BaseException] = None) -> None:
+        """begin()で開始したスパンを終了して記録"""
+        if not self.enabled:
+            return
+        event["dur"] = self._now() - event["ts"]
+        if error is not None:
+            event["args"] = dict(event["args"], error=type(error).__name__)
+        with self._lock:
+            self.events.append(event)
+
+    @contextmanager
+    def span(
+        self, name: str, category: str = "pipeline", **args: Any
+    ) -> Iterator[None]:
+        """
+        ブロックの実行時間をスパンとして記録
+
+        Args:
+            name (str): スパン名
+            category (str): トレースビューアーでの分類
+            **args: スパンに添付する属性
+        """
+        if not self.enabled:
+            yield
+            return
+        event = self.begin(name, category, **args)
+        try:
+            yield
+        except BaseException as e:
+            self.end(event, e)
+            raise
+        self.end(event)
+
+    def save(self, path: str) -> None:
+        """記録したスパンをJSONファイルとして保存"""
+        if not self.enabled:
+            return
+        with self._lock:
+            events = sorted(
+                self.events, key=lambda e: (e.get("ts", -1), -e.get("dur", 0))
+            )
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"traceEvents": events, "displayTimeUnit": "ms"},
+                f,
+                ensure_ascii=False,
+            )
+
+
+def traced(name: str, category: str = "pipeline") -> Callable:
+    """
+    メソッドの実行時間をself.tracerのスパンとして記録するデコレーター
+
+    Args:
+        name (str): スパン名
+        category (str): トレースビューアーでの分類
+    """
+
+    def decorator(method: Callable) -> Callable:
+        if inspect.iscoroutinefunction(method):
+
+            @functools.wraps(method)
+            async def async_wrapper(self, *args, **kwargs):
+                with self.tracer.span(name, category):
+                    return await method(self, *args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.tracer.span(name, category):
+                return method(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
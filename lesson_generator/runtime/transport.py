@@ -0,0 +1,384 @@
+"""Async transport for Gemini API calls."""
+
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+import google.generativeai as genai
+
+from .accounting import TokenUsage
+from .context_cache import CachedContext
+from .endpoints import Endpoint, EndpointPool
+from .hedging import HedgingPolicy
+from .profiles import GenerationProfile
+from .rate_limit import RateLimiter
+from .tokens import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+
+class GeminiTransport:
+    """Gemini APIをイベントループを止めずに呼び出すトランスポート"""
+
+    def __init__(
+        self,
+        model_name: str,
+        request_timeout: Optional[float] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        max_concurrent_requests: int = 0,
+        hedging: Optional[HedgingPolicy] = None,
+        endpoints: Optional[EndpointPool] = None,
+    ):
+        self.model_name = model_name
+        self.request_timeout = request_timeout
+        self.rate_limiter = rate_limiter
+        self.max_concurrent_requests = max_concurrent_requests
+        self.hedging = hedging
+        self.endpoints = endpoints
+        self._models: Dict[Tuple[str, str, Optional[str], Optional[str]], Any] = {}
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._slots_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @asynccontextmanager
+    async def _request_slot(self) -> AsyncIterator[None]:
+        """同時に実行中のリクエスト数を上限以下に保つ"""
+        if self.max_concurrent_requests <= 0:
+            yield
+            return
+
+        loop = asyncio.get_running_loop()
+        if self._slots is None or self._slots_loop is not loop:
+            self._slots = asyncio.Semaphore(self.max_concurrent_requests)
+            self._slots_loop = loop
+        async with self._slots:
+            yield
+
+    def _has_free_slot(self) -> bool:
+        """同時実行数の上限まで、まだリクエストを送れるか"""
+        if self.max_concurrent_requests <= 0 or self._slots is None:
+            return True
+        return not self._slots.locked()
+
+    def get_model(
+        self,
+        profile: GenerationProfile,
+        context: Optional[CachedContext] = None,
+        endpoint: Optional[Endpoint] = None,
+    ) -> Any:
+        """プロファイル（とキャッシュ済みコンテキスト・エンドポイント）ごとにキャッシュされたモデルを取得
+
+        Gemini側のキャッシュはモデルに紐づくため、その場合はプロファイルのモデル指定を使わない。
+        """
+        remote = context if context is not None and context.is_remote else None
+        model_name = self.resolve_model_name(profile, endpoint)
+        key = (
+            profile.stage,
+            model_name,
+            remote.name if remote else None,
+            endpoint.name if endpoint else None,
+        )
+        model = self._models.get(key)
+        if model is None:
+            config = dict(profile.generation_config)
+            if remote:
+                model = genai.GenerativeModel.from_cached_content(
+                    remote.handle, generation_config=config
+                )
+            elif endpoint:
+                model = endpoint.attach_clients(
+                    genai.GenerativeModel(model_name, generation_config=config)
+                )
+            else:
+                model = genai.GenerativeModel(model_name, generation_config=config)
+            self._models[key] = model
+        return model
+
+    def resolve_model_name(
+        self, profile: GenerationProfile, endpoint: Optional[Endpoint] = None
+    ) -> str:
+        """ステージの指定、エンドポイント、既定の順に使うモデル名を決める"""
+        if profile.model_name:
+            return profile.model_name
+        if endpoint is not None:
+            return endpoint.model_name
+        return self.model_name
+
+    def model_names(
+        self, profile: GenerationProfile, context: Optional[CachedContext] = None
+    ) -> List[str]:
+        """この呼び出しで使われうるモデル名（送信先のエンドポイントは送信時に決まる）"""
+        if self.endpoints is None or (context is not None and context.is_remote):
+            return [self.resolve_model_name(profile)]
+        names = [
+            self.resolve_model_name(profile, endpoint)
+            for endpoint in self.endpoints.endpoints
+        ]
+        return list(dict.fromkeys(names))
+
+    def _select_endpoint(
+        self, context: Optional[CachedContext] = None
+    ) -> Optional[Endpoint]:
+        """エンドポイントのプールから送信先を選ぶ
+
+        Gemini側のキャッシュは作成したキーとモデルでしか使えないため、プールを使わない。
+        """
+        if self.endpoints is None or (context is not None and context.is_remote):
+            return None
+        return self.endpoints.select()
+
+    def _get_limiter(self, endpoint: Optional[Endpoint]) -> Optional[RateLimiter]:
+        """エンドポイント（APIキー）ごとのクォータ、無ければ共通のレートリミッター"""
+        if endpoint is not None and endpoint.rate_limiter is not None:
+            return endpoint.rate_limiter
+        return self.rate_limiter
+
+    @asynccontextmanager
+    async def _track(self, endpoint: Optional[Endpoint]) -> AsyncIterator[None]:
+        """エンドポイントの実行中のリクエスト数と結果を記録"""
+        if endpoint is None:
+            yield
+            return
+        started = time.monotonic()
+        endpoint.in_flight += 1
+        try:
+            yield
+        except Exception as e:
+            self.endpoints.report_failure(endpoint, e)
+            raise
+        finally:
+            endpoint.in_flight -= 1
+        self.endpoints.report_success(endpoint, time.monotonic() - started)
+
+    def discard_context(self, context: CachedContext) -> None:
+        """破棄したコンテキストに紐づくモデルを削除"""
+        if context.name is None:
+            return
+        for key in [key for key in self._models if key[2] == context.name]:
+            del self._models[key]
+
+    def _with_context(self, prompt: str, context: Optional[CachedContext]) -> str:
+        """ローカルのコンテキストはプロンプトの先頭に展開する"""
+        if context is not None and not context.is_remote:
+            return f"{context.text}\n\n{prompt}"
+        return prompt
+
+    async def generate(
+        self,
+        prompt: str,
+        profile: GenerationProfile,
+        timeout: Optional[float] = None,
+        context: Optional[CachedContext] = None,
+        usage: Optional[TokenUsage] = None,
+    ) -> str:
+        """
+        プロンプトを送信して生成テキストを返す
+
+        Args:
+            prompt (str): 送信するプロンプト
+            profile (GenerationProfile): この呼び出しで使うステージのプロファイル
+            timeout (Optional[float]): 呼び出し単位のタイムアウト秒数
+            context (Optional[CachedContext]): プロンプトが参照するキャッシュ済みコンテキスト
+            usage (Optional[TokenUsage]): 指定すると、この呼び出しのトークン数を書き込む
+
+        Returns:
+            str: 生成されたテキスト
+
+        Raises:
+            asyncio.TimeoutError: タイムアウトした場合
+        """
+        return await self._generate(prompt, profile, timeout, context, usage)
+
+    async def _generate(
+        self,
+        prompt: str,
+        profile: GenerationProfile,
+        timeout: Optional[float],
+        context: Optional[CachedContext],
+        usage: Optional[TokenUsage],
+        endpoint: Optional[Endpoint] = None,
+    ) -> str:
+        """generateの本体。endpointを指定すると、最初のリクエストをそのエンドポイントに送る"""
+        timeout = timeout if timeout is not None else self.request_timeout
+        prompt = self._with_context(prompt, context)
+        preferred = endpoint
+
+        # 重複リクエストもそれぞれ課金されるため、リクエストごとにトークン数を記録する
+        requests: List[TokenUsage] = []
+
+        async def send_once(
+            endpoint: Optional[Endpoint],
+            on_start: Optional[Callable[[], None]],
+            request_usage: TokenUsage,
+        ) -> Any:
+            model = self.get_model(profile, context, endpoint)
+            model_name = self.resolve_model_name(profile, endpoint)
+            limiter = self._get_limiter(endpoint)
+
+            # クォータの枠を確保してから送信する（待ち時間はタイムアウトに含めない）
+            if limiter:
+                await limiter.acquire(estimate_tokens(prompt))
+
+            async with self._request_slot(), self._track(endpoint):
+                if on_start:
+                    on_start()
+                # 失敗・中断した呼び出しでも入力トークンは計上されうるため、送信時に書き込む
+                request_usage.prompt_tokens = estimate_tokens(prompt)
+                request_usage.model = model_name
+                call = self._call(model, prompt, timeout)
+                if timeout:
+                    # wait_forはタイムアウト時に内部タスクをキャンセルし、gRPC呼び出しも中断される
+                    response = await asyncio.wait_for(call, timeout=timeout)
+                else:
+                    response = await call
+
+            if limiter:
+                await limiter.settle(estimate_tokens(response.text))
+            request_usage.output_tokens = estimate_tokens(response.text)
+            request_usage.update_from_response(response)
+            return response
+
+        async def send(
+            on_start: Optional[Callable[[], None]] = None,
+        ) -> Tuple[Any, TokenUsage]:
+            # 重複リクエストは別のエンドポイントに送られることもある
+            nonlocal preferred
+            tried = set()
+            while True:
+                if preferred is not None:
+                    endpoint, preferred = preferred, None
+                else:
+                    endpoint = self._select_endpoint(context)
+                request_usage = TokenUsage()
+                requests.append(request_usage)
+                try:
+                    response = await send_once(endpoint, on_start, request_usage)
+                    return response, request_usage
+                except Exception as e:
+                    # キーやクォータの問題は、まだ試していないエンドポイントでやり直す
+                    if endpoint is None or not self.endpoints.should_failover(e):
+                        raise
+                    tried.add(endpoint.name)
+                    if len(tried) >= len(self.endpoints.endpoints):
+                        raise
+                    logger.info(
+                        f"Failing over from endpoint {endpoint.name} "
+                        f"({type(e).__name__})"
+                    )
+
+        # 遅い呼び出しには重複リクエストを送り、先に返ってきた方を使う
+        # （実行枠が空いていない場合は、遅いリクエストの後ろに並ぶだけなので送らない）
+        winner: Optional[TokenUsage] = None
+        try:
+            if self.hedging:
+                response, winner = await self.hedging.run(
+                    profile.stage, send, can_hedge=self._has_free_slot
+                )
+            else:
+                response, winner = await send()
+        finally:
+            if usage is not None:
+                usage.merge(requests, winner)
+        return response.text
+
+    async def stream(
+        self,
+        prompt: str,
+        profile: GenerationProfile,
+        timeout: Optional[float] = None,
+        context: Optional[CachedContext] = None,
+        usage: Optional[TokenUsage] = None,
+    ) -> AsyncIterator[str]:
+        """
+        プロンプトを送信し、生成されたテキストを届いた順に返す
+
+        Args:
+            prompt (str): 送信するプロンプト
+            profile (GenerationProfile): この呼び出しで使うステージのプロファイル
+            timeout (Optional[float]): 呼び出し全体の期限となる秒数（断片の待ち時間を含む）
+            context (Optional[CachedContext]): プロンプトが参照するキャッシュ済みコンテキスト
+            usage (Optional[TokenUsage]): 指定すると、この呼び出しのトークン数を書き込む
+
+        Yields:
+            str: 生成されたテキストの断片
+        """
+        timeout = timeout if timeout is not None else self.request_timeout
+        endpoint = self._select_endpoint(context)
+        model = self.get_model(profile, context, endpoint)
+        generate_async = getattr(model, "generate_content_async", None)
+        if generate_async is None:
+            # ストリーミング非対応の場合は、選んだエンドポイントに一括で送って返す
+            yield await self._generate(
+                prompt, profile, timeout, context, usage, endpoint
+            )
+            return
+
+        prompt = self._with_context(prompt, context)
+        limiter = self._get_limiter(endpoint)
+        if limiter:
+            await limiter.acquire(estimate_tokens(prompt))
+
+        request_options = {"timeout": timeout} if timeout else None
+        loop = asyncio.get_running_loop()
+        deadline: Optional[float] = None
+
+        def remaining() -> Optional[float]:
+            """呼び出し全体の期限までの残り秒数（断片を待つ時間もこれで打ち切る）"""
+            if deadline is None:
+                return None
+            left = deadline - loop.time()
+            if left <= 0:
+                raise asyncio.TimeoutError()
+            return left
+
+        output_tokens = 0
+        if usage is not None:
+            usage.prompt_tokens = estimate_tokens(prompt)
+            usage.model = self.resolve_model_name(profile, endpoint)
+        try:
+            async with self._request_slot(), self._track(endpoint):
+                # 実行枠の空き待ちは期限に含めない
+                if timeout:
+                    deadline = loop.time() + timeout
+                response = await asyncio.wait_for(
+                    generate_async(
+                        prompt, stream=True, request_options=request_options
+                    ),
+                    timeout=remaining(),
+                )
+                iterator = response.__aiter__()
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(
+                            iterator.__anext__(), remaining()
+                        )
+                    except StopAsyncIteration:
+                        break
+                    text = chunk.text
+                    if text:
+                        output_tokens += estimate_tokens(text)
+                        if usage is not None and usage.estimated:
+                            usage.output_tokens = output_tokens
+                        yield text
+                    if usage is not None:
+                        # 最後の断片のusage_metadataに呼び出し全体の集計が入る
+                        usage.update_from_response(chunk)
+        finally:
+            if limiter:
+                await limiter.settle(output_tokens)
+
+    async def _call(self, model: Any, prompt: str, timeout: Optional[float]) -> Any:
+        """非同期APIを優先し、無い場合はエグゼキューター経由で呼び出す"""
+        request_options = {"timeout": timeout} if timeout else None
+
+        generate_async = getattr(model, "generate_content_async", None)
+        if generate_async is not None:
+            return await generate_async(prompt, request_options=request_options)
+
+        # 同期APIしか無い場合はスレッドで実行する
+        # スレッド内の呼び出し自体は中断できないため、request_optionsのタイムアウトで上限を設ける
+        logger.debug("Async API unavailable, falling back to executor")
+        return await asyncio.to_thread(
+            model.generate_content, prompt, request_options=request_options
+        )
@@ -1,15 +1,25 @@
 """Prompt templates for lesson generation."""
 
 from .prompts import (
+    CACHED_CONTENT_REFERENCE,
+    CACHED_STRUCTURE_REFERENCE,
     CONTENT_ANALYSIS_PROMPT,
     CONTENT_VALIDATION_PROMPT,
+    DIALOGUE_CONTINUATION_PROMPT,
     DIALOGUE_GENERATION_PROMPT,
+    SOURCE_CONTEXT_PROMPT,
+    TOPIC_BATCH_EXTRACTION_PROMPT,
     TOPIC_EXTRACTION_PROMPT,
 )
 
 __all__ = [
     "CONTENT_ANALYSIS_PROMPT",
     "DIALOGUE_GENERATION_PROMPT",
+    "DIALOGUE_CONTINUATION_PROMPT",
     "TOPIC_EXTRACTION_PROMPT",
+    "TOPIC_BATCH_EXTRACTION_PROMPT",
     "CONTENT_VALIDATION_PROMPT",
+    "SOURCE_CONTEXT_PROMPT",
+    "CACHED_CONTENT_REFERENCE",
+    "CACHED_STRUCTURE_REFERENCE",
 ]
@@ -3,6 +3,7 @@
 from ..core.base import PromptTemplate
 from ..core.schemas import (
     CONTENT_ANALYSIS_SCHEMA,
+    TOPIC_BATCH_SCHEMA,
     TOPIC_SCHEMA,
     VALIDATION_SCHEMA,
 )
@@ -101,6 +102,83 @@ TOPIC_EXTRACTION_PROMPT = PromptTemplate(
     response_schema=TOPIC_SCHEMA,
 )
 
+# 複数テーマのトピック一括抽出プロンプト
+TOPIC_BATCH_EXTRACTION_PROMPT = PromptTemplate(
+    template="""以下の文書から、指定された各テーマのトピックの詳細情報を抽出し、指定された形式でJSONを出力してください。
+
+# 入力文書
+{content}
+
+# 文書構造
+{structure}
+
+# 対象のテーマ
+{main_themes}
+
+以下の形式でJSONを出力してください（対象のテーマごとに1つずつ、同じ順序で）：
+
+```json
+{{
+    "topics": [
+        {{
+            "theme": "対象のテーマの名称（そのまま記載）",
+            "title": "トピックのタイトル",
+            "key_points": [
+                "重要なポイント1",
+                "重要なポイント2"
+            ],
+            "learning_objectives": [
+                {{
+                    "objective": "学習目標の説明",
+                    "success_criteria": [
+                        "達成基準1",
+                        "達成基準2"
+                    ],
+                    "evaluation_method": "評価方法"
+                }}
+            ],
+            "outline": [
+                "説明項目1",
+                "説明項目2"
+            ],
+            "estimated_time": "15分"
+        }}
+    ]
+}}
+```
+
+注意点：
+1. themeには対象のテーマの名称を一字一句変えずに記載してください
+2. タイトルは具体的で理解しやすいものにしてください
+3. 重要ポイントは5-7個程度に収めてください
+4. 各学習目標には必ず達成基準と評価方法を含めてください
+5. アウトラインは論理的な順序で構成してください
+6. 所要時間は5-30分の範囲で設定してください
+7. 各トピックはそのテーマの内容に絞り、他のテーマと重複しないようにしてください
+""",
+    required_variables=["content", "structure", "main_themes"],
+    description="複数のテーマのトピックを一度の呼び出しで抽出するためのプロンプト",
+    response_schema=TOPIC_BATCH_SCHEMA,
+)
+
+# キャッシュするソースコンテキスト（入力文書と構造情報）
+SOURCE_CONTEXT_PROMPT = PromptTemplate(
+    template="""以下は授業コンテンツ生成の元となる資料です。以降の指示で「キャッシュ済みの入力文書」「キャッシュ済みの文書構造」と書かれている場合は、この資料を参照してください。
+
+# 入力文書
+{content}
+
+# 文書構造
+{structure}
+""",
+    required_variables=["content", "structure"],
+    description="テーマごとの呼び出しで共有するためにキャッシュするコンテキスト",
+)
+
+# キャッシュ済みコンテキストを参照する際にプロンプトへ埋め込む文言
+CACHED_CONTENT_REFERENCE = "（キャッシュ済みの入力文書を参照してください）"
+CACHED_STRUCTURE_REFERENCE = "（キャッシュ済みの文書構造を参照してください）"
+
 # 対話生成プロンプト
 DIALOGUE_GENERATION_PROMPT = PromptTemplate(
     template="""以下の設定に基づいて教育的な対話を生成してください。
@@ -209,6 +287,84 @@ DIALOGUE_GENERATION_PROMPT = PromptTemplate(
     description="対話形式の教育コンテンツを生成するためのプロンプト",
 )
 
+# 対話継続プロンプト
+DIALOGUE_CONTINUATION_PROMPT = PromptTemplate(
+    template="""以下の教育的な対話の続き（第{chunk_number}部）を生成してください。
+
+# 元の文書内容
+{original_content}
+
+# トピック情報
+{topic_info}
+
+# 現在のテーマ
+{current_theme}
+
+# キャラクター設定
+教師（{teacher_name}）:
+{teacher_personality}
+
+生徒（{student_name}）:
+{student_personality}
+
+対話スタイル: {dialogue_style}
+
+# これまでの対話の要約
+これまでにカバーしたポイント:
+{covered_points}
+
+直前のやり取り:
+{recent_dialogue}
+
+# 今回扱うべきポイント
+{remaining_points}
+
+# 出力形式
+<thinking>
+これまでの流れを踏まえて、今回どのように展開するかの考察を書いてください。
+</thinking>
+
+<content>
+今回の対話で扱う具体的な内容や重要なポイントを書いてください。
+</content>
+
+<dialogue>
+直前のやり取りから自然につながるように始めてください。既に説明した内容は繰り返さないでください。
+{teacher_name}: （対話内容）
+{student_name}: （対話内容）
+...({min_exchanges}往復以上)
+</dialogue>
+
+<key_points>
+- 今回実際にカバーされた重要ポイントをリストアップしてください
+</key_points>
+
+# 注意点：
+1. **対話は少なくとも{min_exchanges}往復以上含めてください**
+2. キャラクターの個性を自然に表現してください
+3. 文書に記載のない情報は使用しないでください
+4. 今回扱うべきポイントを優先的に扱ってください
+
+まだ扱うべきポイントが残っている場合は<CONTINUE>タグ、すべて扱い終えた場合は<END>タグを付けてください。
+""",
+    required_variables=[
+        "chunk_number",
+        "original_content",
+        "topic_info",
+        "current_theme",
+        "teacher_name",
+        "teacher_personality",
+        "student_name",
+        "student_personality",
+        "dialogue_style",
+        "covered_points",
+        "recent_dialogue",
+        "remaining_points",
+        "min_exchanges",
+    ],
+    description="要約と未カバーのポイントだけを渡して対話の続きを生成するためのプロンプト",
+)
+
 # コンテンツ検証プロンプト
 CONTENT_VALIDATION_PROMPT = PromptTemplate(
     template="""以下の対話内容を検証し、結果を出力してください。
@@ -1,10 +1,11 @@
 """Lesson generator sample script."""
 
+import argparse
 import asyncio
 import logging
 import os
 
-from lesson_generator import LessonGenerator
+from lesson_generator import BatchRunner, LessonGenerator
 
 # gRPCのwarningを抑制
 os.environ["GRPC_ENABLE_FORK_SUPPORT"] = "0"
@@ -17,15 +18,11 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-async def main():
-    logger.info("Starting lesson generation process")
-
-    try:
-        # ジェネレーターの初期化
-        generator = LessonGenerator(
-            teacher_persona={
-                "name": "魔理沙",
-                "personality": """
+# ジェネレーターの設定
+GENERATOR_OPTIONS = dict(
+    teacher_persona={
+        "name": "魔理沙",
+        "personality": """
 ***ボケと知識を自在に操る解説役***
 
 * 性格:
@@ -38,10 +35,10 @@ async def main():
     * 自信に満ちた口調
     * ボケる時は大げさな表現を使用
 """,
-            },
-            student_persona={
-                "name": "霊夢",
-                "personality": """
+    },
+    student_persona={
+        "name": "霊夢",
+        "personality": """
 ***素直でツッコミ役の常識人***
 
 * 性格:
@@ -53,31 +50,81 @@ async def main():
     * 「それってどういうこと？」などの質問が多い
     * ツッコミ時は「はぁ？」などの強い口調も
 """,
-            },
-            dialogue_style="casual",
-            min_exchanges_per_chunk=5,
-            output_format="both",  # 構造化データと生の対話の両方を出力
-        )
+    },
+    dialogue_style="casual",
+    min_exchanges_per_chunk=5,
+    output_format="both",  # 構造化データと生の対話の両方を出力
+)
+
+
+async def main(args: argparse.Namespace):
+    logger.info("Starting lesson generation process")
+
+    try:
+        if args.batch:
+            await run_batch(args)
+            return
+
+        # ジェネレーターの初期化
+        generator = LessonGenerator(**GENERATOR_OPTIONS)
 
         # 授業の生成
         logger.info("Generating lesson content")
-        await generator.generate_lesson("input.md", "output")
+        await generator.generate_lesson(
+            args.input, args.output, resume=args.resume, incremental=args.incremental
+        )
 
         logger.info("Lesson generation completed successfully!")
         logger.info("Generated files:")
-        logger.info("- output/combined_lessons.md (トピックの概要)")
-        logger.info("- output/combined_dialogues.md (全対話内容)")
-        logger.info("- output/topic_*.md (個別トピックファイル)")
-        logger.info("- output/dialogue_*.md (個別対話ファイル)")
+        logger.info(f"- {args.output}/combined_lessons.md (トピックの概要)")
+        logger.info(f"- {args.output}/combined_dialogues.md (全対話内容)")
+        logger.info(f"- {args.output}/topic_*.md (個別トピックファイル)")
+        logger.info(f"- {args.output}/dialogue_*.md (個別対話ファイル)")
 
     except Exception as e:
         logger.error(f"Error during lesson generation: {e}")
         raise
 
 
+async def run_batch(args: argparse.Namespace):
+    """ディレクトリまたはマニフェストに含まれる全入力の一括生成"""
+    items = BatchRunner.collect_inputs(args.batch, args.output)
+    logger.info(f"Generating {len(items)} lessons from {args.batch}")
+
+    runner = BatchRunner(GENERATOR_OPTIONS, max_concurrent_lessons=args.concurrency)
+    summary = await runner.run(
+        items, args.output, resume=args.resume, incremental=args.incremental
+    )
+
+    logger.info(f"Summary written to {args.output}/{BatchRunner.SUMMARY_FILENAME}")
+    for failure in summary["failures"]:
+        logger.error(f"- {failure['input_file']}: {failure['error']}")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="対話形式の授業コンテンツを生成")
+    parser.add_argument("input", nargs="?", default="input.md", help="入力ファイル")
+    parser.add_argument("-o", "--output", default="output", help="出力ディレクトリ")
+    parser.add_argument(
+        "--batch",
+        metavar="DIR_OR_MANIFEST",
+        help="入力ディレクトリ（*.md）またはマニフェストを一括処理",
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=2, help="一括処理で同時に生成するレッスン数"
+    )
+    parser.add_argument("--resume", action="store_true", help="中断した生成を再開")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="前回の実行から変更の無いテーマの出力を再利用",
+    )
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        asyncio.run(main(parse_args()))
     except KeyboardInterrupt:
         logger.info("Process interrupted by user")
     except Exception as e: